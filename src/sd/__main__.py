@@ -1,92 +1,34 @@
 #!/usr/bin/env python3
 
-import typer
+import os
 import sys
 
-from sd.api import env, launchctl, macbid, macos, nix
-from sd.utils import cmd
-from sd.utils.enums import ISMAC
+from sd.utils import completion, daemon
 
-import typer.completion
-from typer._completion_shared import Shells
 
-SYSAPP = None
-if (
-    cmd.exists("nixos-rebuild")
-    or cmd.exists("darwin-rebuild")
-    or cmd.exists("home-manager")
-):
-    app = nix.app
-    SYSAPP = "nix"
-
-else:
-    app = typer.Typer(
-        add_completion=False, no_args_is_help=True
-    )  # add_completion 为 True 时表示使用默认补全
-app_completion = typer.Typer(
-    help="Generate and install completion scripts.", hidden=True
-)
-app.add_typer(app_completion, name="completion")
-
-
-@app_completion.command(
-    no_args_is_help=True,
-    help="Show completion for the specified shell, to copy or customize it.",
-)
-def show(ctx: typer.Context, shell: Shells) -> None:
-    typer.completion.show_callback(ctx, None, shell)
-
-
-@app_completion.command(
-    no_args_is_help=True, help="Install completion for the specified shell."
-)
-def install(ctx: typer.Context, shell: Shells) -> None:
-    typer.completion.install_callback(ctx, None, shell)
+def main():
+    is_completion = bool(os.getenv(completion.COMPLETE_VAR))
+    if is_completion:
+        # 补全时优先使用预先生成的命令树, 不导入 typer 也不做平台探测
+        code = completion.fast_complete()
+        if code is not None:
+            sys.exit(code)
 
+    # sd daemon 运行时直接转发, 不在当前进程中导入 typer
+    code = daemon.forward(sys.argv[1:])
+    if code is not None:
+        sys.exit(code)
 
-app.add_typer(
-    macbid.app,
-    name="bid",
-    help="Get macos App BundleID!",
-    hidden=not ISMAC,
-)
-app.add_typer(
-    env.app,
-    name="env",
-    help="save shell environment variable",
-)  #  callback=env_app_callback
+    import typer.completion
 
-app.add_typer(
-    macos.app,
-    name="darwin",
-    help="macos Commonly used shortcut commands",
-    hidden=not ISMAC,
-    no_args_is_help=True,
-)
-if SYSAPP != "nix":
-    app.add_typer(
-        nix.app,
-        name="nix",
-        help="System Configuration Management By Nix",
-        hidden=cmd.exists("nix"),
-        no_args_is_help=True,
-    )
-if cmd.exists("launchctl"):
-    app.add_typer(
-        launchctl.app,
-        name="sc",
-        help="macos launchctl services manager",
-        no_args_is_help=True,
-    )
-    app.add_typer(
-        launchctl.app,
-        name="service",
-        help="macos launchctl services manager",
-        no_args_is_help=True,
-    )
+    from sd.utils import trace
 
+    trace.from_argv(sys.argv[1:])
+    with trace.span("import sd.app"):
+        from sd.app import app
 
-def main():
+    if is_completion and completion.load_table() is None:
+        completion.save_table(app)
     typer.completion.completion_init()
     sys.exit(app())
 
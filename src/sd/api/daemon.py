@@ -0,0 +1,213 @@
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import traceback
+
+import typer
+
+from sd.utils import cmd, completion, facts, fmt, memo, trace
+from sd.utils.daemon import pid_file, read_line, runtime_dir, socket_path
+
+app = typer.Typer()
+
+# sd.api.nix 等模块在导入时根据这些环境变量计算路径, 子进程直接继承这些结果,
+# 客户端的值与 daemon 不同时让客户端在自己的进程中执行
+PATH_VARS = ["HOME", "XDG_STATE_HOME", "XDG_CACHE_HOME", "NIX_STATE_DIR"]
+
+
+def read_pid() -> int | None:
+    try:
+        with open(pid_file(), mode="r", encoding="utf-8") as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+        return pid
+    except (OSError, ValueError):
+        return None
+
+
+def warm_up():
+    "导入所有子命令模块并探测 facts, fork 出的子进程直接继承这些状态"
+    import click
+
+    from sd.app import app as sd_app
+
+    command = typer.main.get_command(sd_app)
+    ctx = click.Context(command, info_name="sd")
+    assert isinstance(command, click.Group)
+    for name in command.list_commands(ctx):
+        command.resolve_command(ctx, [name])
+    return sd_app
+
+
+def path_env() -> dict[str, str | None]:
+    return {i: os.environ.get(i) for i in PATH_VARS}
+
+
+def same_state(stamp, fingerprint, env) -> bool:
+    "当前环境下的源码, 路径和 facts 是否与 daemon 启动时一致"
+    if completion.source_stamp() != stamp or path_env() != env:
+        return False
+    facts.reset()
+    return facts.fingerprint() == fingerprint
+
+
+def _reap(signum, frame) -> None:
+    try:
+        while os.waitpid(-1, os.WNOHANG)[0] > 0:
+            pass
+    except ChildProcessError:
+        pass
+
+
+def _cleanup(signum=None, frame=None) -> None:
+    for i in [socket_path(), pid_file()]:
+        if os.path.exists(i):
+            os.remove(i)
+    if signum is not None:
+        os._exit(0)
+
+
+def _watch_client(conn: socket.socket) -> None:
+    "客户端按下 Ctrl-C 时把 SIGINT 转发给整个进程组"
+    while True:
+        try:
+            data = conn.recv(1)
+        except OSError:
+            return
+        if not data:
+            return
+        if data == b"i":
+            os.killpg(0, signal.SIGINT)
+
+
+def handle(conn: socket.socket, sd_app, stamp, fingerprint, env) -> int:
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    os.setpgid(0, 0)
+    data, fds, _, _ = socket.recv_fds(conn, 65536, 3)
+    request = json.loads(read_line(conn, data))
+    os.environ.clear()
+    os.environ.update(request["env"])
+    os.chdir(request["cwd"])
+    # daemon 启动后 PATH 中的目录内容可能已经变化, 不使用继承的命令查找缓存
+    cmd.rehash()
+    if len(fds) != 3 or not same_state(stamp, fingerprint, env):
+        conn.sendall(b"fallback\n")
+        return 0
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    sys.stdin = open(0, mode="r", closefd=False)
+    sys.stdout = open(1, mode="w", buffering=1, closefd=False)
+    sys.stderr = open(2, mode="w", buffering=1, closefd=False)
+    threading.Thread(target=_watch_client, args=(conn,), daemon=True).start()
+    trace.from_argv(request["argv"])
+    code = 0
+    try:
+        sd_app(args=request["argv"], prog_name="sd")
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            code = e.code
+        elif e.code is not None:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except KeyboardInterrupt:
+        code = 130
+    except Exception:
+        traceback.print_exc()
+        code = 1
+    # 子进程通过 os._exit 退出, 不会执行 atexit 注册的函数
+    memo.flush()
+    if trace.is_enabled():
+        trace.report()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    conn.sendall(f"exit {code}\n".encode())
+    return code
+
+
+def serve() -> None:
+    sd_app = warm_up()
+    stamp = completion.source_stamp()
+    fingerprint = facts.fingerprint()
+    env = path_env()
+    os.makedirs(runtime_dir(), mode=0o700, exist_ok=True)
+    _cleanup()
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    listener.bind(socket_path())
+    os.umask(old_umask)
+    listener.listen(16)
+    with open(pid_file(), mode="w", encoding="utf-8") as f:
+        f.write(str(os.getpid()))
+    signal.signal(signal.SIGCHLD, _reap)
+    signal.signal(signal.SIGTERM, _cleanup)
+    signal.signal(signal.SIGINT, _cleanup)
+    while True:
+        conn, _ = listener.accept()
+        if completion.source_stamp() != stamp:
+            # sd 已经升级, 让客户端在自己的进程中执行, 然后退出
+            conn.sendall(b"fallback\n")
+            conn.close()
+            _cleanup(signal.SIGTERM)
+        if os.fork() == 0:
+            listener.close()
+            try:
+                code = handle(conn, sd_app, stamp, fingerprint, env)
+            except Exception:
+                code = 1
+            os._exit(code)
+        conn.close()
+
+
+@app.command(help="start the daemon in the background")
+def start(
+    foreground: bool = typer.Option(
+        False, "--foreground", "-f", help="Run in the foreground"
+    ),
+):
+    pid = read_pid()
+    if pid:
+        fmt.info(f"sd daemon is already running, PID: {pid}")
+        return
+    if foreground:
+        serve()
+        return
+    if os.fork() != 0:
+        fmt.success(f"sd daemon started, socket: {socket_path()}")
+        return
+    os.setsid()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for i in [0, 1, 2]:
+        os.dup2(devnull, i)
+    try:
+        serve()
+    finally:
+        os._exit(0)
+
+
+@app.command(help="stop the daemon")
+def stop():
+    pid = read_pid()
+    if pid is None:
+        fmt.warn("sd daemon is not running")
+        return
+    os.kill(pid, signal.SIGTERM)
+    fmt.success(f"sd daemon stopped, PID: {pid}")
+
+
+@app.command(help="show whether the daemon is running")
+def status():
+    pid = read_pid()
+    if pid is None:
+        fmt.warn("sd daemon is not running")
+    else:
+        fmt.info(f"sd daemon is running, PID: {pid}, socket: {socket_path()}")
+
+
+if __name__ == "__main__":
+    app()
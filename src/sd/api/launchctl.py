@@ -15,8 +15,7 @@ def _get_uid() -> str:
 
 @lru_cache(maxsize=1)
 def _get_all_services() -> list[str]:
-    result = cmd.getout("launchctl list")
-    return result.split("\n")
+    return list(cmd.stream(["launchctl", "list"]))
 
 
 # @see https://github.com/andrewp-as-is/launchctl.py/raw/master/launchctl/__init__.py
@@ -65,6 +64,12 @@ def get_service_path(name: str) -> str:
         return name
 
 
+def _warn_failed(results: list[cmd.Result | None]) -> None:
+    for i in results:
+        if i is not None and i.returncode != 0:
+            fmt.warn(f"{' '.join(i.args)} exited with {i.returncode}")
+
+
 @app.command(help="restart <org.nixos.xxx> service")
 def restart(
     service_name: str = typer.Argument("", help="service name"),
@@ -80,11 +85,14 @@ def restart(
         )
     elif all_service:
         uid = _get_uid()
-        for i in get_all_service():
-            cmd.run(
-                ["launchctl", "kickstart", "-k", f"gui/{uid}/org.nixos.{i}"],
-                dry_run=dry_run,
-            )
+        results = cmd.run_many(
+            [
+                ["launchctl", "kickstart", "-k", f"gui/{uid}/org.nixos.{i}"]
+                for i in get_all_service()
+            ],
+            dry_run=dry_run,
+        )
+        _warn_failed(results)
     else:
         raise typer.Abort()
 
@@ -101,8 +109,11 @@ def start(
     if name:
         cmd.run(["launchctl", "start", name], dry_run=dry_run)
     elif fail_services:
-        for i in get_all_failed_service():
-            cmd.run(["launchctl", "start", i], dry_run=dry_run)
+        results = cmd.run_many(
+            [["launchctl", "start", i] for i in get_all_failed_service()],
+            dry_run=dry_run,
+        )
+        _warn_failed(results)
     else:
         raise typer.Abort()
 
@@ -176,11 +187,9 @@ def status(
 ):
     name = get_service(name) if name else ""
     if name:
-        result = cmd.getout(f"launchctl list {name}")
-
         out: dict = {}
         key: str = ""
-        for line in result.splitlines():
+        for line in cmd.stream(["launchctl", "list", name]):
             if '" =' in line:
                 key = line.split('"')[1]
                 if ";" in line:
@@ -197,8 +206,9 @@ def status(
             fmt.term_fmt_by_dict(out, use_num=False)
 
     else:
-        result = cmd.getout("launchctl list | grep org.nixos")
-        all_service_status = [i.split() for i in result.splitlines()]
+        all_service_status = [
+            i.split() for i in cmd.stream(["launchctl", "list"]) if "org.nixos" in i
+        ]
         max_pid = fmt.max_size([i[0] for i in all_service_status])
         max_code_status = fmt.max_size([i[1] for i in all_service_status])
         max_service_name = fmt.max_size([i[2] for i in all_service_status])
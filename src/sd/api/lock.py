@@ -0,0 +1,120 @@
+import os
+from dataclasses import dataclass, field
+from typing import List
+
+import typer
+
+from sd.utils import facts, flakelock, fmt
+from sd.utils.enums import Dotfiles
+from sd.utils.flakelock import FlakeLock, Node
+
+app = typer.Typer()
+
+# 每一个不同的 nixpkgs 节点都会被单独求值, 这些 input 应当 follows 根 flake 的版本
+AUDIT_REPOS = ["nixpkgs", "home-manager", "flake-utils"]
+
+
+@dataclass
+class Duplicate:
+    "某个根 input 自带的重复节点, 以及消除它们需要添加的 follows"
+
+    root_input: str
+    nodes: List[str] = field(default_factory=list)
+    follows: List[str] = field(default_factory=list)
+
+
+def default_flake_path() -> str:
+    if os.path.isfile("flake.lock"):
+        return os.getcwd()
+    dotfiles = facts.get("dotfiles", lambda: Dotfiles().value)
+    return dotfiles if dotfiles else os.getcwd()
+
+
+def repo_of(node: Node) -> str | None:
+    "节点所属的仓库名称, 优先使用 original, 其次 locked"
+    for attrs in [node.original, node.locked]:
+        if "repo" in attrs:
+            return attrs["repo"]
+        if "id" in attrs:
+            return attrs["id"]
+        url = attrs.get("url")
+        if url:
+            return url.rstrip("/").removesuffix(".git").rsplit("/", 1)[-1]
+    return None
+
+
+def choose_target(lock: FlakeLock, node: Node, candidates: List[str]) -> str:
+    "在根 flake 的同类 input 中选择分支相同的一个, 否则使用同名或第一个"
+    roots = lock.inputs()
+    for i in candidates:
+        if lock.nodes[roots[i]].original_ref == node.original_ref:
+            return i
+    return next((i for i in candidates if i == repo_of(node)), candidates[0])
+
+
+def follows_line(input_path: List[str], name: str, target: str) -> str:
+    prefix = "".join(f"inputs.{i}." for i in input_path)
+    return f'{prefix}inputs.{name}.follows = "{target}";'
+
+
+def audit_lock(lock: FlakeLock, repos: List[str] = AUDIT_REPOS) -> List[Duplicate]:
+    """找出没有 follows 根 flake 的 nixpkgs/home-manager/flake-utils 节点
+
+    按根 input 分组, 引入重复节点越多的排在越前面.
+    """
+    root_nodes = lock.inputs()
+    root_keys = set(root_nodes.values())
+    candidates: dict[str, List[str]] = {}
+    for name, key in root_nodes.items():
+        repo = repo_of(lock.nodes[key])
+        if repo in repos:
+            candidates.setdefault(repo, []).append(name)
+    paths = {key: input_path for input_path, key in lock.walk()}
+    result: dict[str, Duplicate] = {}
+    for parent, input_path in paths.items():
+        for name, ref in lock.nodes[parent].inputs.items():
+            if isinstance(ref, list):
+                continue
+            target = lock.resolve(ref)
+            repo = repo_of(lock.nodes[target])
+            if target in root_keys or repo not in candidates:
+                continue
+            duplicate = result.setdefault(input_path[0], Duplicate(input_path[0]))
+            if target not in duplicate.nodes:
+                duplicate.nodes.append(target)
+            follows = choose_target(lock, lock.nodes[target], candidates[repo])
+            duplicate.follows.append(follows_line(input_path, name, follows))
+    return sorted(result.values(), key=lambda i: len(i.nodes), reverse=True)
+
+
+@app.command(help="find inputs that pin their own nixpkgs instead of following root")
+def audit(
+    flake_path: str = typer.Argument(
+        "", help="the flake directory, defaults to the current directory or DOTFILES"
+    ),
+):
+    flake_path = flake_path or default_flake_path()
+    try:
+        lock = flakelock.load(flake_path)
+        duplicates = audit_lock(lock)
+    except flakelock.FlakeLockError as e:
+        fmt.error(f"Failed to read {flakelock.lock_file(flake_path)}: {e}")
+        raise typer.Exit(1)
+    if not duplicates:
+        fmt.success(f"No duplicate {', '.join(AUDIT_REPOS)} found in flake.lock")
+        return
+    total = len({j for i in duplicates for j in i.nodes})
+    fmt.warn(f"{total} duplicate instances will be evaluated separately")
+    for i in duplicates:
+        fmt.info(f"{i.root_input} adds {len(i.nodes)}: {', '.join(i.nodes)}")
+        for line in i.follows:
+            fmt.echo(f"  {line}")
+
+
+@app.callback()
+def callback():
+    "inspect the flake.lock of the configuration"
+
+
+if __name__ == "__main__":
+    app()
@@ -1,9 +1,12 @@
 import os
 from pathlib import Path
 from subprocess import SubprocessError
+from typing import List
+
 import typer
 from sd.utils import cmd, fmt, path
 from sd.utils.fmt import term_fmt_by_dict
+from sd.utils.memo import Memo
 from sd.utils.path import PathLink
 
 app = typer.Typer()
@@ -41,8 +44,17 @@ def get_app_list_by_list(paths: list[str | Path]) -> dict[str, str]:
     return {k: v for i in app_lists for k, v in i.items()}
 
 
+def mdls_cmd(p: PathLink) -> List[str]:
+    return ["mdls", "-name", "kMDItemCFBundleIdentifier", "-r", str(p)]
+
+
+def mdls_memo(p: PathLink) -> Memo:
+    "App 被替换或更新后其目录的 inode/mtime 会变化, 缓存随之失效"
+    return Memo(ttl=7 * 86400, files=(str(p),))
+
+
 def get_app_bundleid_by_appname(app_name: str) -> str:
-    return cmd.getout(f"osascript -e 'id of app \"{app_name}\"'")
+    return cmd.getout(f"osascript -e 'id of app \"{app_name}\"'", cache=Memo(ttl=86400))
 
 
 def get_app_bundleid_by_info(f: PathLink) -> str | None:
@@ -59,11 +71,19 @@ def get_app_bundleid_by_info(f: PathLink) -> str | None:
     return None
 
 
-def get_app_bundleid_by_path(p: PathLink) -> str:
-    "获取 路径的 bundle ip， 该路径必须是app程序"
-    bundleid = cmd.getout(f"mdls -name kMDItemCFBundleIdentifier -r '{p}'")
-    run_result = cmd.run(f"file {p} | grep 'MacOS Alias file' >/dev/null")
-    if bundleid == "(null)" and run_result and run_result.returncode == 0:
+def get_app_bundleid_by_path(p: PathLink, bundleid: str | None = None) -> str:
+    """获取 路径的 bundle ip， 该路径必须是app程序
+
+    bundleid 为已经通过 mdls 查询到的结果, 为空时在此查询
+    """
+    if bundleid is None:
+        bundleid = cmd.getout(mdls_cmd(p), cache=mdls_memo(p))
+    run_result = (
+        cmd.sh(f"file '{p}' | grep 'MacOS Alias file' >/dev/null")
+        if bundleid == "(null)"
+        else None
+    )
+    if run_result and run_result.returncode == 0:
         try:
             from sd.api.macos import alias
 
@@ -71,9 +91,7 @@ def get_app_bundleid_by_path(p: PathLink) -> str:
             p_alias = alias(p_str, None)
             # mdls -name 不支持 /nix/store/ 下文件
             if p_alias and not p_alias.startswith("/nix/store"):
-                bundleid = cmd.getout(
-                    f"mdls -name kMDItemCFBundleIdentifier -r '{p_alias}'"
-                )
+                bundleid = cmd.getout(mdls_cmd(p_alias), cache=mdls_memo(p_alias))
         except (ModuleNotFoundError, SubprocessError) as e:
             bundleid = "(null)"
             fmt.error(str(e))
@@ -100,7 +118,20 @@ def display():
 @app.command(help="Display all app BundleId")
 def db():
     app_lists = get_app_list_by_list(APP_PATH)
-    app_dict = {i: get_app_bundleid_by_path(app_lists[i]) for i in app_lists}
+    bundleids = {i: mdls_memo(p).get(mdls_cmd(p)) for i, p in app_lists.items()}
+    # 先并发查询所有未缓存 App 的 mdls 结果, 只有查询失败的 App 才逐个回退
+    missing = [i for i, bundleid in bundleids.items() if bundleid is None]
+    results = cmd.run_many(
+        [mdls_cmd(app_lists[i]) for i in missing], capture_output=True
+    )
+    for name, result in zip(missing, results):
+        if result and result.returncode == 0 and result.stdout:
+            bundleids[name] = result.stdout.decode().strip()
+            mdls_memo(app_lists[name]).set(mdls_cmd(app_lists[name]), bundleids[name])
+    app_dict = {
+        name: get_app_bundleid_by_path(app_path, bundleids[name])
+        for name, app_path in app_lists.items()
+    }
     term_fmt_by_dict(dict(sorted(app_dict.items(), key=lambda x: x[0])))
 
 
@@ -3,7 +3,8 @@ import getpass
 import json
 import os
 import re
-from dataclasses import dataclass
+import shutil
+import time
 from datetime import datetime
 from functools import wraps
 from pathlib import Path
@@ -12,7 +13,21 @@ from typing import List
 
 import typer
 import typer.completion
-from sd.utils import cmd, fmt, path
+from sd.utils import (
+    artifacts,
+    closure,
+    cmd,
+    facts,
+    fingerprint,
+    flakelock,
+    fmt,
+    gcplan,
+    generations,
+    history,
+    nixlog,
+    path,
+    trace,
+)
 from sd.utils.enums import (
     ISMAC,
     REMOTE_FLAKE,
@@ -21,11 +36,14 @@ from sd.utils.enums import (
     Dotfiles,
     FlakeOutputs,
 )
+from sd.utils.generations import Generation
+from sd.utils.memo import Memo
+from sd.utils.retention import Policy
 from typer._completion_shared import Shells
 
-DOTFILES = Dotfiles().value
+DOTFILES = facts.get("dotfiles", lambda: Dotfiles().value)
 NIX_PROFILES = (
-    Path(os.environ.get("NIX_STATE_HOME", "/nix/var/nix"))
+    Path(os.environ.get("NIX_STATE_DIR", "/nix/var/nix"))
     .expanduser()
     .joinpath("profiles")
 )
@@ -88,31 +106,39 @@ def get_flake(current_dir: bool = False) -> str:
         return REMOTE_FLAKE
 
 
+def get_flake_lock(flake_path: Path | None | str = None) -> flakelock.FlakeLock:
+    try:
+        return flakelock.load(flake_path)
+    except flakelock.FlakeLockError as e:
+        fmt.error(f"Failed to read data from {flakelock.lock_file(flake_path)}: {e}")
+        raise typer.Abort()
+
+
+def is_updatable_input(lock: flakelock.FlakeLock, input_path: str) -> bool:
+    "嵌套的 input 路径 (例如 home-manager/nixpkgs) 存在且不是 follows 时才能单独更新"
+    names = input_path.split("/")
+    try:
+        parent = lock.resolve(names[:-1])
+    except flakelock.FlakeLockError:
+        return False
+    return names[-1] in lock.nodes[parent].inputs and not lock.follows(
+        parent, names[-1]
+    )
+
+
 def get_flake_inputs_by_lock(flake_path: Path | None | str = None) -> list[str]:
-    flake_path = os.getcwd() if flake_path is None else flake_path
-    flake_lock = os.path.join(os.path.realpath(flake_path), "flake.lock")
-    data_json = path.json_read(flake_lock)
-    if data_json:
-        try:
-            nodes: dict = data_json.get("nodes", {})
-            root: dict = nodes.get("root", {})
-            inputs: dict = root.get("inputs", {})
-            return list(inputs.keys())
-        except (KeyError, AttributeError) as er:
-            raise er
-    fmt.error(f"Failed to read data from {flake_lock} file")
-    raise typer.Abort()
+    return get_flake_lock(flake_path).root_inputs()
 
 
 def get_flake_inputs_by_nix(flake_path: Path | None | str = None):
     flake_path = os.getcwd() if flake_path is None else flake_path
     if path.is_file(os.path.join(os.path.realpath(flake_path), "flake.lock")):
-        flake_json_text = cmd.getout(
+        flake_json_lines = cmd.stream(
             f"""nix eval --raw --impure --expr 'builtins.toJSON (builtins.getFlake "{flake_path}").inputs'"""
         )
         flake_json_list = []
         is_json_start = False
-        for i in flake_json_text.splitlines():
+        for i in flake_json_lines:
             if is_json_start:
                 flake_json_list.append(i)
             if "{" in i:
@@ -143,8 +169,8 @@ def get_default_host():
     return f"{user_name}@{SYSTEM_ARCH}-{SYSTEM_OS}"
 
 
-PLATFORM = get_flake_platform()
-DEFAULT_HOST = get_default_host()
+PLATFORM = FlakeOutputs(facts.get("platform", lambda: get_flake_platform().value))
+DEFAULT_HOST = facts.get("default_host", get_default_host)
 
 
 def change_workdir(func):
@@ -169,13 +195,6 @@ def change_workdir(func):
 
 
 ### * display nix diff ------------------------------------
-@dataclass
-class Generation:
-    version: int
-    path: Path
-    created_at: datetime
-
-
 def get_hm_profiles_root() -> Path:
     # A copy of https://github.com/nix-community/home-manager/blob/f1490b8/home-manager/home-manager#L119-L140
     global_nix_profiles_dir = NIX_PROFILES.joinpath(getpass.getuser())
@@ -196,47 +215,20 @@ def get_re_compile(use_home: bool):
     )
 
 
-def get_generations(use_home: bool) -> List[Generation]:
-    profile_regex = get_re_compile(use_home)
-    path = get_hm_profiles_root() if use_home else NIX_PROFILES
-    generation_list = []
-    for entry in path.iterdir():
-        result = profile_regex.search(str(entry))
-        if result:
-            version_number = int(result.groupdict()["number"])
-            real_path = entry.resolve()
-            created_at = datetime.fromtimestamp(os.path.getctime(real_path))
-
-            generation = Generation(
-                version=version_number, path=real_path, created_at=created_at
-            )
+def get_generation_index(use_home: bool) -> generations.GenerationIndex:
+    if use_home:
+        return generations.index(
+            get_hm_profiles_root(), "home-manager", get_re_compile(use_home)
+        )
+    return generations.index(NIX_PROFILES, "system", get_re_compile(use_home))
 
-            generation_list.append(generation)
-    generation_list = sorted(generation_list, key=lambda g: g.version, reverse=True)
 
-    return generation_list
+def get_generations(use_home: bool) -> List[Generation]:
+    return list(get_generation_index(use_home))
 
 
 def get_current_generation(use_home: bool) -> Generation | None:
-    if use_home:
-        path = get_hm_profiles_root()
-        base_name = "home-manager"
-    else:
-        path = NIX_PROFILES
-        base_name = "system"
-    profile_regex = get_re_compile(use_home)
-    if not path.joinpath(base_name).exists():
-        return None
-    current_dir = str(path.joinpath(base_name).readlink())
-    if current_dir:
-        result = profile_regex.search(current_dir)
-        if result:
-            version_number = int(result.groupdict()["number"])
-            real_path = path.joinpath(current_dir)
-            created_at = datetime.fromtimestamp(os.path.getctime(real_path))
-            return Generation(
-                version=version_number, path=real_path, created_at=created_at
-            )
+    return get_generation_index(use_home).current()
 
 
 def format_generation(generation: Generation) -> str:
@@ -244,46 +236,78 @@ def format_generation(generation: Generation) -> str:
     return f"create time: {generation.created_at.strftime(format)}, version: {generation.version}"
 
 
+def print_closure_diff(result: closure.ClosureDiff) -> None:
+    if result.changed:
+        fmt.info("Version changes:")
+        for pname, (old, new) in result.changed.items():
+            fmt.echo(f"  [C] {pname}: {', '.join(old)} -> {', '.join(new)}")
+    if result.added:
+        fmt.info("Added packages:")
+        for pname, versions in result.added.items():
+            fmt.echo(f"  [A] {pname}: {', '.join(versions)}")
+    if result.removed:
+        fmt.info("Removed packages:")
+        for pname, versions in result.removed.items():
+            fmt.echo(f"  [R] {pname}: {', '.join(versions)}")
+    if not (result.changed or result.added or result.removed):
+        fmt.info("No version or package changes.")
+    fmt.info(
+        f"Closure size: {result.paths_before} -> {result.paths_after} paths, "
+        f"{fmt.human_size(result.size_before)} -> {fmt.human_size(result.size_after)} "
+        f"({fmt.human_size(result.size_delta, sign=True)})"
+    )
+
+
+@trace.span("nix_diff")
 def nix_diff(use_home: bool, dry_run: bool, old_generation: Generation | None = None):
-    use_dix = 0
-    if cmd.exists("dix"):
-        use_dix = 1
-    elif cmd.exists("nvd"):
-        use_dix = 2
-    else:
-        return
     if old_generation:
         generation_first = old_generation
         generation_second = get_current_generation(use_home)
         if generation_second is None:
             return
     else:
-        generations = get_generations(use_home)
-        if generations is None or len(generations) < 2:
+        index = get_generation_index(use_home)
+        newest, older = index.nth(0), index.nth(1)
+        if newest is None or older is None:
             fmt.info("No previous data available")
             return
         else:
-            generation_first = generations[1]
-            generation_second = generations[0]
+            generation_first = older
+            generation_second = newest
     fmt.info(
         f"Previous build creation information {format_generation(generation_first)}"
     )
     fmt.info(f"Current build information {format_generation(generation_second)}")
-    if use_dix == 1:
-        cmd.run(
-            ["dix", str(generation_first.path), str(generation_second.path)],
-            dry_run=dry_run,
-        )
-    else:
-        cmd.run(
-            ["nvd", "diff", str(generation_first.path), str(generation_second.path)],
-            dry_run=dry_run,
-        )
+    if dry_run:
+        fmt.info(f"> diff {generation_first.path} {generation_second.path}")
+        return
+    try:
+        result = closure.diff(str(generation_first.path), str(generation_second.path))
+    except (SubprocessError, ValueError, OSError) as e:
+        fmt.warn(f"Failed to query the closures: {e}")
+        return
+    print_closure_diff(result)
 
 
 ### -----  end: display nix diff ------------------------------------
 
 
+def store_free_space() -> int | None:
+    try:
+        return shutil.disk_usage("/nix/store").free
+    except OSError:
+        return None
+
+
+def protected_store_paths() -> List[str]:
+    "正在运行和启动时使用的系统配置, 无论保留策略如何都不删除"
+    return [
+        os.path.realpath(i)
+        for i in ["/run/current-system", "/run/booted-system"]
+        if os.path.exists(i)
+    ]
+
+
 class Gc:
     def __init__(
         self,
@@ -291,23 +315,23 @@ class Gc:
         re_pattern: str = r"(.*)-(\d+)-link$",
         save_num: int = 1,
         default: str = "default",
+        policy: Policy | None = None,
     ):
         self.dry_run = dry_run
         self.re_pattern = re.compile(re_pattern)
         self.save_num = save_num
-        self.clear_list = []
+        self.policy = policy or Policy(keep_last=save_num)
         self.profiles = [
             i
-            for i in [
-                NIX_PROFILES,
-                NIX_USER_PROFILES,
-            ]
+            for i in dict.fromkeys(
+                [NIX_PROFILES, NIX_USER_PROFILES, get_hm_profiles_root()]
+            )
             if i.is_dir()
         ]
         self.gc_autos = [
             i
             for i in [
-                Path(os.environ.get("NIX_STATE_HOME", "/nix/var/nix"))
+                Path(os.environ.get("NIX_STATE_DIR", "/nix/var/nix"))
                 .expanduser()
                 .joinpath("gcroots", "auto")
             ]
@@ -315,75 +339,58 @@ class Gc:
         ]
         self.default = default
 
-    def remove_from_link_list(self):
-        if self.clear_list:
-            if self.dry_run:
-                cdir = os.getcwd()
-                fmt.info(f"The following files will be deleted{cdir} ..")
-                for i in self.clear_list:
-                    fmt.info(f"delete: {os.path.join(cdir, i)}")
-                # print(*self.clear_list, sep="\n")
-            else:
-                for i in self.clear_list:
-                    path.remove_file_or_link(i)
-        else:
+    def plan(self) -> gcplan.Plan:
+        "扫描 gcroots/auto 和 profiles, 生成需要删除的链接列表, 不修改任何文件"
+        return gcplan.build(
+            [i.as_posix() for i in self.gc_autos],
+            [i.as_posix() for i in self.profiles],
+            self.policy,
+            self.re_pattern.pattern,
+            protected_store_paths(),
+        )
+
+    def plan_free(self, target: int) -> gcplan.Plan:
+        "从最旧的 root 开始选择, 直到估计释放的空间达到 target 字节"
+        return gcplan.build_free(
+            [i.as_posix() for i in self.gc_autos],
+            [i.as_posix() for i in self.profiles],
+            target,
+            self.save_num,
+            self.re_pattern.pattern,
+            protected_store_paths(),
+        )
+
+    def show_plan(self, plan: gcplan.Plan):
+        if not plan.delete:
             fmt.info("Not File will be deleted...")
+            return
+        fmt.info(f"Retention policy: {plan.policy}")
+        fmt.info(f"The following files will be deleted ({plan.scanned} scanned) ..")
+        for i in plan.delete:
+            size = f", ~{fmt.human_size(i.size)}" if plan.target else ""
+            fmt.info(f"delete: {i.path} ({i.reason}{size})")
+        if plan.target:
+            fmt.info(
+                f"Estimated to free {fmt.human_size(plan.estimated)}"
+                f" of {fmt.human_size(plan.target)}"
+            )
 
-    @change_workdir
-    def gc_auto(self, profile: Path):
-        store = {}
-        self.clear_list = []
-        for i in os.listdir():
-            if path.is_link(i):
-                target_path = path.readlink(i)
-                if not path.is_exist(target_path):
-                    self.clear_list.append(i)
-                    continue
-            f_prefix_num = self.re_pattern.match(target_path.name)
-            if not f_prefix_num:
-                store[target_path] = [(i, 1)]
-                continue
-            f_prefix = f_prefix_num.group(1)
-            num = int(f_prefix_num.group(2))
-            if f_prefix not in store:
-                store[f_prefix] = [(i, num)]
-            else:
-                store[f_prefix].append((i, num))
-        for i in store:
-            store[i] = sorted(store[i], key=lambda k: k[-1], reverse=True)
-            for cpath in store[i][self.save_num :]:
-                self.clear_list.append(cpath[0])
-        self.remove_from_link_list()
-
-    @change_workdir
-    def gc_profile(self, profile: Path):
-        store = {}
-        self.clear_list = []
-        for i in os.listdir():
-            if path.is_link(i):
-                if not path.is_exist(path.readlink(i)):
-                    self.clear_list.append(i)
-                    continue
-            f_prefix_num = self.re_pattern.match(i)
-            if not f_prefix_num:
-                continue
-            f_prefix = f_prefix_num.group(1)
-            num = int(f_prefix_num.group(2))
-            if f_prefix not in store:
-                store[f_prefix] = [(i, num)]
-            else:
-                store[f_prefix].append((i, num))
-        for i in store.values():
-            i = sorted(i, key=lambda k: k[-1], reverse=True)
-            for cpath in i[self.save_num :]:
-                self.clear_list.append(cpath[0])
-        self.remove_from_link_list()
-
-    def gc_clear_list(self):
-        for i in self.gc_autos:
-            self.gc_auto(i)
-        for i in self.profiles:
-            self.gc_profile(i)
+    def apply_plan(self, plan: gcplan.Plan):
+        with history.phase("apply"):
+            removed, skipped = gcplan.apply(plan, dry_run=self.dry_run)
+        if skipped:
+            fmt.warn(f"Skipped {skipped} links changed since the plan was created")
+        if not self.dry_run:
+            fmt.info(f"Deleted {removed} links")
+
+    @trace.span("gc_clear_list")
+    def gc_clear_list(self, target: int = 0) -> gcplan.Plan:
+        with history.phase("plan"):
+            plan = self.plan_free(target) if target else self.plan()
+        self.show_plan(plan)
+        if not self.dry_run:
+            self.apply_plan(plan)
+        return plan
 
     def clear_remove_default(self, reverse: bool = False):
         for i in self.gc_autos:
@@ -409,17 +416,36 @@ class Gc:
                     else:
                         path.remove_file_or_link(kpath)
 
-    def run(self):
-        cmd.run(["sudo", "nix", "store", "gc", "-v"], dry_run=self.dry_run)
+    def run(self, max_bytes: int = 0) -> int | None:
+        "max_bytes 大于 0 时最多释放这么多空间, 返回 /nix/store 所在磁盘可用空间的变化"
+        max_args = ["--max", str(max_bytes)] if max_bytes else []
+        before = store_free_space()
+        with history.phase("collect"):
+            result = cmd.run(
+                ["sudo", "nix", "store", "gc", "-v"] + max_args, dry_run=self.dry_run
+            )
+        after = store_free_space()
+        run = history.current()
+        if run is not None and result is not None:
+            run.status = result.returncode
+        if self.dry_run or before is None or after is None:
+            return None
+        return after - before
+
+
+def nix_version_line() -> str:
+    "nix --version 的第一行, nix 可执行文件不变时使用缓存的结果"
+    memo = Memo(files=(cmd.which("nix"),))
+    return cmd.getout(["nix", "--version"], cache=memo).splitlines()[0]
 
 
 def nix_version_str() -> str:
     """获取当前 nix version"""
-    return cmd.getout(["nix", "--version"]).splitlines()[0].split()[-1]
+    return nix_version_line().split()[-1]
 
 
 def nix_is_lix() -> bool:
-    return cmd.getout(["nix", "--version"]).splitlines()[0].find("Lix") != -1
+    return nix_version_line().find("Lix") != -1
 
 
 def nix_version_is_greater(v: str) -> bool:
@@ -441,7 +467,7 @@ def nix_version_is_greater(v: str) -> bool:
 def nix_install_profiles(dry_run: bool = True):
     nix_profile = NIX_PROFILES.joinpath("default")
     nix_profile_str = nix_profile.as_posix()
-    nix_version_line = cmd.getout(["nix", "--version"]).splitlines()[0]
+    version_line = nix_version_line()
     lix_latest_tag = cmd.get_latest_tag_by_git(
         "https://git.lix.systems/lix-project/lix"
     )
@@ -469,8 +495,8 @@ def nix_install_profiles(dry_run: bool = True):
         '"nix-command flakes"',
     ]
     if os.path.exists(os.path.join(nix_profile, "bin", "nix")):
-        if nix_version_line.find("Lix") != -1:
-            nix_versions = nix_version_line.split()[-1]
+        if version_line.find("Lix") != -1:
+            nix_versions = version_line.split()[-1]
             if lix_latest_tag is not None and nix_versions != lix_latest_tag:
                 cmd.run(
                     ["sudo", "-H", "--preserve-env=SSH+AUTH_SOCK"]
@@ -565,12 +591,13 @@ def update(
     # when nix-repl reports an error, it will cause the inputs.flake to be very slow,
     # it should be used to get it by using the flake.lock file,
     # if the inputs.flake has been modified, you can use the nix-flake command to update the lock.
-    all_flakes = get_flake_inputs_by_lock()
+    lock = get_flake_lock()
+    all_flakes = lock.root_inputs()
     ignore_inputs = ["nixos-stable", "darwin-stable", "darwin", "home-manager"]
     msg = None
     if flake:
         for i in flake:
-            if i in all_flakes:
+            if i in all_flakes or is_updatable_input(lock, i):
                 flakes.append(i)
             elif i == "stable":
                 flakes.append("home-manager")
@@ -603,12 +630,16 @@ def update(
     fmt.info(f"updating {','.join(flakes)}" if msg is None else msg)
     is_greater_2_18 = nix_version_is_greater("2.18")
     if is_greater_2_18:
-        cmd.run(
-            ["nix", "flake", "update"] + flakes + flags, dry_run=dry_run, shell=True
-        )
+        cmd_list = ["nix", "flake", "update"] + flakes + flags
     else:
         inputs = [f"--update-input {input}" for input in flakes]
-        cmd.run(["nix", "flake", "lock"] + inputs + flags, dry_run=dry_run, shell=True)
+        cmd_list = ["nix", "flake", "lock"] + inputs + flags
+    # 记录的是更新后的 flake.lock
+    with history.record("update", "", os.getcwd(), enabled=not dry_run) as run:
+        with run.phase("update"):
+            result = cmd.run(cmd_list, dry_run=dry_run, shell=True)
+        if result is not None:
+            run.status = result.returncode
 
 
 # HACK: When macos is updated it automatically generates new /etc/shells,
@@ -726,14 +757,180 @@ def bootstrap(
         raise typer.Abort()
 
 
+def get_flake_hosts(flake: str, cfg: FlakeOutputs) -> List[str]:
+    "flake 中 nixosConfigurations/darwinConfigurations/homeConfigurations 下的主机名"
+    output = cmd.getout(
+        [
+            "nix",
+            "eval",
+            "--json",
+            f"{flake}#{cfg.value}",
+            "--apply",
+            "builtins.attrNames",
+        ]
+    )
+    return json.loads(output)
+
+
+def host_build_cmd(flake: str, cfg: FlakeOutputs, host: str) -> List[str]:
+    "直接构建主机的 toplevel, 每个主机使用单独的 result 链接, 可以同时构建多个主机"
+    attr = (
+        "activationPackage"
+        if cfg == FlakeOutputs.HOME_MANAGER
+        else "config.system.build.toplevel"
+    )
+    return [
+        "nix",
+        "build",
+        f'{flake}#{cfg.value}."{host}".{attr}',
+        "--out-link",
+        f"result-{host}",
+    ]
+
+
+def build_hosts(
+    flake: str,
+    cfg: FlakeOutputs,
+    hosts: List[str],
+    flags: List[str],
+    jobs: int,
+    dry_run: bool,
+) -> bool:
+    "最多同时构建 jobs 个主机, 输出的每一行以主机名开头, 返回是否全部构建成功"
+    width = max(fmt.str_len(i) for i in hosts)
+    started_at = time.time()
+    results = cmd.run_many(
+        [host_build_cmd(flake, cfg, i) + flags for i in hosts],
+        limit=jobs,
+        dry_run=dry_run,
+        prefixes=[f"{fmt.str_ljust(i, width)} | " for i in hosts],
+    )
+    if dry_run:
+        return True
+    fmt.info(f"Built {len(hosts)} hosts with {jobs} jobs:")
+    rev, lock_hash = "", ""
+    if os.path.isdir(flake):
+        rev, lock_hash = history.flake_rev(flake), history.lock_hash(flake)
+    ok = True
+    for host, result in zip(hosts, results):
+        assert result is not None
+        history.save(
+            history.Run(
+                "build",
+                host,
+                rev,
+                lock_hash,
+                started_at=started_at,
+                duration=result.duration,
+                phases={"build": result.duration},
+                status=result.returncode,
+            )
+        )
+        msg = f"{fmt.str_ljust(host, width)}  {result.duration:7.1f}s"
+        if result.returncode == 0:
+            fmt.success(f"{msg}  ok")
+        else:
+            ok = False
+            fmt.error(f"{msg}  failed ({result.returncode})")
+    return ok
+
+
+def rebuild(name: str, cmd_list: List[str], progress: bool, dry_run: bool) -> bool:
+    "执行 *-rebuild/home-manager 命令, 返回是否成功"
+    run = history.current()
+    if not progress:
+        with history.phase("rebuild"):
+            result = cmd.run(cmd_list, dry_run=dry_run)
+        returncode = None if result is None else result.returncode
+    else:
+        # 构建日志写入文件, 终端上只显示进度
+        cmd_list = [i for i in cmd_list if i != "-L"]
+        cmd_list += ["--log-format", "internal-json", "-v"]
+        state = nixlog.Progress()
+        with history.phase("rebuild"):
+            returncode = nixlog.run(
+                cmd_list, nixlog.log_file(name), dry_run=dry_run, progress=state
+            )
+        if run is not None:
+            run.built, run.substituted = state.builds.done, state.copies.done
+    if run is not None and returncode:
+        run.status = returncode
+    return dry_run or returncode == 0
+
+
+def activate(
+    cfg: FlakeOutputs, store_path: str, dry_run: bool, version: int | None = None
+) -> bool:
+    """不求值 flake, 直接把 profile 指向已经构建好的 store 路径并运行激活脚本
+
+    version 不为空时把 profile 切换到已有的该版本, 而不是创建新的版本.
+    """
+    use_home = cfg == FlakeOutputs.HOME_MANAGER
+    index = get_generation_index(use_home)
+    profile = index.directory.joinpath(index.name).as_posix()
+    sudo = [] if use_home else ["sudo"]
+    cmd_lists = []
+    if version is not None:
+        cmd_lists.append(
+            sudo + ["nix-env", "-p", profile, "--switch-generation", str(version)]
+        )
+    elif not use_home:
+        cmd_lists.append(sudo + ["nix-env", "-p", profile, "--set", store_path])
+    if use_home:
+        # profile 没有指向该路径时, home-manager 的激活脚本会自己创建新的 generation
+        cmd_lists.append([f"{store_path}/activate"])
+    elif cfg == FlakeOutputs.NIXOS:
+        cmd_lists.append(
+            ["sudo", f"{store_path}/bin/switch-to-configuration", "switch"]
+        )
+    else:
+        # 旧版本的 nix-darwin 需要先以当前用户运行 activate-user
+        if os.path.isfile(f"{store_path}/activate-user"):
+            cmd_lists.append([f"{store_path}/activate-user"])
+        cmd_lists.append(["sudo", f"{store_path}/activate"])
+    run = history.current()
+    with history.phase("activate"):
+        for i in cmd_lists:
+            result = cmd.run(i, dry_run=dry_run)
+            if result is not None and result.returncode != 0:
+                if run is not None:
+                    run.status = result.returncode
+                return False
+    return True
+
+
+def link_state(p: str) -> tuple[int, int, str] | None:
+    "符号链接的 inode, mtime 和目标, 用于判断链接是否被重新创建"
+    try:
+        st = os.lstat(p)
+    except OSError:
+        return None
+    if not os.path.islink(p):
+        return None
+    return (st.st_ino, st.st_mtime_ns, os.path.realpath(p))
+
+
 @app.command(help="builds the specified flake output")
 def build(
-    host: str = typer.Argument(DEFAULT_HOST, help="the hostname to build"),
+    hosts: List[str] = typer.Argument(
+        None, help="the hostnames to build", show_default=DEFAULT_HOST
+    ),
+    all_hosts: bool = typer.Option(
+        False, "--all", help="build every host of the flake output"
+    ),
+    jobs: int = typer.Option(
+        2, "--jobs", "-j", help="the number of hosts built at the same time"
+    ),
     remote: bool = typer.Option(False, help="whether to fetch from the remote"),
     nixos: bool = False,
     darwin: bool = False,
     home: bool = False,
     debug: bool = True,
+    progress: bool = typer.Option(
+        False,
+        help="show a compact progress view and write the full log to a file,"
+        " only when building a single host",
+    ),
     dry_run: bool = typer.Option(False, help="Test the result"),
     extra_args: List[str] = typer.Option(
         None, "--args", "-a", metavar="[AGES]", help="nix additional parameters"
@@ -742,7 +939,27 @@ def build(
     cfg = select(nixos=nixos, darwin=darwin, home=home)
     if cfg is None:
         return
-    elif cfg == FlakeOutputs.NIXOS:
+    if all_hosts or (hosts and len(hosts) > 1):
+        if progress:
+            fmt.warn("--progress is ignored when building multiple hosts")
+        flake = REMOTE_FLAKE if remote else get_flake()
+        if all_hosts:
+            try:
+                hosts = get_flake_hosts(flake, cfg)
+            except (SubprocessError, ValueError) as e:
+                fmt.error(f"Failed to list {cfg.value} of {flake}: {e}")
+                raise typer.Exit(1)
+        if not hosts:
+            fmt.warn(f"No {cfg.value} found in {flake}")
+            return
+        flags = ["--impure"]
+        flags += ["--show-trace", "-L"] if debug else []
+        flags += extra_args if extra_args else []
+        if not build_hosts(flake, cfg, hosts, flags, jobs, dry_run):
+            raise typer.Exit(1)
+        return
+    host = hosts[0] if hosts else DEFAULT_HOST
+    if cfg == FlakeOutputs.NIXOS:
         cmd_list = ["sudo", "nixos-rebuild", "build", "--flake"]
     elif cfg == FlakeOutputs.DARWIN:
         cmd_list = ["sudo", "darwin-rebuild", "build", "--flake"]
@@ -751,16 +968,30 @@ def build(
     else:
         fmt.error("could not infer system type.")
         raise typer.Abort()
-    flake = f"{REMOTE_FLAKE if remote else get_flake()}#{host}"
+    flake_path = REMOTE_FLAKE if remote else get_flake()
     flags = ["--impure"]
     flags += ["--show-trace", "-L"] if debug else []
     flags += extra_args if extra_args else []
-    cmd_list += [flake] + flags
+    cmd_list += [f"{flake_path}#{host}"] + flags
     use_home = cfg == FlakeOutputs.HOME_MANAGER
-    old_generation = get_current_generation(use_home)
-    result_out = cmd.run(cmd_list, dry_run=dry_run)
-    if dry_run or (result_out and result_out.returncode == 0):
-        nix_diff(use_home=use_home, dry_run=dry_run, old_generation=old_generation)
+    artifact_key = artifacts.key(flake_path, host, [cfg.value] + (extra_args or []))
+    old_result = link_state("result")
+    with history.record("build", host, flake_path, enabled=not dry_run):
+        old_generation = get_current_generation(use_home)
+        if rebuild("build", cmd_list, progress, dry_run):
+            new_result = link_state("result")
+            # 只记录这次构建重新创建的 result 链接
+            if (
+                artifact_key is not None
+                and not dry_run
+                and new_result is not None
+                and new_result != old_result
+            ):
+                artifacts.save(artifact_key, new_result[2])
+            with history.phase("diff"):
+                nix_diff(
+                    use_home=use_home, dry_run=dry_run, old_generation=old_generation
+                )
 
 
 @app.command(help="builds and activates the specified flake output")
@@ -771,6 +1002,12 @@ def switch(
     darwin: bool = False,
     home: bool = False,
     debug: bool = False,
+    progress: bool = typer.Option(
+        False, help="show a compact progress view and write the full log to a file"
+    ),
+    force: bool = typer.Option(
+        False, help="evaluate and switch even if nothing changed since the last switch"
+    ),
     dry_run: bool = typer.Option(False, help="Test the result"),
     extra_args: List[str] = typer.Option(
         None, "--args", "-a", metavar="[AGES]", help="nix additional parameters"
@@ -793,21 +1030,91 @@ def switch(
     else:
         fmt.error("could not infer system type.")
         raise typer.Abort()
-    flake = [f"{REMOTE_FLAKE}#{host}"] if remote else [f"{get_flake()}#{host}"]
+    flake_path = REMOTE_FLAKE if remote else get_flake()
     flags = ["--impure"]
     flags += ["--show-trace", "-L"] if debug else []
     flags += extra_args if extra_args else []
-    cmd_list = cmd_str.split() + flake + flags
+    cmd_list = cmd_str.split() + [f"{flake_path}#{host}"] + flags
     use_home = cfg == FlakeOutputs.HOME_MANAGER
     old_generation = get_current_generation(use_home)
-    hm_generation = get_current_generation(True)
-    result_out = cmd.run(cmd_list, dry_run=dry_run)
-    if dry_run or (result_out and result_out.returncode == 0):
-        nix_diff(use_home=use_home, dry_run=dry_run, old_generation=old_generation)
-        if old_generation != hm_generation:
-            nix_diff(
-                use_home=(not use_home), dry_run=dry_run, old_generation=hm_generation
-            )
+    source = fingerprint.compute(flake_path, host, [cmd_str] + (extra_args or []))
+    if (
+        source is not None
+        and old_generation is not None
+        and not force
+        and fingerprint.unchanged(host, source, old_generation.path.as_posix())
+    ):
+        fmt.success(
+            f"{host} is unchanged since the last switch, use --force to switch anyway"
+        )
+        return
+    artifact_key = artifacts.key(flake_path, host, [cfg.value] + (extra_args or []))
+    built = artifacts.lookup(artifact_key) if artifact_key and not force else None
+    with history.record("switch", host, flake_path, enabled=not dry_run):
+        hm_generation = get_current_generation(True)
+        if built is not None:
+            fmt.info(f"{built} was built from the same commit, skipping evaluation")
+            if not activate(cfg, built, dry_run):
+                return
+        elif not rebuild("switch", cmd_list, progress, dry_run):
+            return
+        new_generation = get_current_generation(use_home)
+        if new_generation is not None and not dry_run:
+            if source is not None:
+                fingerprint.save(host, source, new_generation.path.as_posix())
+            if artifact_key is not None:
+                artifacts.save(artifact_key, new_generation.path.as_posix())
+        with history.phase("diff"):
+            nix_diff(use_home=use_home, dry_run=dry_run, old_generation=old_generation)
+            if old_generation != hm_generation:
+                nix_diff(
+                    use_home=(not use_home),
+                    dry_run=dry_run,
+                    old_generation=hm_generation,
+                )
+
+
+@app.command(help="activate an older generation without evaluating the flake")
+def rollback(
+    steps: int = typer.Argument(1, help="how many generations to go back"),
+    to: int = typer.Option(
+        None, "--to", metavar="[VERSION]", help="the generation version to activate"
+    ),
+    nixos: bool = False,
+    darwin: bool = False,
+    home: bool = False,
+    dry_run: bool = typer.Option(False, help="Test the result"),
+):
+    cfg = select(nixos=nixos, darwin=darwin, home=home)
+    use_home = cfg == FlakeOutputs.HOME_MANAGER
+    index = get_generation_index(use_home)
+    current = index.current()
+    if to is not None:
+        target = index.get(to)
+    elif steps < 1:
+        fmt.error("The number of generations to go back must be at least 1")
+        raise typer.Exit(1)
+    else:
+        target = current
+        for _ in range(steps):
+            target = index.previous(target)
+            if target is None:
+                break
+    if target is None:
+        fmt.error(
+            f"Generation {to if to is not None else f'-{steps}'} not found,"
+            f" available: {' '.join(str(i.version) for i in index)}"
+        )
+        raise typer.Exit(1)
+    if target == current:
+        fmt.warn(f"Generation {target.version} is already active")
+        return
+    fmt.info(f"Rolling back to {format_generation(target)}")
+    with history.record("rollback", enabled=not dry_run):
+        if not activate(cfg, target.path.as_posix(), dry_run, target.version):
+            raise typer.Exit(1)
+        with history.phase("diff"):
+            nix_diff(use_home=use_home, dry_run=dry_run, old_generation=current)
 
 
 @app.command(help="Showing different information for the two latest builds")
@@ -815,6 +1122,100 @@ def diff(home: bool = False, dry_run: bool = False):
     nix_diff(use_home=home, dry_run=dry_run)
 
 
+def print_generations(use_home: bool, show_sizes: bool):
+    index = get_generation_index(use_home)
+    items = list(index)
+    if not items:
+        return
+    fmt.info(
+        f"{'home-manager' if use_home else 'system'} generations ({index.directory}):"
+    )
+    current = index.current_version()
+    sizes = (
+        {i.store_path: i for i in closure.sizes([str(g.path) for g in reversed(items)])}
+        if show_sizes
+        else {}
+    )
+    width = len(str(items[0].version))
+    for g in items:
+        line = f"  {fmt.str_rjust(str(g.version), width)}  {g.created_at.strftime('%Y-%m-%d %H:%M')}"
+        size = sizes.get(str(g.path))
+        if size is not None:
+            delta = "" if size.delta is None else fmt.human_size(size.delta, sign=True)
+            line += (
+                f"  {fmt.str_rjust(fmt.human_size(size.size), 10)}"
+                f"  {fmt.str_rjust(delta, 11)}"
+                f"  unique {fmt.str_rjust(fmt.human_size(size.unique), 10)}"
+            )
+        else:
+            line += f"  {g.path}"
+        if g.version == current:
+            line += "  (current)"
+        fmt.echo(line)
+
+
+@app.command(name="generations", help="list system and home-manager generations")
+def list_generations(
+    sizes: bool = typer.Option(
+        False, help="show closure sizes and the change from the previous generation"
+    ),
+):
+    for use_home in [False, True]:
+        print_generations(use_home, sizes)
+
+
+# 最近 5 次成功执行的平均耗时达到之前 5 次的 1.5 倍时提示变慢
+SLOWER_RATIO = 1.5
+
+
+def format_run(run: history.Run) -> str:
+    started = datetime.fromtimestamp(run.started_at).strftime("%Y-%m-%d %H:%M")
+    phases = ", ".join(f"{k} {v:.1f}s" for k, v in run.phases.items())
+    line = f"{started}  {run.command} {run.host or '-'}  {run.duration:.1f}s"
+    line += f" ({phases})" if phases else ""
+    if run.built is not None:
+        line += f", {run.built} built, {run.substituted} fetched"
+    line += f", rev {run.flake_rev[:8]}" if run.flake_rev else ""
+    return line + (f", failed ({run.status})" if run.status else "")
+
+
+@app.command(help="show timing statistics of build, switch, update and gc")
+def stats(
+    command: str = typer.Option(
+        "", "--command", "-c", help="only show runs of this command"
+    ),
+    host: str = typer.Option("", help="only show runs of this host"),
+    days: int = typer.Option(0, help="only show runs of the last x days"),
+    limit: int = typer.Option(5, help="the number of slowest runs to show"),
+):
+    since = time.time() - days * 86400 if days > 0 else 0.0
+    runs = history.load(command or None, host or None, since)
+    if not runs:
+        fmt.warn(f"No history recorded in {history.db_file()}")
+        return
+    summaries = history.summarize(runs)
+    labels = [f"{i.command} {i.host or '-'}" for i in summaries]
+    width = max(fmt.str_len(i) for i in labels)
+    fmt.info(f"{len(runs)} runs recorded:")
+    for label, i in zip(labels, summaries):
+        line = (
+            f"  {fmt.str_ljust(label, width)}"
+            f"  {i.count:4d} runs  {i.failed:3d} failed"
+            f"  p50 {i.p50:7.1f}s  p90 {i.p90:7.1f}s  max {i.max:7.1f}s"
+        )
+        if i.trend is not None:
+            line += f"  trend x{i.trend:.2f}"
+        if i.trend is not None and i.trend >= SLOWER_RATIO:
+            fmt.warn(f"{line.strip()}  (slower)")
+        else:
+            fmt.echo(line)
+    slowest = sorted(runs, key=lambda i: i.duration, reverse=True)[:limit]
+    if slowest:
+        fmt.info("Slowest runs:")
+        for run in slowest:
+            fmt.echo(f"  {format_run(run)}")
+
+
 @app.command(help="remove previously built configurations and symlinks from DOTFILES")
 @change_workdir
 def clean(
@@ -834,14 +1235,23 @@ def pull(dry_run: bool = typer.Option(False, help="Test the result")):
     cmd.run(cmd_str, shell=True, dry_run=dry_run)
 
 
+def get_archive_paths(archive: dict) -> List[str]:
+    "等价于 jq -r '.path,(.inputs|to_entries[].value.path)'"
+    inputs = archive.get("inputs", {}).values()
+    return [archive["path"]] + [i["path"] for i in inputs if "path" in i]
+
+
 @app.command(help="cache the output environment of flake.nix")
 @change_workdir
 def cache(
     cache_name: str = "shanyouli",
     dry_run: bool = typer.Option(False, help="Test the result"),
 ):
-    cmd_str = f"nix flake archive --json | jq -r '.path,(.inputs|to_entries[].value.path)' | cachix push {cache_name}"
-    cmd.run(cmd_str.split(), shell=True, dry_run=dry_run)
+    archive = cmd.stream(["nix", "flake", "archive", "--json"], dry_run=dry_run)
+    store_paths = [
+        j for i in archive if i.strip() for j in get_archive_paths(json.loads(i))
+    ]
+    cmd.run(["cachix", "push", cache_name] + store_paths, dry_run=dry_run)
 
 
 @app.command(help="nix repl")
@@ -879,16 +1289,74 @@ def gc(
     save: int = typer.Option(
         3, "--save", "-s", help="Save the last x number of builds"
     ),
+    keep_daily: int = typer.Option(
+        0, help="also keep the newest generation of each of the last x days"
+    ),
+    keep_weekly: int = typer.Option(
+        0, help="also keep the newest generation of each of the last x weeks"
+    ),
+    keep_monthly: int = typer.Option(
+        0, help="also keep the newest generation of each of the last x months"
+    ),
     dry_run: bool = typer.Option(False, help="test the result of garbage collection"),
+    free: str = typer.Option(
+        "",
+        "--free",
+        metavar="[SIZE]",
+        help="remove the oldest builds until about SIZE (e.g. 50G) can be freed",
+    ),
+    plan_file: str = typer.Option(
+        "",
+        "--plan",
+        metavar="[FILE]",
+        help="where --dry-run writes the plan, defaults to the sd cache directory",
+    ),
+    apply_plan: str = typer.Option(
+        "",
+        "--apply-plan",
+        metavar="[FILE]",
+        help="delete the links listed in a plan written by --dry-run",
+    ),
     # only: bool = typer.Option(False, help='Keep only one build'),
 ):
     if delete_older_than:
         base_cmd = f"nix-collect-garbage --delete-older-then {delete_older_than} {'--dry-run' if dry_run else ''}"
         cmd.run(["sudo"] + base_cmd.split(), dry_run=dry_run)
-    else:
-        nix_gc = Gc(dry_run=dry_run, save_num=save)
-        nix_gc.gc_clear_list()
-        nix_gc.run()
+        return
+    with history.record("gc", enabled=not dry_run):
+        policy = Policy(save, keep_daily, keep_weekly, keep_monthly)
+        nix_gc = Gc(dry_run=dry_run, save_num=save, policy=policy)
+        if apply_plan:
+            try:
+                plan = gcplan.load(apply_plan)
+            except (OSError, ValueError) as e:
+                fmt.error(f"Failed to read the gc plan {apply_plan}: {e}")
+                raise typer.Exit(1)
+            nix_gc.apply_plan(plan)
+        else:
+            try:
+                target = fmt.parse_size(free) if free else 0
+            except ValueError as e:
+                fmt.error(str(e))
+                raise typer.Exit(1)
+            try:
+                plan = nix_gc.gc_clear_list(target)
+            except gcplan.GcPlanError as e:
+                fmt.error(f"Refusing to remove builds by size: {e}")
+                raise typer.Exit(1)
+            if dry_run:
+                plan_file = (
+                    plan_file or path.cache_dir().joinpath("gc-plan.json").as_posix()
+                )
+                gcplan.dump(plan, plan_file)
+                fmt.info(
+                    f"Plan written to {plan_file}, run `sd gc --apply-plan {plan_file}`"
+                )
+        freed = nix_gc.run(plan.target)
+        if plan.target and freed is not None:
+            fmt.info(
+                f"Freed {fmt.human_size(freed)}, estimated {fmt.human_size(plan.estimated)}"
+            )
 
 
 @app.command(help="Reinitialize darwin", hidden=PLATFORM != FlakeOutputs.DARWIN)
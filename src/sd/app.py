@@ -0,0 +1,179 @@
+import typer
+
+from sd.utils import cmd, facts, memo, trace
+from sd.utils.enums import ISMAC
+from sd.utils.lazy import LazyCommand, lazy_group
+
+import typer.completion
+from typer._completion_shared import Shells
+
+# 子命令只登记名称和帮助信息, 实现模块在该子命令真正执行时才会被导入
+NIX_COMMANDS = {
+    "update": "update all flake inputs or optionally specific flakes",
+    "bootstrap": "Builds an initial Configuration",
+    "build": "builds the specified flake output",
+    "switch": "builds and activates the specified flake output",
+    "rollback": "activate an older generation without evaluating the flake",
+    "diff": "Showing different information for the two latest builds",
+    "generations": "list system and home-manager generations",
+    "stats": "show timing statistics of build, switch, update and gc",
+    "clean": "remove previously built configurations and symlinks from DOTFILES",
+    "pull": "pull changes from remote repo",
+    "cache": "cache the output environment of flake.nix",
+    "repl": "nix repl",
+    "gc": "run garbage collection on unused nix store paths",
+    "init": "Reinitialize darwin",
+}
+
+EXECUTABLES = cmd.which_all(
+    ["nixos-rebuild", "darwin-rebuild", "home-manager", "nix", "launchctl"]
+)
+HAS_NIXOS = EXECUTABLES["nixos-rebuild"] is not None
+HAS_DARWIN = EXECUTABLES["darwin-rebuild"] is not None
+SYSAPP = None
+if HAS_NIXOS or HAS_DARWIN or EXECUTABLES["home-manager"] is not None:
+    SYSAPP = "nix"
+
+COMMANDS: list[LazyCommand] = []
+if SYSAPP == "nix":
+    NIX_HIDDEN = {
+        # 与 sd.api.nix.PLATFORM 的判断保持一致, 但不需要导入该模块
+        "bootstrap": HAS_NIXOS,
+        "init": HAS_NIXOS or not (HAS_DARWIN or ISMAC),
+    }
+    COMMANDS += [
+        LazyCommand(
+            name,
+            "sd.api.nix:app",
+            help=help,
+            command=name,
+            hidden=NIX_HIDDEN.get(name, False),
+        )
+        for name, help in NIX_COMMANDS.items()
+    ]
+COMMANDS += [
+    LazyCommand(
+        "bid",
+        "sd.api.macbid:app",
+        help="Get macos App BundleID!",
+        hidden=not ISMAC,
+    ),
+    LazyCommand(
+        "env",
+        "sd.api.env:app",
+        help="save shell environment variable",
+    ),
+    LazyCommand(
+        "darwin",
+        "sd.api.macos:app",
+        help="macos Commonly used shortcut commands",
+        hidden=not ISMAC,
+        no_args_is_help=True,
+    ),
+]
+COMMANDS.append(
+    LazyCommand(
+        "lock",
+        "sd.api.lock:app",
+        help="inspect the flake.lock of the configuration",
+        no_args_is_help=True,
+    )
+)
+COMMANDS.append(
+    LazyCommand(
+        "daemon",
+        "sd.api.daemon:app",
+        help="Keep a resident sd process to answer commands quickly",
+        no_args_is_help=True,
+    )
+)
+if SYSAPP != "nix":
+    COMMANDS.append(
+        LazyCommand(
+            "nix",
+            "sd.api.nix:app",
+            help="System Configuration Management By Nix",
+            hidden=EXECUTABLES["nix"] is not None,
+            no_args_is_help=True,
+        )
+    )
+if EXECUTABLES["launchctl"] is not None:
+    COMMANDS += [
+        LazyCommand(
+            name,
+            "sd.api.launchctl:app",
+            help="macos launchctl services manager",
+            no_args_is_help=True,
+        )
+        for name in ["sc", "service"]
+    ]
+
+app = typer.Typer(
+    cls=lazy_group(COMMANDS), add_completion=False, no_args_is_help=True
+)  # add_completion 为 True 时表示使用默认补全
+
+
+def refresh_facts_callback(value: bool) -> None:
+    if value:
+        facts.refresh()
+        memo.refresh()
+
+
+def trace_callback(value: bool) -> None:
+    if value:
+        trace.enable()
+
+
+def trace_file_callback(value: str | None) -> None:
+    if value:
+        trace.enable(value)
+
+
+@app.callback()
+def callback(
+    refresh_facts: bool = typer.Option(
+        False,
+        "--refresh-facts",
+        is_eager=True,
+        callback=refresh_facts_callback,
+        help="Ignore the cached facts and command results and probe again",
+    ),
+    trace_run: bool = typer.Option(
+        False,
+        "--trace",
+        is_eager=True,
+        callback=trace_callback,
+        help="Print the time spent in every subprocess and phase at exit",
+    ),
+    trace_file: str = typer.Option(
+        None,
+        "--trace-file",
+        metavar="[FILE]",
+        is_eager=True,
+        callback=trace_file_callback,
+        show_default=False,
+        help="Also write a Chrome trace JSON file, implies --trace",
+    ),
+) -> None:
+    pass
+
+
+app_completion = typer.Typer(
+    help="Generate and install completion scripts.", hidden=True
+)
+app.add_typer(app_completion, name="completion")
+
+
+@app_completion.command(
+    no_args_is_help=True,
+    help="Show completion for the specified shell, to copy or customize it.",
+)
+def show(ctx: typer.Context, shell: Shells) -> None:
+    typer.completion.show_callback(ctx, None, shell)
+
+
+@app_completion.command(
+    no_args_is_help=True, help="Install completion for the specified shell."
+)
+def install(ctx: typer.Context, shell: Shells) -> None:
+    typer.completion.install_callback(ctx, None, shell)
@@ -0,0 +1,67 @@
+# (主机, git commit, flake.lock, 参数) 到构建结果 (toplevel/activationPackage) 的映射,
+# 保存在 $XDG_STATE_HOME/sd/artifacts.json. 切换回已经构建过的 commit 时,
+# 如果 store 路径仍然存在, 可以直接激活而不必重新求值 flake.
+import hashlib
+import json
+import os
+import time
+from subprocess import SubprocessError
+from typing import Any, List
+
+from sd.utils import cmd, path
+from sd.utils.fingerprint import blob_id
+
+STATE_VERSION = 1
+MAX_ENTRIES = 64
+
+
+def key(flake_path: str, host: str, args: List[str]) -> str | None:
+    "工作区有未提交的修改或不是本地 git 仓库时返回 None"
+    if not os.path.isdir(flake_path):
+        return None
+    git = ["git", "-C", flake_path]
+    try:
+        commit = cmd.getout(git + ["rev-parse", "HEAD"])
+        # diff-index 不刷新索引, stat 变化但内容相同的文件也会被当作修改;
+        # status 会重新比较这些文件的内容
+        changed = cmd.getout(git + ["status", "--porcelain", "--untracked-files=no"])
+    except (SubprocessError, OSError):
+        return None
+    if changed:
+        return None
+    lock = blob_id(os.path.join(flake_path, "flake.lock"))
+    data = json.dumps([STATE_VERSION, host, commit, lock, args])
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def state_file() -> str:
+    return path.state_dir().joinpath("artifacts.json").as_posix()
+
+
+def _read() -> dict[str, Any]:
+    data = path.json_load_versioned(state_file(), STATE_VERSION) or {}
+    entries = data.get("entries")
+    return entries if isinstance(entries, dict) else {}
+
+
+def lookup(artifact_key: str) -> str | None:
+    "已知并且仍然存在于 store 中的构建结果"
+    entry = _read().get(artifact_key)
+    if not isinstance(entry, dict):
+        return None
+    out = entry.get("out")
+    return out if isinstance(out, str) and os.path.isdir(out) else None
+
+
+def save(artifact_key: str, out: str) -> None:
+    entries = _read()
+    entries[artifact_key] = {"out": out, "time": time.time()}
+    # 只保留最近的 MAX_ENTRIES 条
+    newest = sorted(entries.items(), key=lambda i: i[1].get("time", 0))
+    try:
+        path.json_write_atomic(
+            state_file(),
+            {"version": STATE_VERSION, "entries": dict(newest[-MAX_ENTRIES:])},
+        )
+    except OSError:
+        pass
@@ -0,0 +1,208 @@
+# 比较两个 store 路径的闭包: 新增, 删除, 版本变化的软件包以及闭包大小的变化.
+# store 路径不可变, 同一对路径的比较结果永久缓存在 $XDG_CACHE_HOME/sd/diff/ 下,
+# 单个路径的闭包永久缓存在 $XDG_CACHE_HOME/sd/closure/ 下.
+import hashlib
+import os
+import re
+from subprocess import SubprocessError
+from dataclasses import asdict, dataclass, field
+from typing import Iterable, List
+
+from sd.utils import cmd, path, storedb, trace
+
+DIFF_VERSION = 1
+OUTPUTS = ["bin", "dev", "devdoc", "doc", "info", "lib", "man", "out", "static"]
+# 在所有路径拼接成的文本上一次性匹配: <hash>-<pname>[-<version>][-<output>]
+STORE_NAME_RE = re.compile(
+    r"^[^\n]*/[0-9a-z]{32}-([^\n]+?)(?:-(\d[^\n]*?))?"
+    rf"(?:-(?:{'|'.join(OUTPUTS)}))?$",
+    re.M,
+)
+
+
+@dataclass
+class ClosureDiff:
+    added: dict[str, List[str]] = field(default_factory=dict)
+    removed: dict[str, List[str]] = field(default_factory=dict)
+    changed: dict[str, tuple[List[str], List[str]]] = field(default_factory=dict)
+    paths_before: int = 0
+    paths_after: int = 0
+    size_before: int = 0
+    size_after: int = 0
+
+    @property
+    def size_delta(self) -> int:
+        return self.size_after - self.size_before
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ClosureDiff":
+        data = dict(data)
+        data["changed"] = {k: (v[0], v[1]) for k, v in data["changed"].items()}
+        return cls(**data)
+
+
+@dataclass
+class ClosureSize:
+    "一个 store 路径的闭包大小, unique 为不被同一组中其他路径引用的部分"
+
+    store_path: str
+    paths: int = 0
+    size: int = 0
+    unique: int = 0
+    delta: int | None = None
+
+
+def parse_packages(paths: Iterable[str]) -> dict[str, set[str]]:
+    "把 store 路径解析为 pname 到版本集合的映射, 没有版本号的路径版本为空字符串"
+    packages: dict[str, set[str]] = {}
+    for pname, version in STORE_NAME_RE.findall("\n".join(paths)):
+        packages.setdefault(pname, set()).add(version)
+    return packages
+
+
+def query_closure(store_path: str) -> dict[str, int]:
+    "一次查询得到闭包中所有路径及其 NAR 大小"
+    return storedb.query_closure([store_path])
+
+
+def query_closures(store_paths: List[str], limit: int = 8) -> dict[str, dict[str, int]]:
+    "分别查询多个 store 路径的闭包, 查询失败的路径闭包为空"
+    db = storedb.open_db()
+    result: dict[str, dict[str, int]] = {}
+    if db is not None:
+        try:
+            return {i: db.closure([i]) for i in store_paths}
+        except storedb.StoreDBError:
+            pass
+    outputs = cmd.run_many(
+        [storedb.path_info_cmd([i], recursive=True) for i in store_paths],
+        limit=limit,
+        capture_output=True,
+    )
+    for store_path, output in zip(store_paths, outputs):
+        result[store_path] = {}
+        if output is None or output.returncode != 0:
+            continue
+        try:
+            infos = storedb.parse_path_info(output.stdout or b"")
+        except (ValueError, KeyError, AttributeError, TypeError):
+            continue
+        result[store_path] = {k: v.nar_size for k, v in infos.items()}
+    return result
+
+
+def _sorted(versions: set[str]) -> List[str]:
+    return sorted(i for i in versions if i) or [""]
+
+
+def compute(before: dict[str, int], after: dict[str, int]) -> ClosureDiff:
+    old = parse_packages(before)
+    new = parse_packages(after)
+    result = ClosureDiff(
+        paths_before=len(before),
+        paths_after=len(after),
+        size_before=sum(before.values()),
+        size_after=sum(after.values()),
+    )
+    for pname in sorted(new.keys() - old.keys()):
+        result.added[pname] = _sorted(new[pname])
+    for pname in sorted(old.keys() - new.keys()):
+        result.removed[pname] = _sorted(old[pname])
+    for pname in sorted(old.keys() & new.keys()):
+        if old[pname] != new[pname]:
+            result.changed[pname] = (_sorted(old[pname]), _sorted(new[pname]))
+    return result
+
+
+def cache_file(before: str, after: str) -> str:
+    digest = hashlib.sha256(f"{before}\0{after}".encode()).hexdigest()
+    return path.cache_dir().joinpath("diff", f"{digest}.json").as_posix()
+
+
+def _write_json(p: str, data: dict) -> None:
+    try:
+        path.json_write_atomic(p, {"version": DIFF_VERSION, **data})
+    except OSError:
+        pass
+
+
+def _read(p: str) -> ClosureDiff | None:
+    data = path.json_load_versioned(p, DIFF_VERSION)
+    try:
+        return ClosureDiff.from_dict(data["diff"]) if data else None
+    except (KeyError, TypeError, AttributeError):
+        return None
+
+
+def _write(p: str, result: ClosureDiff) -> None:
+    _write_json(p, {"diff": asdict(result)})
+
+
+def diff(before: str, after: str) -> ClosureDiff:
+    "比较两个 store 路径 (或指向 store 路径的链接) 的闭包"
+    before = os.path.realpath(before)
+    after = os.path.realpath(after)
+    p = cache_file(before, after)
+    cached = _read(p)
+    if cached is not None:
+        trace.count("closure diff hit")
+        return cached
+    trace.count("closure diff miss")
+    with trace.span("closure diff", before=before, after=after):
+        result = compute(query_closure(before), query_closure(after))
+    if result.paths_before and result.paths_after:
+        _write(p, result)
+    return result
+
+
+def cached_closure(store_path: str) -> dict[str, int]:
+    "store 路径的闭包, 同一个路径只查询一次"
+    digest = hashlib.sha256(store_path.encode()).hexdigest()
+    p = path.cache_dir().joinpath("closure", f"{digest}.json").as_posix()
+    data = path.json_load_versioned(p, DIFF_VERSION)
+    if data is not None and isinstance(data.get("closure"), dict):
+        trace.count("closure hit")
+        return data["closure"]
+    trace.count("closure miss")
+    result = query_closure(store_path)
+    # 闭包至少包含路径本身, 为空说明查询有问题, 不缓存
+    if result:
+        _write_json(p, {"closure": result})
+    return result
+
+
+@trace.span("closure sizes")
+def sizes(store_paths: List[str]) -> List[ClosureSize]:
+    """按顺序计算每个路径的闭包大小, 与前一个路径相比的变化, 以及只被它引用的大小
+
+    查询失败的路径大小为 0, 且不计算变化.
+    """
+    closures: List[dict[str, int] | None] = []
+    for i in store_paths:
+        try:
+            closures.append(cached_closure(i))
+        except (SubprocessError, ValueError, OSError):
+            closures.append(None)
+    refcount: dict[str, int] = {}
+    for closure in closures:
+        for p in closure or {}:
+            refcount[p] = refcount.get(p, 0) + 1
+    result: List[ClosureSize] = []
+    previous: int | None = None
+    for store_path, closure in zip(store_paths, closures):
+        if closure is None:
+            result.append(ClosureSize(store_path))
+            previous = None
+            continue
+        size = sum(closure.values())
+        result.append(
+            ClosureSize(
+                store_path,
+                paths=len(closure),
+                size=size,
+                unique=sum(v for k, v in closure.items() if refcount[k] == 1),
+                delta=None if previous is None else size - previous,
+            )
+        )
+        previous = size
+    return result
@@ -1,7 +1,14 @@
+import asyncio
+import os
 import subprocess
-from typing import List
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Sequence
 
 from sd.utils import fmt as strfmt
+from sd.utils import shell as shell_worker
+from sd.utils import trace
+from sd.utils.memo import Memo
 
 
 def run(
@@ -20,16 +27,278 @@ def run(
         strfmt.info(f"> {cmd_str}")
     if dry_run:
         return None
-    return subprocess.run(
+    start = trace.now()
+    result = subprocess.run(
         (cmd_str if shell else cmd_list),
         capture_output=capture_output,
         shell=shell,
     )
+    trace.record_completed(cmd_str, start, result)
+    return result
+
+
+class Stream:
+    """逐行迭代命令的标准输出, 内存占用与输出的大小无关
+
+    tee 为 True 时同时把每一行输出到终端; merge_stderr 为 True 时标准错误也合并到
+    迭代的输出中. 迭代结束后 returncode 为命令的退出码, check 为 True 且退出码非 0
+    时抛出 SubprocessError. 提前结束迭代会终止该命令.
+    """
+
+    def __init__(
+        self,
+        cmd_list: List[str] | str,
+        shell: bool = False,
+        show: bool = False,
+        dry_run: bool = False,
+        tee: bool = False,
+        check: bool = True,
+        merge_stderr: bool = False,
+    ):
+        if isinstance(cmd_list, str):
+            shell = True
+            self.cmd_str = cmd_list
+        else:
+            self.cmd_str = " ".join(cmd_list)
+        self.cmd_list = cmd_list
+        self.shell = shell
+        self.dry_run = dry_run
+        self.tee = tee
+        self.check = check
+        self.merge_stderr = merge_stderr
+        self.returncode: int | None = None
+        if show or dry_run:
+            strfmt.info(f"> {self.cmd_str}")
+
+    def __iter__(self) -> Iterator[str]:
+        if self.dry_run:
+            return
+        start = trace.now()
+        size = 0
+        finished = False
+        process = subprocess.Popen(
+            (self.cmd_str if self.shell else self.cmd_list),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT if self.merge_stderr else None,
+            shell=self.shell,
+            text=True,
+            errors="replace",
+            bufsize=1,
+        )
+        assert process.stdout is not None
+        try:
+            for line in process.stdout:
+                size += len(line.encode())
+                line = line.rstrip("\n")
+                if self.tee:
+                    strfmt.echo(line)
+                yield line
+            finished = True
+        finally:
+            if not finished and process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            self.returncode = process.wait()
+            trace.record_process(self.cmd_str, start, self.returncode, size)
+        if self.check and self.returncode != 0:
+            raise subprocess.SubprocessError(
+                f"{self.cmd_str} exited with {self.returncode}"
+            )
+
+
+def stream(
+    cmd_list: List[str] | str,
+    shell: bool = False,
+    show: bool = False,
+    dry_run: bool = False,
+    tee: bool = False,
+    check: bool = True,
+    merge_stderr: bool = False,
+) -> Stream:
+    "返回逐行读取命令输出的迭代器, 命令在开始迭代时才会执行"
+    return Stream(cmd_list, shell, show, dry_run, tee, check, merge_stderr)
+
+
+# 带前缀输出时单行的最大长度, nix 的构建日志中可能有很长的行
+LINE_LIMIT = 1024 * 1024
+
+
+@dataclass
+class Result:
+    "run_many 中单条命令的结果, 字段与 subprocess.CompletedProcess 保持一致"
+
+    args: List[str] | str
+    returncode: int
+    stdout: bytes | None = None
+    stderr: bytes | None = None
+    timed_out: bool = False
+    duration: float = 0.0
+
+
+async def _echo_lines(stream: asyncio.StreamReader, prefix: str) -> int:
+    "逐行输出并加上前缀, 返回读取的字节数"
+    size = 0
+    while line := await stream.readline():
+        size += len(line)
+        strfmt.echo(f"{prefix}{line.decode(errors='replace').rstrip()}")
+    return size
+
+
+async def run_async(
+    cmd_list: List[str] | str,
+    capture_output: bool = False,
+    shell: bool = False,
+    timeout: float | None = None,
+    prefix: str | None = None,
+) -> Result:
+    """异步执行一条命令, 超时后结束该进程并返回 timed_out=True 的结果
+
+    prefix 不为 None 时 stderr 合并到 stdout, 每一行输出加上前缀后输出到终端.
+    """
+    if isinstance(cmd_list, str):
+        shell = True
+        cmd_str = cmd_list
+    else:
+        cmd_str = " ".join(cmd_list)
+    pipe = asyncio.subprocess.PIPE if capture_output or prefix is not None else None
+    stderr = asyncio.subprocess.STDOUT if prefix is not None else pipe
+    start = trace.now()
+    if shell:
+        process = await asyncio.create_subprocess_shell(
+            cmd_str, stdout=pipe, stderr=stderr, limit=LINE_LIMIT
+        )
+    else:
+        process = await asyncio.create_subprocess_exec(
+            *cmd_list, stdout=pipe, stderr=stderr, limit=LINE_LIMIT
+        )
+    timed_out = False
+    stdout_data: bytes | int | None
+    stderr_data: bytes | None = None
+    try:
+        if prefix is not None:
+            assert process.stdout is not None
+            stdout_data = await asyncio.wait_for(
+                _echo_lines(process.stdout, prefix), timeout
+            )
+            await process.wait()
+        else:
+            stdout_data, stderr_data = await asyncio.wait_for(
+                process.communicate(), timeout
+            )
+    except asyncio.TimeoutError:
+        timed_out = True
+        process.kill()
+        stdout_data, stderr_data = await process.communicate()
+    returncode = process.returncode if process.returncode is not None else -1
+    trace.record_process(cmd_str, start, returncode, stdout_data, stderr_data)
+    return Result(
+        args=cmd_list,
+        returncode=returncode,
+        stdout=stdout_data if isinstance(stdout_data, bytes) else None,
+        stderr=stderr_data,
+        timed_out=timed_out,
+        duration=trace.now() - start,
+    )
+
+
+async def _run_bounded(
+    cmds: Sequence[List[str] | str],
+    limit: int,
+    capture_output: bool,
+    shell: bool,
+    timeout: float | None,
+    prefixes: Sequence[str | None],
+) -> List[Result]:
+    semaphore = asyncio.Semaphore(max(limit, 1))
+
+    async def _run(cmd_list: List[str] | str, prefix: str | None) -> Result:
+        async with semaphore:
+            return await run_async(cmd_list, capture_output, shell, timeout, prefix)
+
+    return list(await asyncio.gather(*[_run(*i) for i in zip(cmds, prefixes)]))
+
+
+def run_many(
+    cmds: Iterable[List[str] | str],
+    limit: int = 8,
+    capture_output: bool = False,
+    shell: bool = False,
+    show: bool = False,
+    dry_run: bool = False,
+    timeout: float | None = None,
+    prefixes: Sequence[str] | None = None,
+) -> List[Result | None]:
+    """并发执行多条命令, 同时运行的进程数不超过 limit
+
+    返回结果与 cmds 的顺序一致, 与 run 相同, dry_run 时每条命令的结果均为 None.
+    给出 prefixes 时每条命令的输出逐行加上对应的前缀, 不会与其他命令的输出交错在一行中.
+    """
+    cmds = list(cmds)
+    line_prefixes: List[str | None] = (
+        list(prefixes) if prefixes is not None else [None for _ in cmds]
+    )
+    if show or dry_run:
+        for i in cmds:
+            strfmt.info(f"> {i if isinstance(i, str) else ' '.join(i)}")
+    if dry_run or not cmds:
+        return [None for _ in cmds]
+    with trace.span("run_many", count=len(cmds), limit=limit):
+        results = asyncio.run(
+            _run_bounded(cmds, limit, capture_output, shell, timeout, line_prefixes)
+        )
+    return list(results)
+
+
+@lru_cache(maxsize=8)
+def _path_index(path_env: str) -> tuple[tuple[str, frozenset[str]], ...]:
+    "每个 PATH 目录只读取一次, 以 PATH 的值为键缓存, PATH 变化后自动重建"
+    index = []
+    seen = set()
+    for i in path_env.split(os.pathsep):
+        i = i or os.curdir
+        if i in seen:
+            continue
+        seen.add(i)
+        try:
+            index.append((i, frozenset(os.listdir(i))))
+        except OSError:
+            continue
+    return tuple(index)
+
+
+def _is_executable(p: str) -> bool:
+    return os.path.isfile(p) and os.access(p, os.X_OK)
+
+
+@lru_cache(maxsize=256)
+def _which(cmd_str: str, path_env: str) -> str | None:
+    for i, names in _path_index(path_env):
+        if cmd_str in names:
+            p = os.path.join(i, cmd_str)
+            if _is_executable(p):
+                return p
+    return None
+
+
+def which(cmd_str: str) -> str | None:
+    "在当前进程中查找可执行文件, 不再调用子进程"
+    if os.sep in cmd_str:
+        return cmd_str if _is_executable(cmd_str) else None
+    return _which(cmd_str, os.environ.get("PATH", os.defpath))
+
+
+def which_all(cmd_list: Iterable[str]) -> dict[str, str | None]:
+    return {i: which(i) for i in cmd_list}
+
+
+def rehash() -> None:
+    "清除缓存, 用于 PATH 不变但目录内容发生变化的情况"
+    _path_index.cache_clear()
+    _which.cache_clear()
 
 
 def exists(cmd_str: str) -> bool:
-    r = run(["env", "type", cmd_str], capture_output=True)
-    return r.returncode == 0 if r else False
+    return which(cmd_str) is not None
 
 
 def test(cmd_list: List[str]) -> bool:
@@ -37,12 +306,48 @@ def test(cmd_list: List[str]) -> bool:
     return result.returncode == 0 if result else False
 
 
-def getout(cmd_str: str | List[str], shell: bool = False, show: bool = False) -> str:
-    "获取命令结果，当结果状态码非0时，抛出错误"
+def _getstatusoutput(cmd_str: str) -> tuple[int, str]:
+    "与 subprocess.getstatusoutput 相同, 启用 shell worker 时在其中执行"
+    if not shell_worker.accepts(cmd_str):
+        start = trace.now()
+        status_code, result = subprocess.getstatusoutput(cmd_str)
+        trace.record_process(cmd_str, start, status_code, result)
+        return status_code, result
+    process = shell_worker.run(cmd_str, merge_stderr=True)
+    result = process.stdout.decode(errors="replace")
+    return process.returncode, result[:-1] if result.endswith("\n") else result
+
+
+def sh(cmd_str: str) -> subprocess.CompletedProcess:
+    "执行 shell 命令并分别捕获 stdout 和 stderr, 适合在循环中大量调用"
+    if shell_worker.accepts(cmd_str):
+        return shell_worker.run(cmd_str)
+    result = run(cmd_str, capture_output=True)
+    assert result is not None
+    return result
+
+
+def getout(
+    cmd_str: str | List[str],
+    shell: bool = False,
+    show: bool = False,
+    cache: Memo | None = None,
+) -> str:
+    "获取命令结果，当结果状态码非0时，抛出错误; cache 不为空时按该策略缓存成功的结果"
+    if cache is None:
+        return _getout(cmd_str, shell, show)
+    result = cache.get(cmd_str)
+    if result is None:
+        result = _getout(cmd_str, shell, show)
+        cache.set(cmd_str, result)
+    return result
+
+
+def _getout(cmd_str: str | List[str], shell: bool, show: bool) -> str:
     if isinstance(cmd_str, str):
         if show:
             strfmt.info(f"> {cmd_str}")
-        status_code, result = subprocess.getstatusoutput(cmd_str)
+        status_code, result = _getstatusoutput(cmd_str)
         if status_code == 0:
             return result
         raise subprocess.SubprocessError(result)
@@ -58,7 +363,7 @@ def getout(cmd_str: str | List[str], shell: bool = False, show: bool = False) ->
 def get_latest_tag_by_git(repo_url: str) -> str | None:
     try:
         cmd = ["git", "ls-remote", "--tags", "--sort=v:refname", repo_url]
-        result = getout(cmd)
+        result = getout(cmd, cache=Memo(ttl=3600))
         if result:
             lines = result.splitlines()
             if not lines:
@@ -0,0 +1,242 @@
+# 补全快速路径: 只依赖标准库, 不导入 typer/click, 也不做任何平台探测.
+# 静态命令树预先生成到 $XDG_CACHE_HOME/sd/completion.json, 只有需要动态补全
+# (参数值, 位置参数) 或缓存失效时才回退到完整的 typer 补全.
+import json
+import os
+import re
+import shlex
+import sys
+from functools import lru_cache
+from typing import Any
+
+COMPLETE_VAR = "_SD_COMPLETE"
+TABLE_VERSION = 1
+
+Node = dict[str, Any]
+Item = tuple[str, str]
+
+
+def table_file() -> str:
+    cache_home = os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "sd", "completion.json")
+
+
+def source_stamp() -> list[int]:
+    "sd 源码文件的数量和最新的 mtime, 用于判断已安装的 sd 是否发生变化"
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sources = []
+    for root, _, files in os.walk(package_dir):
+        for i in files:
+            if i.endswith(".py"):
+                sources.append(os.stat(os.path.join(root, i)).st_mtime_ns)
+    return [len(sources), max(sources, default=0)]
+
+
+def table_key() -> dict[str, Any]:
+    "sd 源码, PATH 或 PATH 中任意目录发生变化时命令树需要重新生成"
+    path_env = os.environ.get("PATH", os.defpath)
+    dirs = []
+    for i in path_env.split(os.pathsep):
+        try:
+            dirs.append(os.stat(i or os.curdir).st_mtime_ns)
+        except OSError:
+            dirs.append(None)
+    return {
+        "version": TABLE_VERSION,
+        "platform": sys.platform,
+        "sources": source_stamp(),
+        "path": path_env,
+        "dirs": dirs,
+    }
+
+
+@lru_cache(maxsize=1)
+def load_table() -> Node | None:
+    try:
+        with open(table_file(), mode="r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("key") != table_key():
+        return None
+    return data.get("tree")
+
+
+def build_node(command, ctx) -> Node:
+    import click
+
+    node: Node = {
+        "help": command.get_short_help_str(),
+        "hidden": command.hidden,
+        "options": [],
+        "arguments": False,
+    }
+    for param in command.get_params(ctx):
+        if isinstance(param, click.Option):
+            node["options"].append(
+                {
+                    "name": param.name,
+                    "opts": param.opts + param.secondary_opts,
+                    "help": param.help or "",
+                    "hidden": param.hidden,
+                    "flag": param.is_flag or param.count,
+                    "multiple": param.multiple,
+                }
+            )
+        elif isinstance(param, click.Argument):
+            node["arguments"] = True
+    if isinstance(command, click.Group):
+        node["commands"] = {}
+        for name in command.list_commands(ctx):
+            _, sub_command, _ = command.resolve_command(ctx, [name])
+            sub_ctx = click.Context(sub_command, info_name=name, parent=ctx)
+            node["commands"][name] = build_node(sub_command, sub_ctx)
+    return node
+
+
+def save_table(app) -> None:
+    "根据完整的 typer app 生成命令树并写入缓存"
+    import click
+    import typer
+
+    command = typer.main.get_command(app)
+    from sd.utils import path
+
+    tree = build_node(command, click.Context(command, info_name="sd"))
+    try:
+        path.json_write_atomic(table_file(), {"key": table_key(), "tree": tree})
+    except OSError:
+        pass
+    load_table.cache_clear()
+
+
+def split_arg_string(string: str) -> list[str]:
+    "与 click.parser.split_arg_string 一致, 未闭合的引号不会报错"
+    lex = shlex.shlex(string, posix=True)
+    lex.whitespace_split = True
+    lex.commenters = ""
+    out = []
+    try:
+        for token in lex:
+            out.append(token)
+    except ValueError:
+        out.append(lex.token)
+    return out
+
+
+def completion_args(shell: str) -> tuple[list[str], str]:
+    if shell == "bash":
+        cwords = split_arg_string(os.environ["COMP_WORDS"])
+        cword = int(os.environ["COMP_CWORD"])
+        incomplete = cwords[cword] if cword < len(cwords) else ""
+        return cwords[1:cword], incomplete
+    completion_args = os.getenv("_TYPER_COMPLETE_ARGS", "")
+    cwords = split_arg_string(completion_args)
+    if shell in ["powershell", "pwsh"]:
+        incomplete = os.getenv("_TYPER_COMPLETE_WORD_TO_COMPLETE", "")
+        return (cwords[1:-1] if incomplete else cwords[1:]), incomplete
+    args = cwords[1:]
+    if args and not completion_args.endswith(" "):
+        return args[:-1], args[-1]
+    return args, ""
+
+
+def get_completions(tree: Node, args: list[str], incomplete: str) -> list[Item] | None:
+    "模拟 click 的补全流程, 遇到需要动态补全的情况时返回 None"
+    node = tree
+    used: set[str] = set()
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == "--":
+            return None
+        if arg.startswith("-") and len(arg) > 1:
+            name, eq, _ = arg.partition("=")
+            option = next((o for o in node["options"] if name in o["opts"]), None)
+            if option is None:
+                return None
+            used.add(option["name"])
+            if not option["flag"] and not eq:
+                i += 1
+                if i >= len(args):
+                    # 正在补全该选项的值
+                    return None
+        elif "commands" in node:
+            if arg not in node["commands"]:
+                return None
+            node = node["commands"][arg]
+            used = set()
+        i += 1
+    is_option = bool(incomplete) and not incomplete[0].isalnum()
+    if is_option and "=" in incomplete:
+        return None
+    if not is_option and "commands" not in node and node["arguments"]:
+        return None
+    items: list[Item] = []
+    for name, sub_node in node.get("commands", {}).items():
+        if name.startswith(incomplete) and not sub_node["hidden"]:
+            items.append((name, sub_node["help"]))
+    if is_option:
+        for option in node["options"]:
+            if option["hidden"] or (option["name"] in used and not option["multiple"]):
+                continue
+            items += [(name, option["help"]) for name in option["opts"]]
+        items = [item for item in items if item[0].startswith(incomplete)]
+    return items
+
+
+def _zsh_escape(s: str) -> str:
+    return (
+        s.replace('"', '""')
+        .replace("'", "''")
+        .replace("$", "\\$")
+        .replace("`", "\\`")
+        .replace(":", r"\\:")
+    )
+
+
+def format_completions(shell: str, items: list[Item]) -> tuple[str, int]:
+    "输出格式与 typer._completion_classes 保持一致"
+    if shell == "bash":
+        return "\n".join(value for value, _ in items), 0
+    if shell == "zsh":
+        if not items:
+            return "_files", 0
+        res = [
+            f'"{_zsh_escape(v)}":"{_zsh_escape(h)}"' if h else f'"{_zsh_escape(v)}"'
+            for v, h in items
+        ]
+        return "_arguments '*: :((" + "\n".join(res) + "))'", 0
+    if shell == "fish":
+        action = os.getenv("_TYPER_COMPLETE_FISH_ACTION", "")
+        if action == "is-args":
+            return "", 0 if items else 1
+        res = []
+        for v, h in items:
+            h = re.sub(r"\s", " ", h)
+            res.append(f"{v}\t{h}" if h else v)
+        return "\n".join(res), 0
+    return "\n".join(f"{v}:::{h or ' '}" for v, h in items), 0
+
+
+def fast_complete() -> int | None:
+    "能够直接回答时输出补全结果并返回退出码, 否则返回 None 交给 typer 处理"
+    instruction, _, shell = os.getenv(COMPLETE_VAR, "").partition("_")
+    if instruction != "complete" or shell not in [
+        "bash",
+        "zsh",
+        "fish",
+        "powershell",
+        "pwsh",
+    ]:
+        return None
+    tree = load_table()
+    if tree is None:
+        return None
+    items = get_completions(tree, *completion_args(shell))
+    if items is None:
+        return None
+    out, code = format_completions(shell, items)
+    if out:
+        sys.stdout.write(out + "\n")
+    return code
@@ -0,0 +1,82 @@
+# sd daemon 的客户端: 只依赖标准库, 在导入 typer 之前把命令转发给常驻进程.
+# 客户端通过 SCM_RIGHTS 把自己的 stdin/stdout/stderr 交给 daemon, 命令的输出
+# 直接写到客户端的终端, socket 上只传递请求和退出码.
+import json
+import os
+import socket
+from typing import List
+
+# 只转发不需要 sudo/交互式终端的命令, 其余命令始终在当前进程中执行
+DAEMON_COMMANDS = {
+    "bid",
+    "sc",
+    "service",
+    "env",
+    "diff",
+    "generations",
+    "lock",
+    "stats",
+}
+DISABLE_VAR = "SD_NO_DAEMON"
+
+
+def runtime_dir() -> str:
+    runtime = os.getenv("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "sd")
+    cache_home = os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "sd")
+
+
+def socket_path() -> str:
+    return os.path.join(runtime_dir(), "daemon.sock")
+
+
+def pid_file() -> str:
+    return os.path.join(runtime_dir(), "daemon.pid")
+
+
+def read_line(sock: socket.socket, data: bytes = b"") -> bytes:
+    while b"\n" not in data:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data.partition(b"\n")[0]
+
+
+def should_forward(args: List[str]) -> bool:
+    if os.getenv(DISABLE_VAR):
+        return False
+    command = next((i for i in args if not i.startswith("-")), None)
+    return command in DAEMON_COMMANDS and os.path.exists(socket_path())
+
+
+def forward(args: List[str]) -> int | None:
+    "daemon 可用时转发命令并返回退出码, 否则返回 None 在当前进程中执行"
+    if not should_forward(args):
+        return None
+    request = {"argv": args, "env": dict(os.environ), "cwd": os.getcwd()}
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path())
+        socket.send_fds(sock, [json.dumps(request).encode() + b"\n"], [0, 1, 2])
+    except OSError:
+        sock.close()
+        return None
+    with sock:
+        while True:
+            try:
+                reply = read_line(sock).decode()
+                break
+            except KeyboardInterrupt:
+                # 由 daemon 把 SIGINT 转发给正在执行的命令
+                sock.sendall(b"i")
+    if reply == "fallback":
+        return None
+    instruction, _, code = reply.partition(" ")
+    if instruction == "exit" and code.lstrip("-").isdigit():
+        return int(code)
+    # daemon 在执行过程中退出, 不再重复执行可能已经产生副作用的命令
+    os.write(2, b"ERROR: sd daemon exited unexpectedly\n")
+    return 1
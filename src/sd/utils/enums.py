@@ -20,17 +20,20 @@ class FlakeOutputs(Enum):
 
 
 class Dotfiles:
-    @property
-    def value(self):
-        env_dotfiles = os.getenv("DOTFILES") or ""
-        for i in [
-            env_dotfiles,
+    @staticmethod
+    def candidates() -> list[str]:
+        return [
+            os.getenv("DOTFILES") or "",
             "/etc/dotfiles",
             "/etc/nixos",
             os.path.expanduser("~/.config/dotfiles"),
             os.path.expanduser("~/.dotfiles"),
             os.path.expanduser("~/.nixpkgs"),
-        ]:
+        ]
+
+    @property
+    def value(self):
+        for i in self.candidates():
             if (
                 os.path.isdir(i)
                 and os.path.exists(os.path.join(i, "flake.nix"))
@@ -39,12 +42,24 @@ class Dotfiles:
                 return os.path.realpath(i)
 
 
+def get_username() -> str | None:
+    user_id = run(["id", "-un"], capture_output=True).stdout.decode().strip()
+    return (os.getenv("USER") or user_id) if user_id == "root" else user_id
+
+
+def __getattr__(name: str):
+    # USERNAME 需要调用子进程, 只在被访问时从 facts 缓存中读取
+    if name == "USERNAME":
+        from sd.utils import facts
+
+        return facts.get("username", get_username)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 UNAME = platform.uname()
-user_id = run(["id", "-un"], capture_output=True).stdout.decode().strip()
 
 SYSTEM_OS = UNAME.system.lower()
 SYSTEM_ARCH = "aarch64" if UNAME.machine == "arm64" else UNAME.machine
-USERNAME = os.getenv("USER") if user_id == "root" else user_id
 
 ISMAC = SYSTEM_OS == "darwin"
 ISLINUX = SYSTEM_OS == "linux"
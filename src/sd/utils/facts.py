@@ -0,0 +1,71 @@
+import os
+from typing import Any, Callable, TypeVar
+
+from sd.utils import cmd, path, trace
+from sd.utils.enums import Dotfiles
+
+T = TypeVar("T")
+
+FACTS_VERSION = 1
+BINARIES = ["nixos-rebuild", "darwin-rebuild", "home-manager", "nix", "id"]
+
+_facts: dict[str, Any] | None = None
+_refresh = False
+
+
+def facts_file() -> str:
+    return path.cache_dir().joinpath("facts.json").as_posix()
+
+
+def fingerprint() -> dict[str, Any]:
+    "相关可执行文件, PATH, uid 或 DOTFILES 候选目录任意一项变化时缓存失效"
+    return {
+        "version": FACTS_VERSION,
+        "path": os.environ.get("PATH", os.defpath),
+        "uid": os.getuid(),
+        "user": os.getenv("USER"),
+        "binaries": {i: path.stat_key(cmd.which(i)) for i in BINARIES},
+        "dotfiles": {i: path.stat_key(i) for i in Dotfiles.candidates() if i},
+    }
+
+
+def _read() -> dict[str, Any]:
+    data = path.json_load(facts_file())
+    if not isinstance(data, dict) or data.get("fingerprint") != fingerprint():
+        return {}
+    cached = data.get("facts")
+    return cached if isinstance(cached, dict) else {}
+
+
+def _write(data: dict[str, Any]) -> None:
+    try:
+        path.json_write_atomic(
+            facts_file(), {"fingerprint": fingerprint(), "facts": data}
+        )
+    except OSError:
+        pass
+
+
+def get(name: str, compute: Callable[[], T]) -> T:
+    "读取缓存的 name, 不存在, 已失效或缓存文件损坏时调用 compute 并写回缓存"
+    global _facts
+    if _facts is None:
+        _facts = {} if _refresh else _read()
+    if name not in _facts:
+        with trace.span(f"facts: {name}"):
+            _facts[name] = compute()
+        _write(_facts)
+    return _facts[name]
+
+
+def refresh() -> None:
+    "忽略已有缓存, 本进程内重新探测并覆盖缓存文件"
+    global _facts, _refresh
+    _facts = None
+    _refresh = True
+
+
+def reset() -> None:
+    global _facts, _refresh
+    _facts = None
+    _refresh = False
@@ -0,0 +1,90 @@
+# switch 的 no-op 检测: flake 源码 (git 跟踪的文件), flake.lock, 主机名和额外参数的指纹,
+# 与每个主机上一次成功 switch 的指纹相同且 profile 没有变化时可以跳过 switch.
+# 文件内容由 git 索引中的 blob id 表示, 只有 git diff-files 根据索引的 stat 信息
+# 判断为修改过的文件才会读取内容计算 blob id.
+import hashlib
+import json
+import os
+from subprocess import SubprocessError
+from typing import Any, List
+
+from sd.utils import cmd, path, trace
+
+STATE_VERSION = 1
+
+
+def blob_id(p: str) -> str:
+    "与 git hash-object 相同的 blob id, 文件不存在时返回空字符串"
+    try:
+        if os.path.islink(p):
+            data = os.readlink(p).encode()
+        else:
+            with open(p, mode="rb") as f:
+                data = f.read()
+    except OSError:
+        return ""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+@trace.span("source digest")
+def source_digest(flake_path: str) -> str | None:
+    "git 跟踪的所有文件在工作区中的内容摘要, 不是 git 仓库时返回 None"
+    git = ["git", "-C", flake_path]
+    try:
+        staged = cmd.getout(git + ["ls-files", "--stage", "-z"])
+        changed = cmd.getout(git + ["diff-files", "--name-only", "-z"])
+    except (SubprocessError, OSError):
+        return None
+    modified = set(i for i in changed.split("\0") if i)
+    digest = hashlib.sha256()
+    for line in staged.split("\0"):
+        if not line:
+            continue
+        # <mode> <object> <stage>\t<file>
+        info, name = line.split("\t", 1)
+        mode, object_id, _ = info.split(" ")
+        if name in modified and mode != "160000":
+            object_id = blob_id(os.path.join(flake_path, name))
+        digest.update(f"{mode} {object_id} {name}\0".encode())
+    return digest.hexdigest()
+
+
+def compute(flake_path: str, host: str, args: List[str]) -> str | None:
+    "flake_path 不是本地 git 仓库时返回 None, 此时不做 no-op 检测"
+    if not os.path.isdir(flake_path):
+        return None
+    source = source_digest(flake_path)
+    if source is None:
+        return None
+    lock = blob_id(os.path.join(flake_path, "flake.lock"))
+    data = json.dumps([STATE_VERSION, source, lock, host, args])
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def state_file() -> str:
+    return path.state_dir().joinpath("switch-fingerprints.json").as_posix()
+
+
+def _read() -> dict[str, Any]:
+    data = path.json_load_versioned(state_file(), STATE_VERSION) or {}
+    hosts = data.get("hosts")
+    return hosts if isinstance(hosts, dict) else {}
+
+
+def unchanged(host: str, fingerprint: str, profile: str) -> bool:
+    "指纹与上一次成功 switch 相同, 并且 profile 仍指向当时的 store 路径"
+    last = _read().get(host)
+    return (
+        isinstance(last, dict)
+        and last.get("fingerprint") == fingerprint
+        and last.get("profile") == profile
+    )
+
+
+def save(host: str, fingerprint: str, profile: str) -> None:
+    hosts = _read()
+    hosts[host] = {"fingerprint": fingerprint, "profile": profile}
+    try:
+        path.json_write_atomic(state_file(), {"version": STATE_VERSION, "hosts": hosts})
+    except OSError:
+        pass
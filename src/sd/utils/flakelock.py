@@ -0,0 +1,194 @@
+# flake.lock 的内存模型: 不调用 nix, 直接解析 lock 文件中的所有节点,
+# 解析 follows 路径, 提供锁定信息和反向依赖查询.
+# @see https://nix.dev/manual/nix/latest/command-ref/new-cli/nix3-flake#lock-files
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Iterator, List
+
+from sd.utils.path import PathLink
+
+MAX_FOLLOWS_DEPTH = 64
+
+
+class FlakeLockError(ValueError):
+    pass
+
+
+@dataclass
+class Node:
+    key: str
+    inputs: dict[str, str | List[str]] = field(default_factory=dict)
+    locked: dict[str, Any] = field(default_factory=dict)
+    original: dict[str, Any] = field(default_factory=dict)
+    flake: bool = True
+
+    @property
+    def type(self) -> str | None:
+        return self.locked.get("type")
+
+    @property
+    def rev(self) -> str | None:
+        return self.locked.get("rev")
+
+    @property
+    def nar_hash(self) -> str | None:
+        return self.locked.get("narHash")
+
+    @property
+    def last_modified(self) -> datetime | None:
+        value = self.locked.get("lastModified")
+        return datetime.fromtimestamp(value) if value is not None else None
+
+    @property
+    def source(self) -> str:
+        "锁定的来源, 例如 github:NixOS/nixpkgs"
+        if self.type in ("github", "gitlab", "sourcehut"):
+            return f"{self.type}:{self.locked.get('owner')}/{self.locked.get('repo')}"
+        if "url" in self.locked:
+            return f"{self.type}:{self.locked['url']}"
+        if "path" in self.locked:
+            return f"{self.type}:{self.locked['path']}"
+        return str(self.type)
+
+    @property
+    def original_ref(self) -> str | None:
+        return self.original.get("ref")
+
+
+class FlakeLock:
+    def __init__(self, data: dict):
+        if not isinstance(data, dict) or not isinstance(data.get("nodes"), dict):
+            raise FlakeLockError("flake.lock has no nodes")
+        self.version: int | None = data.get("version")
+        self.root: str = data.get("root", "root")
+        self.nodes: dict[str, Node] = {
+            k: Node(
+                key=k,
+                inputs=v.get("inputs", {}),
+                locked=v.get("locked", {}),
+                original=v.get("original", {}),
+                flake=v.get("flake", True),
+            )
+            for k, v in data["nodes"].items()
+        }
+        if self.root not in self.nodes:
+            raise FlakeLockError(f"flake.lock has no root node {self.root}")
+        self._resolved: dict[str, dict[str, str]] = {}
+        self._reverse: dict[str, List[tuple[str, str]]] | None = None
+
+    def resolve(self, ref: str | List[str], _depth: int = 0) -> str:
+        "把 input 的值解析为节点名, 列表表示从根节点开始的 follows 路径"
+        if isinstance(ref, str):
+            if ref not in self.nodes:
+                raise FlakeLockError(f"flake.lock references missing node {ref}")
+            return ref
+        if _depth > MAX_FOLLOWS_DEPTH:
+            raise FlakeLockError(f"follows cycle at {'/'.join(ref)}")
+        key = self.root
+        for name in ref:
+            try:
+                target = self.nodes[key].inputs[name]
+            except KeyError:
+                raise FlakeLockError(f"follows path {'/'.join(ref)} does not exist")
+            key = self.resolve(target, _depth + 1)
+        return key
+
+    def inputs(self, key: str | None = None) -> dict[str, str]:
+        "节点的 input 名称到实际节点名的映射, 已解析 follows"
+        key = self.root if key is None else key
+        if key not in self._resolved:
+            self._resolved[key] = {
+                name: self.resolve(ref) for name, ref in self.nodes[key].inputs.items()
+            }
+        return self._resolved[key]
+
+    def root_inputs(self) -> List[str]:
+        return list(self.nodes[self.root].inputs)
+
+    def follows(self, key: str, name: str) -> List[str] | None:
+        "节点的 input 为 follows 时返回其路径"
+        ref = self.nodes[key].inputs.get(name)
+        return ref if isinstance(ref, list) else None
+
+    def node(self, input_path: str | List[str]) -> Node:
+        "按 input 路径查找节点, 例如 home-manager/nixpkgs"
+        names = input_path.split("/") if isinstance(input_path, str) else input_path
+        return self.nodes[self.resolve(names)]
+
+    def walk(self) -> Iterator[tuple[List[str], str]]:
+        "广度优先遍历所有从根节点可达的 (input 路径, 节点名), 每个节点只出现一次"
+        seen = {self.root}
+        queue: List[tuple[List[str], str]] = [([], self.root)]
+        while queue:
+            input_path, key = queue.pop(0)
+            for name, target in self.inputs(key).items():
+                if target not in seen:
+                    seen.add(target)
+                    queue.append((input_path + [name], target))
+                    yield input_path + [name], target
+
+    def reverse_deps(self, key: str) -> List[tuple[str, str]]:
+        "依赖 key 的 (节点名, input 名称) 列表, 包括通过 follows 依赖的节点"
+        if self._reverse is None:
+            reverse: dict[str, List[tuple[str, str]]] = {}
+            for parent in self.nodes:
+                for name, target in self.inputs(parent).items():
+                    reverse.setdefault(target, []).append((parent, name))
+            self._reverse = reverse
+        return self._reverse.get(key, [])
+
+    def unreachable(self) -> List[str]:
+        "lock 文件中不再被任何 input 引用的节点"
+        reachable = {self.root} | {i for _, i in self.walk()}
+        return [i for i in self.nodes if i not in reachable]
+
+
+@dataclass
+class _Cached:
+    stat: tuple[int, int, int]
+    digest: str
+    lock: FlakeLock
+
+
+_cache: dict[str, _Cached] = {}
+
+
+def _stat(p: str) -> tuple[int, int, int]:
+    st = os.stat(p)
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def lock_file(flake_path: PathLink | None = None) -> str:
+    flake_path = os.getcwd() if flake_path is None else flake_path
+    return os.path.join(os.path.realpath(flake_path), "flake.lock")
+
+
+def load(flake_path: PathLink | None = None) -> FlakeLock:
+    """读取 flake 目录下的 flake.lock
+
+    文件的 inode/大小/mtime 不变时直接返回缓存; mtime 变化但内容的哈希不变时
+    (例如 git checkout 后) 同样复用已解析的结果. 读取或解析失败时抛出 FlakeLockError.
+    """
+    p = lock_file(flake_path)
+    try:
+        stat = _stat(p)
+        cached = _cache.get(p)
+        if cached is not None and cached.stat == stat:
+            return cached.lock
+        with open(p, mode="rb") as f:
+            content = f.read()
+    except OSError as e:
+        raise FlakeLockError(str(e)) from e
+    digest = hashlib.sha256(content).hexdigest()
+    if cached is not None and cached.digest == digest:
+        cached.stat = stat
+        return cached.lock
+    try:
+        lock = FlakeLock(json.loads(content))
+    except ValueError as e:
+        raise FlakeLockError(f"{p}: {e}") from e
+    _cache[p] = _Cached(stat, digest, lock)
+    return lock
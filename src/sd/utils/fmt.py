@@ -1,4 +1,5 @@
 import os
+import re
 from typing import List
 
 import typer
@@ -31,6 +32,28 @@ def columns() -> int:
     return cols
 
 
+def human_size(size: float, sign: bool = False) -> str:
+    "以 1024 为底格式化字节数, sign 为 True 时保留正负号"
+    prefix = ("+" if size >= 0 else "-") if sign else ("-" if size < 0 else "")
+    size = abs(size)
+    if size < 1024:
+        return f"{prefix}{size:.0f} B"
+    for unit in ["KiB", "MiB", "GiB", "TiB"]:
+        size /= 1024
+        if size < 1024 or unit == "TiB":
+            break
+    return f"{prefix}{size:.1f} {unit}"
+
+
+def parse_size(text: str) -> int:
+    "解析 50G, 1.5TiB, 512M 之类的大小, 单位以 1024 为底, 没有单位时为字节数"
+    matched = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*", text, re.I)
+    if not matched:
+        raise ValueError(f"invalid size: {text}")
+    exponent = " KMGT".index(matched.group(2).upper() or " ")
+    return int(float(matched.group(1)) * 1024**exponent)
+
+
 def max_size(lst: List[str]) -> int:
     return max(str_len(i) for i in lst)
 
@@ -0,0 +1,350 @@
+# 垃圾回收计划: 对 gcroots/auto 和 profiles 目录各做一次 os.scandir, 链接目标是否
+# 存在的检查分散到线程池中; 生成的计划可以序列化为 JSON, 之后再分批执行删除.
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Iterable, List
+
+from sd.utils import closure, cmd, path, retention, trace
+from sd.utils.generations import Generation
+from sd.utils.retention import Policy
+
+PLAN_VERSION = 1
+DEFAULT_PATTERN = r"(.*)-(\d+)-link$"
+SCAN_WORKERS = 16
+BATCH_SIZE = 512
+
+
+class GcPlanError(Exception):
+    pass
+
+
+@dataclass
+class Entry:
+    "计划删除的一个链接, target 用于在执行前确认链接没有被修改"
+
+    path: str
+    target: str
+    reason: str  # dangling | old | free
+    generation: int | None = None
+    size: int = 0
+
+
+@dataclass
+class Plan:
+    save_num: int
+    policy: str = ""
+    pattern: str = DEFAULT_PATTERN
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    scanned: int = 0
+    target: int = 0
+    estimated: int = 0
+    delete: List[Entry] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {"version": PLAN_VERSION, **asdict(self)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Plan":
+        if data.get("version") != PLAN_VERSION:
+            raise ValueError(f"unsupported plan version {data.get('version')}")
+        data = {k: v for k, v in data.items() if k != "version"}
+        data["delete"] = [Entry(**i) for i in data.get("delete", [])]
+        return cls(**data)
+
+
+@dataclass
+class Link:
+    path: str
+    name: str
+    target: str
+    exists: bool
+    mtime: float = 0.0
+
+
+def _probe(p: str) -> tuple[str, bool, float] | None:
+    "读取链接目标, 链接的修改时间, 并检查目标是否存在, 不是链接时返回 None"
+    try:
+        target = os.readlink(p)
+        mtime = os.lstat(p).st_mtime
+    except OSError:
+        return None
+    try:
+        os.stat(p)
+    except FileNotFoundError:
+        return target, False, mtime
+    except OSError:
+        pass
+    return target, True, mtime
+
+
+def scan(directory: str, workers: int = SCAN_WORKERS) -> List[Link]:
+    "一次 scandir 读取目录下所有的链接, 目标存在性检查在线程池中并发执行"
+    with trace.span(f"gc scan {directory}"):
+        try:
+            with os.scandir(directory) as it:
+                entries = [(i.path, i.name) for i in it if i.is_symlink()]
+        except OSError:
+            return []
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            probes = executor.map(_probe, [p for p, _ in entries])
+            links = [
+                Link(p, name, *probe)
+                for (p, name), probe in zip(entries, probes)
+                if probe is not None
+            ]
+    trace.count("gc scanned", len(links))
+    return links
+
+
+def _select_old(
+    groups: dict[str, List[tuple[int, Link]]], save_num: int
+) -> List[Entry]:
+    result = []
+    for group in groups.values():
+        group.sort(key=lambda k: k[0], reverse=True)
+        for num, link in group[save_num:]:
+            result.append(Entry(link.path, link.target, "old", num))
+    return result
+
+
+def plan_auto(links: Iterable[Link], save_num: int, pattern: re.Pattern) -> List[Entry]:
+    """gcroots/auto 下的链接指向 result 之类的链接
+
+    目标已经不存在的直接删除; 目标名称形如 <prefix>-<N>-link 时, 同一目录下相同
+    prefix 的只保留最新的 save_num 个.
+    """
+    result = []
+    groups: dict[str, List[tuple[int, Link]]] = {}
+    for link in links:
+        if not link.exists:
+            result.append(Entry(link.path, link.target, "dangling"))
+            continue
+        matched = pattern.match(os.path.basename(link.target))
+        if matched:
+            key = os.path.join(os.path.dirname(link.target), matched.group(1))
+            groups.setdefault(key, []).append((int(matched.group(2)), link))
+    return result + _select_old(groups, save_num)
+
+
+def plan_profile(
+    links: Iterable[Link],
+    policy: Policy,
+    pattern: re.Pattern,
+    protected: Iterable[str] = (),
+) -> List[Entry]:
+    """profiles 目录下 <name>-<N>-link 的版本链接
+
+    每个 profile 按保留策略选择需要保留的版本, profile 当前指向的版本以及
+    protected 中的 store 路径对应的版本始终保留.
+    """
+    links = list(links)
+    result = []
+    groups: dict[str, dict[int, Link]] = {}
+    by_name = {i.name: i for i in links}
+    for link in links:
+        if not link.exists:
+            result.append(Entry(link.path, link.target, "dangling"))
+            continue
+        matched = pattern.match(link.name)
+        if matched:
+            groups.setdefault(matched.group(1), {})[int(matched.group(2))] = link
+    for name, group in groups.items():
+        keep = retention.select(
+            [Generation(num, link=i.path) for num, i in group.items()],
+            policy,
+            protected=protected,
+        )
+        current = by_name.get(name)
+        for num, link in sorted(group.items(), reverse=True):
+            if num in keep or (
+                current is not None and os.path.basename(current.target) == link.name
+            ):
+                continue
+            result.append(Entry(link.path, link.target, "old", num))
+    return result
+
+
+@trace.span("gc plan")
+def build(
+    auto_dirs: Iterable[str],
+    profile_dirs: Iterable[str],
+    policy: Policy,
+    pattern: str = DEFAULT_PATTERN,
+    protected: Iterable[str] = (),
+) -> Plan:
+    "auto roots 保留最新的 policy.keep_last 个, profiles 按完整的保留策略处理"
+    regex = re.compile(pattern)
+    protected = list(protected)
+    plan = Plan(save_num=policy.keep_last, policy=policy.describe(), pattern=pattern)
+    for directory in auto_dirs:
+        links = scan(directory)
+        plan.scanned += len(links)
+        plan.delete.extend(plan_auto(links, policy.keep_last, regex))
+    for directory in profile_dirs:
+        links = scan(directory)
+        plan.scanned += len(links)
+        plan.delete.extend(plan_profile(links, policy, regex, protected))
+    return plan
+
+
+def _split_roots(
+    links: List[Link], pattern: re.Pattern, min_keep: int, auto: bool
+) -> tuple[List[Entry], List[Link], List[Link]]:
+    "把目录下的链接分为 (失效的链接, 必须保留的链接, 可以删除的链接)"
+    dangling = [Entry(i.path, i.target, "dangling") for i in links if not i.exists]
+    kept, candidates = [], []
+    groups: dict[str, List[tuple[int, Link]]] = {}
+    by_name = {i.name: i for i in links}
+    for link in links:
+        if not link.exists:
+            continue
+        matched = pattern.match(os.path.basename(link.target) if auto else link.name)
+        if not matched:
+            # 没有版本号的 auto root (例如 direnv) 可以删除, profile 本身的链接保留
+            (candidates if auto else kept).append(link)
+            continue
+        key = (
+            os.path.join(os.path.dirname(link.target), matched.group(1))
+            if auto
+            else matched.group(1)
+        )
+        groups.setdefault(key, []).append((int(matched.group(2)), link))
+    for key, group in groups.items():
+        group.sort(key=lambda k: k[0], reverse=True)
+        current = None if auto else by_name.get(key)
+        for i, (_, link) in enumerate(group):
+            if i < min_keep or (
+                current is not None and os.path.basename(current.target) == link.name
+            ):
+                kept.append(link)
+            else:
+                candidates.append(link)
+    return dangling, kept, candidates
+
+
+@trace.span("gc plan free")
+def build_free(
+    auto_dirs: Iterable[str],
+    profile_dirs: Iterable[str],
+    target: int,
+    min_keep: int,
+    pattern: str = DEFAULT_PATTERN,
+    protected: Iterable[str] = (),
+) -> Plan:
+    """选择需要删除的 root, 使释放的空间达到 target 字节
+
+    每个 profile/auto root 组至少保留最新的 min_keep 个, 其余的 root 从旧到新
+    依次加入计划; 每个 root 的 size 为删除它之后不再被任何剩余 root 引用的路径
+    的 NAR 大小之和, 因此 estimated 是不考虑其他 gc root 时的估计值.
+
+    有 root 的闭包查询不到, 或者删除所有可删除的 root 估计也释放不了任何空间时
+    抛出 GcPlanError, 而不是把所有可删除的 root 都加入计划.
+    """
+    regex = re.compile(pattern)
+    plan = Plan(
+        save_num=min_keep,
+        policy=f"free {target} bytes",
+        pattern=pattern,
+        target=target,
+    )
+    kept_paths = [os.path.realpath(i) for i in protected]
+    candidates: List[Link] = []
+    for directory, auto in [(i, True) for i in auto_dirs] + [
+        (i, False) for i in profile_dirs
+    ]:
+        links = scan(directory)
+        plan.scanned += len(links)
+        dangling, kept, removable = _split_roots(links, regex, min_keep, auto)
+        plan.delete.extend(dangling)
+        kept_paths.extend(os.path.realpath(i.path) for i in kept)
+        candidates.extend(removable)
+    candidates.sort(key=lambda i: i.mtime)
+    candidate_paths = [os.path.realpath(i.path) for i in candidates]
+    closures = closure.query_closures(list(dict.fromkeys(kept_paths + candidate_paths)))
+    unknown = [p for p in candidate_paths if not closures.get(p)]
+    if unknown:
+        raise GcPlanError(
+            f"closure sizes of {len(unknown)} roots are unavailable, e.g. {unknown[0]}"
+        )
+    refcount: dict[str, int] = {}
+    sizes: dict[str, int] = {}
+    for store_path in kept_paths + candidate_paths:
+        for p, size in closures.get(store_path, {}).items():
+            refcount[p] = refcount.get(p, 0) + 1
+            sizes[p] = size
+    for link, store_path in zip(candidates, candidate_paths):
+        if plan.estimated >= target:
+            break
+        freed = 0
+        for p in closures.get(store_path, {}):
+            refcount[p] -= 1
+            if refcount[p] == 0:
+                freed += sizes[p]
+        plan.estimated += freed
+        matched = regex.match(link.name) or regex.match(os.path.basename(link.target))
+        generation = int(matched.group(2)) if matched else None
+        plan.delete.append(Entry(link.path, link.target, "free", generation, freed))
+    if candidates and plan.estimated == 0:
+        raise GcPlanError(
+            f"removing {len(candidates)} roots is estimated to free nothing,"
+            " their store paths are still referenced by the kept roots"
+        )
+    return plan
+
+
+def dump(plan: Plan, p: str) -> None:
+    path.json_write_atomic(p, plan.to_dict(), indent=2)
+
+
+def load(p: str) -> Plan:
+    "读取计划文件, 文件不存在或格式错误时抛出 OSError/ValueError"
+    with open(p, mode="r", encoding="utf-8") as f:
+        data = json.load(f)
+    try:
+        return Plan.from_dict(data)
+    except (TypeError, KeyError, AttributeError) as e:
+        raise ValueError(f"invalid plan {p}: {e}") from e
+
+
+def _unchanged(entry: Entry) -> bool:
+    try:
+        return os.readlink(entry.path) == entry.target
+    except OSError:
+        return False
+
+
+@trace.span("gc apply")
+def apply(
+    plan: Plan, dry_run: bool = False, batch_size: int = BATCH_SIZE
+) -> tuple[int, int]:
+    """执行计划, 返回 (删除的数量, 跳过的数量)
+
+    生成计划之后被删除或指向其他目标的链接会被跳过; 没有权限删除的链接每
+    batch_size 个合并为一条 sudo rm 命令.
+    """
+    entries = [i for i in plan.delete if _unchanged(i)]
+    skipped = len(plan.delete) - len(entries)
+    if dry_run:
+        return len(entries), skipped
+    removed = 0
+    for start in range(0, len(entries), batch_size):
+        denied = []
+        for entry in entries[start : start + batch_size]:
+            try:
+                os.unlink(entry.path)
+                removed += 1
+            except PermissionError:
+                denied.append(entry.path)
+            except FileNotFoundError:
+                skipped += 1
+        if denied:
+            result = cmd.run(["sudo", "rm", "-f", "--"] + denied, capture_output=True)
+            if result is not None and result.returncode == 0:
+                removed += len(denied)
+            else:
+                skipped += len(denied)
+    return removed, skipped
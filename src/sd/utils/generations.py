@@ -0,0 +1,150 @@
+# profiles 目录下 <name>-<N>-link 的索引: 用 os.scandir 只读取文件名,
+# 目录的 mtime 不变时直接复用, 变化时只为新增的版本创建记录;
+# 每条记录的 store 路径和创建时间在第一次访问时才读取.
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List
+
+from sd.utils import storedb, trace
+
+
+class Generation:
+    __slots__ = ("version", "link", "_path", "_created_at")
+
+    def __init__(
+        self,
+        version: int,
+        path: Path | None = None,
+        created_at: datetime | None = None,
+        link: str | None = None,
+    ):
+        self.version = version
+        self.link = link
+        self._path = path
+        self._created_at = created_at
+
+    @property
+    def path(self) -> Path:
+        "该版本对应的 store 路径"
+        if self._path is None:
+            assert self.link is not None
+            self._path = Path(os.path.realpath(self.link))
+        return self._path
+
+    @property
+    def created_at(self) -> datetime:
+        "store 数据库中的注册时间, 数据库不可读时使用 store 路径的 ctime"
+        if self._created_at is None:
+            self._created_at = storedb.registration_time(
+                self.path.as_posix()
+            ) or datetime.fromtimestamp(os.path.getctime(self.path))
+        return self._created_at
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Generation):
+            return NotImplemented
+        return self.version == other.version and self.path == other.path
+
+    def __repr__(self) -> str:
+        return f"Generation(version={self.version}, link={self.link!r})"
+
+
+class GenerationIndex:
+    """按版本号从新到旧排列的 generation 索引
+
+    current/previous/nth/get 都只是字典或列表的下标访问, 每次查询前只对目录做一次
+    stat, 目录没有变化时不会重新扫描.
+    """
+
+    def __init__(self, directory: Path, name: str, regex: re.Pattern | None = None):
+        self.directory = directory
+        self.name = name
+        self.regex = regex or re.compile(rf"{re.escape(name)}-(?P<number>\d+)-link")
+        self._mtime: int | None = None
+        self._by_version: dict[int, Generation] = {}
+        self._sorted: List[Generation] = []
+        self._position: dict[int, int] = {}
+
+    def _version(self, file_name: str) -> int | None:
+        result = self.regex.fullmatch(file_name)
+        return int(result.group("number")) if result else None
+
+    def refresh(self) -> None:
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime is not None and mtime == self._mtime:
+            return
+        with trace.span(f"scan {self.directory}"):
+            by_version: dict[int, Generation] = {}
+            try:
+                entries = list(os.scandir(self.directory)) if mtime is not None else []
+            except OSError:
+                entries = []
+            for entry in entries:
+                version = self._version(entry.name)
+                if version is None:
+                    continue
+                old = self._by_version.get(version)
+                by_version[version] = (
+                    old
+                    if old is not None and old.link == entry.path
+                    else Generation(version, link=entry.path)
+                )
+        self._mtime = mtime
+        self._by_version = by_version
+        self._sorted = [by_version[i] for i in sorted(by_version, reverse=True)]
+        self._position = {g.version: i for i, g in enumerate(self._sorted)}
+
+    def __iter__(self) -> Iterator[Generation]:
+        self.refresh()
+        return iter(self._sorted)
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self._sorted)
+
+    def get(self, version: int) -> Generation | None:
+        self.refresh()
+        return self._by_version.get(version)
+
+    def nth(self, n: int) -> Generation | None:
+        "第 n 新的版本, 0 为最新的版本"
+        self.refresh()
+        return self._sorted[n] if 0 <= n < len(self._sorted) else None
+
+    def current_version(self) -> int | None:
+        try:
+            target = os.readlink(os.path.join(self.directory, self.name))
+        except OSError:
+            return None
+        return self._version(os.path.basename(target))
+
+    def current(self) -> Generation | None:
+        "profile 链接当前指向的版本"
+        version = self.current_version()
+        return None if version is None else self.get(version)
+
+    def previous(self, generation: Generation | None = None) -> Generation | None:
+        "比 generation (默认为当前版本) 更旧的一个版本"
+        self.refresh()
+        generation = generation or self.current()
+        if generation is None or generation.version not in self._position:
+            return None
+        return self.nth(self._position[generation.version] + 1)
+
+
+_indexes: dict[tuple[Path, str], GenerationIndex] = {}
+
+
+def index(
+    directory: Path, name: str, regex: re.Pattern | None = None
+) -> GenerationIndex:
+    "同一个 profile 在进程内只建立一次索引"
+    key = (directory, name)
+    if key not in _indexes:
+        _indexes[key] = GenerationIndex(directory, name, regex)
+    return _indexes[key]
@@ -0,0 +1,246 @@
+# build/switch/update/gc 的耗时记录, 保存在 $XDG_STATE_HOME/sd/history.sqlite:
+# 每次执行一行, 包括主机, flake 的 git revision, flake.lock 的哈希, 各阶段耗时,
+# 构建和下载的数量以及退出码. 写入失败时忽略, 不影响命令本身.
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from subprocess import SubprocessError
+from typing import Iterator, List
+
+import click
+
+from sd.utils import cmd, path
+
+SCHEMA = """
+create table if not exists runs (
+    id integer primary key autoincrement,
+    command text not null,
+    host text not null,
+    flake_rev text not null,
+    lock_hash text not null,
+    started_at real not null,
+    duration real not null,
+    phases text not null,
+    built integer,
+    substituted integer,
+    status integer not null
+);
+create index if not exists runs_command on runs (command, host, started_at);
+"""
+
+
+@dataclass
+class Run:
+    command: str
+    host: str = ""
+    flake_rev: str = ""
+    lock_hash: str = ""
+    started_at: float = field(default_factory=time.time)
+    duration: float = 0.0
+    phases: dict[str, float] = field(default_factory=dict)
+    # 只有使用 --progress 时才知道构建和下载的数量
+    built: int | None = None
+    substituted: int | None = None
+    status: int = 0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def db_file() -> str:
+    return path.state_dir().joinpath("history.sqlite").as_posix()
+
+
+def connect() -> sqlite3.Connection:
+    p = db_file()
+    os.makedirs(os.path.dirname(p), exist_ok=True)
+    conn = sqlite3.connect(p)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def flake_rev(flake_path: str) -> str:
+    try:
+        return cmd.getout(["git", "-C", flake_path, "rev-parse", "HEAD"])
+    except (SubprocessError, OSError):
+        return ""
+
+
+def lock_hash(flake_path: str) -> str:
+    try:
+        with open(os.path.join(flake_path, "flake.lock"), mode="rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return ""
+
+
+def save(run: Run) -> None:
+    try:
+        with connect() as conn:
+            conn.execute(
+                "insert into runs (command, host, flake_rev, lock_hash, started_at,"
+                " duration, phases, built, substituted, status)"
+                " values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run.command,
+                    run.host,
+                    run.flake_rev,
+                    run.lock_hash,
+                    run.started_at,
+                    run.duration,
+                    json.dumps(run.phases),
+                    run.built,
+                    run.substituted,
+                    run.status,
+                ),
+            )
+        conn.close()
+    except (sqlite3.Error, OSError):
+        pass
+
+
+_current: Run | None = None
+
+
+def current() -> Run | None:
+    "正在记录的 Run, 没有时返回 None"
+    return _current
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    "把耗时累加到正在记录的 Run 的 name 阶段, 没有正在记录的 Run 时不做任何事"
+    run = _current
+    if run is None:
+        yield
+        return
+    with run.phase(name):
+        yield
+
+
+@contextmanager
+def record(
+    command: str, host: str = "", flake_path: str | None = None, enabled: bool = True
+) -> Iterator[Run]:
+    """记录一次执行, enabled 为 False (例如 --dry-run) 时不写入
+
+    typer.Exit/Abort 等异常的退出码会作为 status 记录, 异常会继续抛出.
+    """
+    global _current
+    run = Run(command, host)
+    start = time.perf_counter()
+    previous, _current = _current, run
+    try:
+        yield run
+    except click.exceptions.Exit as e:
+        run.status = e.exit_code
+        raise
+    except BaseException:
+        run.status = 1
+        raise
+    finally:
+        _current = previous
+        run.duration = time.perf_counter() - start
+        if flake_path and os.path.isdir(flake_path):
+            run.flake_rev = flake_rev(flake_path)
+            run.lock_hash = lock_hash(flake_path)
+        if enabled:
+            save(run)
+
+
+def load(
+    command: str | None = None, host: str | None = None, since: float = 0.0
+) -> List[Run]:
+    "按开始时间从旧到新返回记录"
+    if not os.path.isfile(db_file()):
+        return []
+    sql = "select command, host, flake_rev, lock_hash, started_at, duration,"
+    sql += " phases, built, substituted, status from runs where started_at >= ?"
+    args: List[str | float] = [since]
+    if command:
+        sql += " and command = ?"
+        args.append(command)
+    if host:
+        sql += " and host = ?"
+        args.append(host)
+    try:
+        conn = connect()
+        rows = conn.execute(sql + " order by started_at", args).fetchall()
+        conn.close()
+    except sqlite3.Error:
+        return []
+    return [
+        Run(
+            command=row[0],
+            host=row[1],
+            flake_rev=row[2],
+            lock_hash=row[3],
+            started_at=row[4],
+            duration=row[5],
+            phases=json.loads(row[6]),
+            built=row[7],
+            substituted=row[8],
+            status=row[9],
+        )
+        for row in rows
+    ]
+
+
+def percentile(values: List[float], p: float) -> float:
+    "最近秩法计算百分位数"
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(math.ceil(p * len(ordered) / 100), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+@dataclass
+class Summary:
+    command: str
+    host: str
+    count: int
+    failed: int
+    p50: float
+    p90: float
+    max: float
+    # 最近 window 次成功执行的平均耗时与之前 window 次的比值, 记录不足时为 None
+    trend: float | None = None
+
+
+def summarize(runs: List[Run], window: int = 5) -> List[Summary]:
+    groups: dict[tuple[str, str], List[Run]] = {}
+    for run in runs:
+        groups.setdefault((run.command, run.host), []).append(run)
+    result = []
+    for (command, host), items in sorted(groups.items()):
+        ok = [i.duration for i in items if i.status == 0]
+        trend = None
+        if len(ok) >= 2 * window:
+            recent = sum(ok[-window:]) / window
+            previous = sum(ok[-2 * window : -window]) / window
+            trend = recent / previous if previous else None
+        durations = [i.duration for i in items]
+        result.append(
+            Summary(
+                command,
+                host,
+                count=len(items),
+                failed=len(items) - len(ok),
+                p50=percentile(durations, 50),
+                p90=percentile(durations, 90),
+                max=max(durations),
+                trend=trend,
+            )
+        )
+    return result
@@ -0,0 +1,74 @@
+import importlib
+from dataclasses import dataclass
+from typing import Callable, List
+
+import click
+import typer
+from typer.core import TyperGroup
+
+from sd.utils import trace
+
+
+@dataclass
+class LazyCommand:
+    """只记录子命令的名称和帮助信息, 真正执行时才导入实现模块
+
+    target 的格式为 "module:attr", attr 为 typer.Typer 实例,
+    command 不为空时表示取该 Typer 中的同名子命令.
+    """
+
+    name: str
+    target: str
+    help: str = ""
+    command: str | None = None
+    hidden: bool | Callable[[], bool] = False
+    no_args_is_help: bool = False
+
+    def is_hidden(self) -> bool:
+        return self.hidden() if callable(self.hidden) else self.hidden
+
+    def stub(self) -> click.Command:
+        "仅用于帮助信息和补全列表的占位命令"
+        return click.Command(self.name, help=self.help, hidden=self.is_hidden())
+
+    def load(self) -> click.Command:
+        module_name, attr = self.target.split(":")
+        with trace.span(f"import {module_name}"):
+            module = importlib.import_module(module_name)
+        typer_app: typer.Typer = getattr(module, attr)
+        command = typer.main.get_command(typer_app)
+        if self.command is not None:
+            assert isinstance(command, click.Group)
+            command = command.commands[self.command]
+        command.name = self.name
+        command.help = self.help or command.help
+        command.hidden = self.is_hidden()
+        if isinstance(command, click.Group):
+            command.no_args_is_help = self.no_args_is_help
+        return command
+
+
+class LazyGroup(TyperGroup):
+    lazy_commands: dict[str, LazyCommand] = {}
+
+    def list_commands(self, ctx: click.Context) -> List[str]:
+        names = super().list_commands(ctx)
+        return names + [i for i in self.lazy_commands if i not in names]
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> click.Command | None:
+        command = super().get_command(ctx, cmd_name)
+        if command is None and cmd_name in self.lazy_commands:
+            return self.lazy_commands[cmd_name].stub()
+        return command
+
+    def resolve_command(self, ctx: click.Context, args: List[str]):
+        cmd_name = click.utils.make_str(args[0])
+        if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            self.commands[cmd_name] = self.lazy_commands[cmd_name].load()
+        return super().resolve_command(ctx, args)
+
+
+def lazy_group(commands: List[LazyCommand]) -> type[LazyGroup]:
+    return type(
+        "LazyGroup", (LazyGroup,), {"lazy_commands": {i.name: i for i in commands}}
+    )
@@ -0,0 +1,120 @@
+# 缓存结果很少变化的外部命令 (nix --version, mdls, osascript, git ls-remote).
+# 缓存键由命令本身和相关文件的 (dev, inode, mtime) 组成, 文件变化后自动失效;
+# 每条记录可以设置过期时间, 总条数超过 MAX_ENTRIES 时淘汰最久未使用的记录.
+import atexit
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, List
+
+from sd.utils import path, trace
+
+MEMO_VERSION = 1
+MAX_ENTRIES = 512
+
+_entries: dict[str, dict[str, Any]] | None = None
+_dirty = False
+_refresh = False
+_registered = False
+
+
+def memo_file() -> str:
+    return path.cache_dir().joinpath("memo.json").as_posix()
+
+
+def _load() -> dict[str, dict[str, Any]]:
+    global _entries
+    if _entries is None:
+        _entries = {} if _refresh else _read()
+    return _entries
+
+
+def _read() -> dict[str, dict[str, Any]]:
+    data = path.json_load_versioned(memo_file(), MEMO_VERSION)
+    if data is None:
+        return {}
+    entries = data.get("entries")
+    return entries if isinstance(entries, dict) else {}
+
+
+def flush() -> None:
+    "按最近使用时间保留 MAX_ENTRIES 条记录并写回缓存文件"
+    global _dirty
+    if not _dirty or _entries is None:
+        return
+    _dirty = False
+    now = time.time()
+    live = [
+        (k, v)
+        for k, v in _entries.items()
+        if v.get("expires") is None or v["expires"] > now
+    ]
+    live.sort(key=lambda i: i[1].get("used", 0), reverse=True)
+    entries = dict(live[:MAX_ENTRIES])
+    try:
+        path.json_write_atomic(
+            memo_file(), {"version": MEMO_VERSION, "entries": entries}
+        )
+    except OSError:
+        pass
+
+
+def _mark_dirty() -> None:
+    global _dirty, _registered
+    _dirty = True
+    if not _registered:
+        _registered = True
+        atexit.register(flush)
+
+
+@dataclass(frozen=True)
+class Memo:
+    """一条命令结果的缓存策略
+
+    ttl 为记录的有效秒数, 为空时永不过期; files 中任意文件变化时记录失效.
+    只适用于结果与当前工作目录无关的命令.
+    """
+
+    ttl: float | None = None
+    files: tuple[str | None, ...] = ()
+
+    def key(self, cmd: List[str] | str) -> str:
+        return json.dumps([cmd, [path.stat_key(i) for i in self.files]])
+
+    def get(self, cmd: List[str] | str) -> str | None:
+        entry = _load().get(self.key(cmd))
+        if entry is None or (
+            entry.get("expires") is not None and entry["expires"] <= time.time()
+        ):
+            trace.count("memo miss")
+            return None
+        trace.count("memo hit")
+        entry["used"] = time.time()
+        _mark_dirty()
+        value: str = entry["value"]
+        return value
+
+    def set(self, cmd: List[str] | str, value: str) -> None:
+        now = time.time()
+        _load()[self.key(cmd)] = {
+            "value": value,
+            "expires": None if self.ttl is None else now + self.ttl,
+            "used": now,
+        }
+        _mark_dirty()
+
+
+def refresh() -> None:
+    "忽略已有的缓存记录, 本进程内重新执行命令并覆盖缓存文件"
+    global _entries, _refresh
+    _entries = None
+    _refresh = True
+
+
+def reset() -> None:
+    global _entries, _dirty, _refresh, _registered
+    _entries = None
+    _dirty = False
+    _refresh = False
+    _registered = False
+    atexit.unregister(flush)
@@ -0,0 +1,197 @@
+# 解析 nix --log-format internal-json 的活动流: 每一行为 "@nix " 加上一个 JSON 对象,
+# 记录 activity 的开始/结束以及构建日志, 阶段和进度等结果. 终端上只显示一行进度,
+# 完整的日志写入文件.
+# @see https://github.com/NixOS/nix/blob/master/src/libutil/logging.hh
+import json
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List
+
+import typer
+
+from sd.utils import cmd, fmt, path
+
+# ActivityType
+ACT_FILE_TRANSFER = 101
+ACT_COPY_PATHS = 103
+ACT_BUILDS = 104
+ACT_BUILD = 105
+# ResultType
+RES_BUILD_LOG_LINE = 101
+RES_SET_PHASE = 104
+RES_PROGRESS = 105
+RES_POST_BUILD_LOG_LINE = 107
+# Verbosity, 不高于 LVL_WARN 的消息同时输出到终端
+LVL_WARN = 1
+
+PREFIX = "@nix "
+REFRESH_INTERVAL = 0.1
+DRV_NAME_RE = re.compile(r"^/nix/store/[0-9a-z]{32}-(.*?)(\.drv)?$")
+
+
+def drv_name(drv_path: str) -> str:
+    matched = DRV_NAME_RE.match(drv_path)
+    return matched.group(1) if matched else drv_path
+
+
+@dataclass
+class Counter:
+    "Builds/CopyPaths activity 的进度: 完成, 预计, 进行中, 失败的数量"
+
+    done: int = 0
+    expected: int = 0
+    running: int = 0
+    failed: int = 0
+
+
+@dataclass
+class Message:
+    text: str
+    # 构建日志和非 JSON 的行为 None, 否则为 nix 的日志级别
+    level: int | None = None
+
+
+@dataclass
+class Progress:
+    builds: Counter = field(default_factory=Counter)
+    copies: Counter = field(default_factory=Counter)
+    # 每个正在构建的 activity 的 (名称, 当前阶段)
+    running: dict[int, List[str]] = field(default_factory=dict)
+    transfers: dict[int, int] = field(default_factory=dict)
+    types: dict[int, int] = field(default_factory=dict)
+
+    @property
+    def bytes_fetched(self) -> int:
+        return sum(self.transfers.values())
+
+    def feed(self, line: str) -> Message | None:
+        "处理一行输出, 返回需要写入日志的消息"
+        if not line.startswith(PREFIX):
+            return Message(line)
+        try:
+            event = json.loads(line[len(PREFIX) :])
+        except ValueError:
+            return Message(line)
+        action = event.get("action")
+        fields = event.get("fields") or []
+        if action == "msg":
+            return Message(event.get("msg", ""), event.get("level", 0))
+        key = event.get("id", 0)
+        if action == "start":
+            kind = event.get("type", 0)
+            self.types[key] = kind
+            if kind == ACT_BUILD and fields:
+                self.running[key] = [drv_name(fields[0]), ""]
+            elif kind == ACT_FILE_TRANSFER:
+                self.transfers.setdefault(key, 0)
+            text = event.get("text")
+            return Message(text, event.get("level", 3)) if text else None
+        if action == "stop":
+            self.running.pop(key, None)
+            return None
+        if action != "result":
+            return None
+        kind = event.get("type")
+        if kind in (RES_BUILD_LOG_LINE, RES_POST_BUILD_LOG_LINE) and fields:
+            name = self.running.get(key, ["nix"])[0]
+            return Message(f"{name}> {fields[0]}")
+        if kind == RES_SET_PHASE and fields and key in self.running:
+            self.running[key][1] = fields[0]
+        elif kind == RES_PROGRESS and len(fields) >= 4:
+            activity = self.types.get(key)
+            if activity == ACT_FILE_TRANSFER:
+                self.transfers[key] = fields[0]
+            elif activity in (ACT_BUILDS, ACT_COPY_PATHS):
+                counter = self.builds if activity == ACT_BUILDS else self.copies
+                counter.done, counter.expected = fields[0], fields[1]
+                counter.running, counter.failed = fields[2], fields[3]
+        return None
+
+    def render(self, width: int = 80) -> str:
+        parts = [
+            f"[builds {self.builds.done}/{self.builds.expected}"
+            + (f", {self.builds.failed} failed" if self.builds.failed else "")
+            + "]",
+            f"[downloads {self.copies.done}/{self.copies.expected},"
+            f" {fmt.human_size(self.bytes_fetched)}]",
+        ]
+        parts += [
+            f"{name} ({phase})" if phase else name
+            for name, phase in self.running.values()
+        ]
+        line = " ".join(parts)
+        return line if len(line) <= width else line[: max(width - 3, 0)] + "..."
+
+
+def log_file(name: str) -> str:
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return path.cache_dir().joinpath("logs", f"{name}-{stamp}.log").as_posix()
+
+
+class _Status:
+    "终端为 tty 时在最后一行原地刷新进度, 否则不显示"
+
+    def __init__(self):
+        self.enabled = sys.stdout.isatty()
+        self.last = 0.0
+        self.shown = False
+
+    def clear(self):
+        if self.shown:
+            typer.echo("\r\033[K", nl=False)
+            self.shown = False
+
+    def update(self, progress: Progress):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if now - self.last < REFRESH_INTERVAL:
+            return
+        self.last = now
+        try:
+            width = os.get_terminal_size().columns
+        except OSError:
+            width = 80
+        typer.echo(f"\r\033[K{progress.render(width - 1)}", nl=False)
+        self.shown = True
+
+
+def run(
+    cmd_list: List[str],
+    log_path: str,
+    dry_run: bool = False,
+    progress: Progress | None = None,
+) -> int | None:
+    """执行带 --log-format internal-json 参数的 nix 命令并显示进度
+
+    警告, 错误以及不是 JSON 的输出 (例如激活脚本的输出) 同时显示在终端上,
+    所有输出都写入 log_path. 返回命令的退出码, dry_run 时返回 None.
+    传入 progress 时在其中累计进度, 便于调用者读取构建和下载的数量.
+    """
+    lines = cmd.stream(cmd_list, dry_run=dry_run, check=False, merge_stderr=True)
+    if dry_run:
+        return None
+    progress = progress if progress is not None else Progress()
+    status = _Status()
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    with open(log_path, mode="w", encoding="utf-8") as log:
+        for line in lines:
+            message = progress.feed(line)
+            if message is not None:
+                log.write(f"{message.text}\n")
+                if not line.startswith(PREFIX) or (
+                    message.level is not None and message.level <= LVL_WARN
+                ):
+                    status.clear()
+                    fmt.echo(message.text)
+            status.update(progress)
+    status.clear()
+    fmt.info(
+        f"{progress.builds.done} built, {progress.copies.done} fetched"
+        f" ({fmt.human_size(progress.bytes_fetched)}), full log: {log_path}"
+    )
+    return lines.returncode
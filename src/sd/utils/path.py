@@ -1,9 +1,7 @@
 import json
 import os
 from pathlib import Path
-from typing import Union
-
-from sd.utils import cmd
+from typing import Any, Union
 
 PathLink = Union[str, Path]
 
@@ -54,6 +52,9 @@ def mkdir(p: PathLink) -> None:
         try:
             os.makedirs(p)
         except PermissionError:
+            # path 不在模块级导入 cmd, 以免 cmd -> memo -> path 循环导入
+            from sd.utils import cmd
+
             cmd.getout(f"sudo mkdir -p {os.path.abspath(p)}")
 
 
@@ -68,9 +69,25 @@ def remove_file_or_link(p: PathLink) -> None:
         elif is_file(p):
             os.remove(p)
     except PermissionError:
+        from sd.utils import cmd
+
         cmd.getout(f"sudo rm -vf {os.path.abspath(p)}")
 
 
+def cache_dir() -> Path:
+    "sd 的缓存目录, 遵循 XDG_CACHE_HOME"
+    return Path(os.getenv("XDG_CACHE_HOME") or "~/.cache").expanduser().joinpath("sd")
+
+
+def state_dir() -> Path:
+    "sd 需要长期保留的数据目录, 遵循 XDG_STATE_HOME"
+    return (
+        Path(os.getenv("XDG_STATE_HOME") or "~/.local/state")
+        .expanduser()
+        .joinpath("sd")
+    )
+
+
 def json_write(p: PathLink, dic: dict, indent: int = 2) -> None:
     parent_dir = get_parent(p)
     mkdir(parent_dir)
@@ -85,3 +102,47 @@ def json_read(p: PathLink) -> dict[str, object] | None:
             data: dict[str, object] = json.load(f)
             return data
     return None
+
+
+def json_load(p: PathLink) -> Any:
+    "读取 JSON 文件, 文件不存在或损坏时返回 None"
+    try:
+        with open(p, mode="r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def json_load_versioned(p: PathLink, version: int) -> dict[str, Any] | None:
+    "读取 version 字段等于 version 的 JSON 对象, 否则返回 None"
+    data = json_load(p)
+    return data if isinstance(data, dict) and data.get("version") == version else None
+
+
+def json_write_atomic(p: PathLink, data: Any, indent: int | None = None) -> None:
+    """先写入同一目录下的临时文件再替换, 其他进程不会读到写了一半的文件
+
+    写入失败时删除临时文件并抛出 OSError.
+    """
+    p = os.path.abspath(p)
+    tmp = f"{p}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        with open(tmp, mode="w", encoding="utf-8") as f:
+            json.dump(data, f, indent=indent)
+        os.replace(tmp, p)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def stat_key(p: PathLink | None) -> list[int] | None:
+    "用于判断文件是否变化的 stat 信息, 路径为空或不存在时返回 None"
+    if not p:
+        return None
+    try:
+        st = os.stat(p)
+    except OSError:
+        return None
+    return [st.st_dev, st.st_ino, st.st_mtime_ns]
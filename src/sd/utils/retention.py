@@ -0,0 +1,72 @@
+# generation 的保留策略: 保留最新的 N 个, 最近若干天每天一个, 最近若干周每周一个,
+# 最近若干月每月一个; 每个时间段内保留最新的版本. 只在需要按时间分组时才读取创建时间.
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Iterable, List
+
+from sd.utils.generations import Generation
+
+
+@dataclass(frozen=True)
+class Policy:
+    keep_last: int = 1
+    daily: int = 0
+    weekly: int = 0
+    monthly: int = 0
+
+    def uses_time(self) -> bool:
+        return self.daily > 0 or self.weekly > 0 or self.monthly > 0
+
+    def describe(self) -> str:
+        rules = [f"last {self.keep_last}"]
+        for name, n in [("day", self.daily), ("week", self.weekly)]:
+            if n:
+                rules.append(f"1/{name} for {n} {name}s")
+        if self.monthly:
+            rules.append(f"1/month for {self.monthly} months")
+        return ", ".join(rules)
+
+
+def _monday(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def select(
+    generations: Iterable[Generation],
+    policy: Policy,
+    now: datetime | None = None,
+    protected: Iterable[str] = (),
+) -> set[int]:
+    """按策略返回需要保留的版本号
+
+    generations 按版本号从新到旧遍历一次; protected 中的 store 路径 (例如
+    booted-system) 对应的版本始终保留.
+    """
+    today = (now or datetime.now()).date()
+    this_week = _monday(today)
+    this_month = today.year * 12 + today.month
+    protected = set(protected)
+    keep: set[int] = set()
+    seen: dict[str, set] = {"day": set(), "week": set(), "month": set()}
+    ordered: List[Generation] = sorted(
+        generations, key=lambda g: g.version, reverse=True
+    )
+    for i, generation in enumerate(ordered):
+        if i < policy.keep_last or (
+            protected and generation.path.as_posix() in protected
+        ):
+            keep.add(generation.version)
+        if not policy.uses_time():
+            continue
+        created = generation.created_at.date()
+        week = _monday(created)
+        month = created.year * 12 + created.month
+        for name, key, in_window in [
+            ("day", created, (today - created).days < policy.daily),
+            ("week", week, (this_week - week).days // 7 < policy.weekly),
+            ("month", month, this_month - month < policy.monthly),
+        ]:
+            if in_window and key not in seen[name]:
+                seen[name].add(key)
+                keep.add(generation.version)
+    return keep
@@ -0,0 +1,180 @@
+# 常驻的 /bin/sh 协进程: 字符串命令通过 stdin 发送给同一个 shell 执行,
+# 每条命令在子 shell 中运行 (只需 fork, 不再 exec 新的 /bin/sh), 执行结束后 shell
+# 分别向 stdout/stderr 写入带随机标记的分隔行和退出码, 以此切分每条命令的输出.
+# 默认关闭, 设置 SD_SHELL_WORKER=1 后启用; 需要终端的命令 (sudo) 始终单独执行.
+import atexit
+import os
+import re
+import secrets
+import selectors
+import shlex
+import subprocess
+import threading
+from typing import List
+
+from sd.utils import trace
+
+ENABLE_VAR = "SD_SHELL_WORKER"
+POOL_SIZE = 4
+# worker 中命令的 stdin 为 /dev/null, sudo 无法在其中询问密码
+TTY_RE = re.compile(r"(^|[\s;&|(])sudo(\s|$)")
+
+
+def is_enabled() -> bool:
+    return os.getenv(ENABLE_VAR, "") not in ("", "0")
+
+
+def accepts(cmd_str: str) -> bool:
+    "worker 已启用并且命令不需要终端"
+    return is_enabled() and not TTY_RE.search(cmd_str)
+
+
+class ShellWorker:
+    """一个常驻的 /bin/sh 进程, 同一时间只执行一条命令
+
+    命令的 stdin 为 /dev/null, 工作目录为调用时 Python 进程的工作目录,
+    环境变量与启动 worker 时相同, 环境变量变化后需要重新启动 worker.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.env = dict(os.environ)
+        self.token = secrets.token_hex(8)
+        self.seq = 0
+        self.process = subprocess.Popen(
+            ["/bin/sh"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        trace.count("shell worker spawn")
+
+    def is_usable(self) -> bool:
+        return (
+            self.pid == os.getpid()
+            and self.process.poll() is None
+            and self.env == dict(os.environ)
+        )
+
+    def _script(self, cmd_str: str, marker: str, merge_stderr: bool) -> bytes:
+        redirect = " 2>&1" if merge_stderr else ""
+        return (
+            f"( cd -- {shlex.quote(os.getcwd())} && eval {shlex.quote(cmd_str)} )"
+            f" </dev/null{redirect}\n"
+            f"printf '\\n%s %d\\n' {marker} \"$?\"\n"
+            f"printf '\\n%s\\n' {marker} >&2\n"
+        ).encode()
+
+    def run(
+        self, cmd_str: str, merge_stderr: bool = False
+    ) -> subprocess.CompletedProcess:
+        self.seq += 1
+        marker = f"__sd_{self.token}_{self.seq}__"
+        assert self.process.stdin and self.process.stdout and self.process.stderr
+        self.process.stdin.write(self._script(cmd_str, marker, merge_stderr))
+        self.process.stdin.flush()
+        out_end = f"\n{marker} ".encode()
+        err_end = f"\n{marker}\n".encode()
+        buffers = {self.process.stdout: bytearray(), self.process.stderr: bytearray()}
+        done = {self.process.stdout: False, self.process.stderr: False}
+        returncode: int | None = None
+        with selectors.DefaultSelector() as selector:
+            for i in buffers:
+                selector.register(i, selectors.EVENT_READ)
+            while not all(done.values()):
+                for key, _ in selector.select():
+                    stream = key.fileobj
+                    chunk = os.read(key.fd, 65536)
+                    if not chunk:
+                        # worker 意外退出, 已经读到的输出即为该命令的结果
+                        selector.unregister(stream)
+                        done[stream] = True
+                        continue
+                    buf = buffers[stream]
+                    buf += chunk
+                    if stream is self.process.stdout:
+                        i = buf.rfind(out_end)
+                        if i != -1 and buf.endswith(b"\n"):
+                            status = buf[i + len(out_end) : -1]
+                            if status.isdigit():
+                                returncode = int(status)
+                                del buf[i:]
+                                done[stream] = True
+                                selector.unregister(stream)
+                    elif buf.endswith(err_end):
+                        del buf[-len(err_end) :]
+                        done[stream] = True
+                        selector.unregister(stream)
+        if returncode is None:
+            returncode = self.process.wait()
+        return subprocess.CompletedProcess(
+            cmd_str,
+            returncode,
+            bytes(buffers[self.process.stdout]),
+            bytes(buffers[self.process.stderr]),
+        )
+
+    def close(self, kill: bool = False) -> None:
+        if self.process.poll() is None:
+            if kill:
+                self.process.kill()
+            try:
+                assert self.process.stdin
+                self.process.stdin.close()
+            except OSError:
+                pass
+            self.process.wait()
+        for i in [self.process.stdout, self.process.stderr]:
+            if i:
+                i.close()
+
+
+_idle: List[ShellWorker] = []
+_lock = threading.Lock()
+_registered = False
+
+
+def _acquire() -> ShellWorker:
+    global _registered
+    with _lock:
+        while _idle:
+            worker = _idle.pop()
+            if worker.is_usable():
+                return worker
+            if worker.pid == os.getpid():
+                worker.close()
+        if not _registered:
+            _registered = True
+            atexit.register(shutdown)
+    return ShellWorker()
+
+
+def _release(worker: ShellWorker) -> None:
+    with _lock:
+        if len(_idle) < POOL_SIZE and worker.is_usable():
+            _idle.append(worker)
+            return
+    worker.close()
+
+
+def run(cmd_str: str, merge_stderr: bool = False) -> subprocess.CompletedProcess:
+    "在空闲的 worker 中执行命令, 返回包含 stdout, stderr 和退出码的结果"
+    start = trace.now()
+    worker = _acquire()
+    try:
+        result = worker.run(cmd_str, merge_stderr)
+    except BaseException:
+        # 中断后 worker 的输出流状态未知, 不再复用
+        worker.close(kill=True)
+        raise
+    _release(worker)
+    trace.record_completed(cmd_str, start, result)
+    return result
+
+
+def shutdown() -> None:
+    with _lock:
+        workers = [i for i in _idle if i.pid == os.getpid()]
+        _idle.clear()
+    for i in workers:
+        i.close()
@@ -0,0 +1,292 @@
+# 只读访问 nix store 数据库 (/nix/var/nix/db/db.sqlite): 路径信息, 引用关系,
+# 递归闭包和 NAR 大小都用批量 SQL 查询, 结果保存在进程内的 LRU 中;
+# 数据库无法读取时退回到 nix path-info 命令.
+# @see https://github.com/NixOS/nix/blob/master/src/libstore/schema.sql
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from subprocess import SubprocessError
+from typing import Generic, Iterable, List, TypeVar
+
+from sd.utils import cmd, trace
+
+# SQLite 3.32 之前每条语句最多 999 个参数
+BATCH_SIZE = 500
+INFO_CACHE_SIZE = 4096
+CLOSURE_CACHE_SIZE = 32
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class StoreDBError(Exception):
+    pass
+
+
+@dataclass
+class PathInfo:
+    path: str
+    nar_hash: str = ""
+    nar_size: int = 0
+    registration_time: int = 0
+    deriver: str | None = None
+    references: List[str] = field(default_factory=list)
+
+    @property
+    def registered_at(self) -> datetime:
+        return datetime.fromtimestamp(self.registration_time)
+
+
+class LRU(Generic[K, V]):
+    def __init__(self, size: int):
+        self.size = size
+        self._data: OrderedDict[K, V] = OrderedDict()
+
+    def get(self, key: K) -> V | None:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.size:
+            self._data.popitem(last=False)
+
+
+def db_path() -> str:
+    state_dir = os.environ.get("NIX_STATE_DIR", "/nix/var/nix")
+    return os.path.join(state_dir, "db", "db.sqlite")
+
+
+def _batches(items: List[str]) -> Iterable[List[str]]:
+    for start in range(0, len(items), BATCH_SIZE):
+        yield items[start : start + BATCH_SIZE]
+
+
+class StoreDB:
+    """以只读方式打开的 store 数据库
+
+    path_info 的结果中不包括不存在的路径; closure 的起点不存在时以及查询失败时
+    抛出 StoreDBError, 由调用者退回到 nix path-info.
+    """
+
+    def __init__(self, p: str):
+        self.path = p
+        try:
+            # 不能使用 immutable: 那样会忽略 WAL 中还没有 checkpoint 的新路径
+            uri = f"file:{p}?mode=ro"
+            self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self.conn.execute("SELECT 1 FROM ValidPaths LIMIT 1").fetchall()
+        except sqlite3.Error as e:
+            raise StoreDBError(f"{p}: {e}") from e
+        self._lock = threading.Lock()
+        self._infos: LRU[str, PathInfo] = LRU(INFO_CACHE_SIZE)
+        self._closures: LRU[tuple[str, ...], dict[str, int]] = LRU(CLOSURE_CACHE_SIZE)
+
+    def _query(self, sql: str, args: List[str]) -> List[tuple]:
+        with self._lock, trace.span("storedb query", rows=len(args)):
+            try:
+                return self.conn.execute(sql, args).fetchall()
+            except sqlite3.Error as e:
+                raise StoreDBError(f"{self.path}: {e}") from e
+
+    def path_info(self, paths: Iterable[str]) -> dict[str, PathInfo]:
+        "批量查询路径信息, 包括直接引用"
+        paths = list(dict.fromkeys(paths))
+        result = {}
+        missing = []
+        for p in paths:
+            info = self._infos.get(p)
+            if info is None:
+                missing.append(p)
+            else:
+                result[p] = info
+        trace.count("storedb hit", len(paths) - len(missing))
+        for batch in _batches(missing):
+            marks = ",".join("?" * len(batch))
+            rows = self._query(
+                "SELECT v.path, v.hash, v.narSize, v.registrationTime, v.deriver,"
+                " r.path FROM ValidPaths v"
+                " LEFT JOIN Refs ON Refs.referrer = v.id"
+                " LEFT JOIN ValidPaths r ON r.id = Refs.reference"
+                f" WHERE v.path IN ({marks})",
+                batch,
+            )
+            for p, nar_hash, size, registered, deriver, ref in rows:
+                info = result.get(p)
+                if info is None:
+                    info = result[p] = PathInfo(
+                        p, nar_hash, size or 0, registered, deriver
+                    )
+                if ref is not None:
+                    info.references.append(ref)
+        for p in missing:
+            if p in result:
+                result[p].references.sort()
+                self._infos.set(p, result[p])
+        return result
+
+    def references(self, p: str) -> List[str]:
+        info = self.path_info([p]).get(p)
+        return info.references if info else []
+
+    def closure(self, paths: Iterable[str]) -> dict[str, int]:
+        "递归闭包中所有的路径及其 NAR 大小"
+        key = tuple(sorted(set(paths)))
+        cached = self._closures.get(key)
+        if cached is not None:
+            trace.count("storedb hit")
+            return cached
+        result: dict[str, int] = {}
+        for batch in _batches(list(key)):
+            marks = ",".join("?" * len(batch))
+            rows = self._query(
+                "WITH RECURSIVE closure(id) AS ("
+                f" SELECT id FROM ValidPaths WHERE path IN ({marks})"
+                " UNION"
+                " SELECT Refs.reference FROM Refs"
+                " JOIN closure ON Refs.referrer = closure.id"
+                ") SELECT v.path, v.narSize FROM ValidPaths v"
+                " JOIN closure ON v.id = closure.id",
+                batch,
+            )
+            result.update((p, size or 0) for p, size in rows)
+        missing = [p for p in key if p not in result]
+        if missing:
+            raise StoreDBError(f"{self.path}: {missing[0]} is not registered")
+        self._closures.set(key, result)
+        return result
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+_dbs: dict[str, StoreDB | None] = {}
+
+
+def open_db(p: str | None = None) -> StoreDB | None:
+    "打开数据库, 无法读取时返回 None, 同一个文件在进程内只打开一次"
+    p = p or db_path()
+    if p not in _dbs:
+        try:
+            _dbs[p] = StoreDB(p) if os.path.isfile(p) else None
+        except StoreDBError:
+            _dbs[p] = None
+    return _dbs[p]
+
+
+def reset() -> None:
+    for i in _dbs.values():
+        if i is not None:
+            i.close()
+    _dbs.clear()
+
+
+def path_info_cmd(paths: List[str], recursive: bool = False) -> List[str]:
+    return (
+        ["nix", "--extra-experimental-features", "nix-command", "path-info", "--json"]
+        + (["--recursive"] if recursive else [])
+        + paths
+    )
+
+
+def parse_path_info(output: str | bytes) -> dict[str, PathInfo]:
+    "解析 nix path-info --json 的输出, 无效的路径不会出现在结果中"
+    data = json.loads(output)
+    # nix 2.19 之前输出列表, 之后输出以路径为键的字典 (无效路径的值为 null)
+    items = (
+        data
+        if isinstance(data, list)
+        else [{"path": k, **v} for k, v in data.items() if v]
+    )
+    return {
+        i["path"]: PathInfo(
+            i["path"],
+            i.get("narHash", ""),
+            i.get("narSize", 0),
+            i.get("registrationTime", 0),
+            i.get("deriver"),
+            sorted(i.get("references", [])),
+        )
+        for i in items
+        if i.get("valid", True)
+    }
+
+
+def _with_db(query, fallback):
+    db = open_db()
+    if db is not None:
+        try:
+            return query(db)
+        except StoreDBError:
+            pass
+    trace.count("storedb fallback")
+    return fallback()
+
+
+def _path_info_cli(paths: List[str]) -> dict[str, PathInfo]:
+    return parse_path_info(cmd.getout(path_info_cmd(paths))) if paths else {}
+
+
+def _path_info_db(db: StoreDB, paths: List[str]) -> dict[str, PathInfo]:
+    "数据库中没有的路径再用 nix path-info 查询一次, 仍然无效时不出现在结果中"
+    infos = db.path_info(paths)
+    missing = [p for p in paths if p not in infos]
+    if missing:
+        try:
+            infos.update(_path_info_cli(missing))
+        except (SubprocessError, ValueError, OSError):
+            pass
+    return infos
+
+
+def query_path_info(paths: Iterable[str]) -> dict[str, PathInfo]:
+    paths = list(paths)
+    return _with_db(lambda db: _path_info_db(db, paths), lambda: _path_info_cli(paths))
+
+
+def query_references(p: str) -> List[str]:
+    info = query_path_info([p]).get(p)
+    return info.references if info else []
+
+
+def _closure_cli(paths: List[str]) -> dict[str, int]:
+    if not paths:
+        return {}
+    infos = parse_path_info(cmd.getout(path_info_cmd(paths, recursive=True)))
+    missing = [p for p in paths if p not in infos]
+    if missing:
+        raise ValueError(f"{missing[0]} is not a valid store path")
+    return {k: v.nar_size for k, v in infos.items()}
+
+
+def query_closure(paths: Iterable[str]) -> dict[str, int]:
+    """闭包中所有路径及其 NAR 大小
+
+    任何一个起点不是有效的 store 路径时抛出 SubprocessError 或 ValueError,
+    找不到 nix 命令时抛出 OSError, 不会返回空的或不完整的闭包.
+    """
+    paths = list(paths)
+    return _with_db(lambda db: db.closure(paths), lambda: _closure_cli(paths))
+
+
+def closure_size(paths: Iterable[str]) -> int:
+    return sum(query_closure(paths).values())
+
+
+def registration_time(p: str) -> datetime | None:
+    "路径注册到 store 的时间, 只查询数据库, 数据库不可用时返回 None"
+    db = open_db()
+    if db is None:
+        return None
+    try:
+        info = db.path_info([p]).get(p)
+    except StoreDBError:
+        return None
+    return info.registered_at if info else None
@@ -0,0 +1,223 @@
+import atexit
+import json
+import os
+import subprocess
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, List
+
+import typer
+
+from sd.utils import fmt
+from sd.utils.enums import Colors
+
+
+@dataclass
+class Record:
+    kind: str
+    name: str
+    start: float
+    duration: float = 0.0
+    returncode: int | None = None
+    stdout_bytes: int | None = None
+    stderr_bytes: int | None = None
+    depth: int = 0
+    args: dict = field(default_factory=dict)
+
+
+_enabled = False
+_trace_file: str | None = None
+_origin = time.perf_counter()
+_depth = 0
+records: List[Record] = []
+counters: dict[str, int] = {}
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable(trace_file: str | None = None) -> None:
+    "开启记录, 进程退出时输出汇总, trace_file 不为空时写入 Chrome trace JSON"
+    global _enabled, _trace_file
+    if trace_file:
+        _trace_file = trace_file
+    if not _enabled:
+        _enabled = True
+        atexit.register(report)
+
+
+def disable() -> None:
+    global _enabled, _trace_file
+    _enabled = False
+    _trace_file = None
+    records.clear()
+    counters.clear()
+    atexit.unregister(report)
+
+
+def from_argv(args: List[str]) -> None:
+    "在导入 app 之前解析根命令的 --trace/--trace-file, 以便记录导入阶段的探测"
+    for i, arg in enumerate(args):
+        if not arg.startswith("-"):
+            return
+        if arg == "--trace":
+            enable()
+        elif arg.startswith("--trace-file="):
+            enable(arg.partition("=")[2])
+        elif arg == "--trace-file" and i + 1 < len(args):
+            enable(args[i + 1])
+
+
+def now() -> float:
+    return time.perf_counter()
+
+
+def _size(out: bytes | str | int | None) -> int | None:
+    if out is None or isinstance(out, int):
+        return out
+    return len(out.encode() if isinstance(out, str) else out)
+
+
+def record_process(
+    cmd_str: str,
+    start: float,
+    returncode: int | None,
+    stdout: bytes | str | int | None = None,
+    stderr: bytes | str | int | None = None,
+) -> None:
+    "stdout/stderr 可以是输出内容, 也可以是已经统计好的字节数"
+    if not _enabled:
+        return
+    records.append(
+        Record(
+            kind="process",
+            name=cmd_str,
+            start=start,
+            duration=now() - start,
+            returncode=returncode,
+            stdout_bytes=_size(stdout),
+            stderr_bytes=_size(stderr),
+            depth=_depth,
+        )
+    )
+
+
+def record_completed(
+    cmd_str: str, start: float, process: subprocess.CompletedProcess
+) -> None:
+    record_process(cmd_str, start, process.returncode, process.stdout, process.stderr)
+
+
+def count(name: str, n: int = 1) -> None:
+    "累加计数器, 例如缓存的命中/未命中次数"
+    if _enabled:
+        counters[name] = counters.get(name, 0) + n
+
+
+@contextmanager
+def span(name: str, **args) -> Iterator[None]:
+    "记录一段 Python 代码的耗时, 也可以作为装饰器使用"
+    global _depth
+    if not _enabled:
+        yield
+        return
+    record = Record(kind="span", name=name, start=now(), depth=_depth, args=args)
+    records.append(record)
+    _depth += 1
+    try:
+        yield
+    finally:
+        _depth -= 1
+        record.duration = now() - record.start
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.1f}ms"
+
+
+def summary() -> List[str]:
+    lines = []
+    for i in sorted(records, key=lambda r: r.duration, reverse=True):
+        rc = "" if i.returncode is None else f"rc={i.returncode}"
+        out = "" if i.stdout_bytes is None else f"out={i.stdout_bytes}B"
+        err = "" if i.stderr_bytes is None else f"err={i.stderr_bytes}B"
+        lines.append(
+            f"{fmt.str_rjust(_ms(i.duration), 10)}  {fmt.str_ljust(i.kind, 7)}  "
+            f"{fmt.str_ljust(rc, 6)}  {fmt.str_ljust(out, 10)}  "
+            f"{fmt.str_ljust(err, 10)}  {'  ' * i.depth}{i.name}"
+        )
+    return lines
+
+
+def chrome_trace() -> dict:
+    pid = os.getpid()
+    end = (now() - _origin) * 1e6
+    return {
+        "traceEvents": [
+            {
+                "name": name,
+                "ph": "C",
+                "ts": end,
+                "pid": pid,
+                "tid": 0,
+                "args": {"count": value},
+            }
+            for name, value in counters.items()
+        ]
+        + [
+            {
+                "name": i.name,
+                "cat": i.kind,
+                "ph": "X",
+                "ts": (i.start - _origin) * 1e6,
+                "dur": i.duration * 1e6,
+                "pid": pid,
+                "tid": 0,
+                "args": {
+                    **i.args,
+                    **{
+                        k: v
+                        for k, v in [
+                            ("returncode", i.returncode),
+                            ("stdout_bytes", i.stdout_bytes),
+                            ("stderr_bytes", i.stderr_bytes),
+                        ]
+                        if v is not None
+                    },
+                },
+            }
+            for i in records
+        ],
+        "displayTimeUnit": "ms",
+    }
+
+
+def report() -> None:
+    if not records and not counters:
+        return
+    processes = [i for i in records if i.kind == "process"]
+    total = sum(i.duration for i in processes)
+    typer.secho(
+        f"TRACE: {len(processes)} processes, {_ms(total)} in subprocesses, "
+        f"{_ms(now() - _origin)} since startup",
+        fg=Colors.INFO.value,
+        err=True,
+    )
+    if counters:
+        typer.secho(
+            "TRACE: " + ", ".join(f"{k}={v}" for k, v in sorted(counters.items())),
+            fg=Colors.INFO.value,
+            err=True,
+        )
+    for line in summary():
+        typer.echo(line, err=True)
+    if _trace_file:
+        with open(_trace_file, mode="w", encoding="utf-8") as f:
+            json.dump(chrome_trace(), f)
+        typer.secho(
+            f"TRACE: chrome trace written to {_trace_file}",
+            fg=Colors.INFO.value,
+            err=True,
+        )
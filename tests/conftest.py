@@ -0,0 +1,38 @@
+import subprocess
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    from sd.utils import completion, facts, memo, shell, storedb
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path / "state"))
+    # 使用一次性的 /bin/sh, 便于 mock subprocess, shell worker 单独测试
+    monkeypatch.delenv(shell.ENABLE_VAR, raising=False)
+    # 不读取本机的 nix store 数据库
+    monkeypatch.setenv("NIX_STATE_DIR", str(tmp_path / "nix"))
+    facts.reset()
+    memo.reset()
+    storedb.reset()
+    completion.load_table.cache_clear()
+    yield
+    facts.reset()
+    memo.reset()
+    storedb.reset()
+    completion.load_table.cache_clear()
+
+
+@pytest.fixture
+def repo(tmp_path):
+    "只有 flake.nix 和 flake.lock 的 git 仓库, 已经提交一次"
+    p = tmp_path / "flake"
+    p.mkdir()
+    (p / "flake.nix").write_text("{ }\n")
+    (p / "flake.lock").write_text("{}\n")
+    git = ["git", "-C", str(p), "-c", "user.name=sd", "-c", "user.email=sd@localhost"]
+    subprocess.run(["git", "init", "-q", str(p)], check=True)
+    subprocess.run(git + ["add", "."], check=True)
+    subprocess.run(git + ["commit", "-q", "-m", "init"], check=True)
+    return p
@@ -0,0 +1,42 @@
+from unittest.mock import patch
+
+
+class TestKey:
+    def test_clean_and_dirty(self, repo):
+        from sd.utils.artifacts import key
+
+        first = key(str(repo), "a", ["nixosConfigurations"])
+        assert first is not None
+        assert key(str(repo), "a", ["nixosConfigurations"]) == first
+        assert key(str(repo), "b", ["nixosConfigurations"]) != first
+        (repo / "flake.nix").write_text("{ a = 1; }\n")
+        assert key(str(repo), "a", ["nixosConfigurations"]) is None
+        (repo / "flake.nix").write_text("{ }\n")
+        assert key(str(repo), "a", ["nixosConfigurations"]) == first
+
+    def test_not_git(self, tmp_path):
+        from sd.utils.artifacts import key
+
+        assert key(str(tmp_path), "a", []) is None
+
+
+class TestSaveLookup:
+    def test_lookup_only_existing_paths(self, tmp_path):
+        from sd.utils import artifacts
+
+        out = tmp_path / "toplevel"
+        out.mkdir()
+        artifacts.save("k1", str(out))
+        artifacts.save("k2", str(tmp_path / "collected"))
+        assert artifacts.lookup("k1") == str(out)
+        assert artifacts.lookup("k2") is None
+        assert artifacts.lookup("k3") is None
+
+    def test_keeps_newest(self, tmp_path):
+        from sd.utils import artifacts
+
+        with patch("sd.utils.artifacts.MAX_ENTRIES", 2):
+            for i in range(3):
+                artifacts.save(f"k{i}", str(tmp_path))
+        assert artifacts.lookup("k0") is None
+        assert artifacts.lookup("k2") == str(tmp_path)
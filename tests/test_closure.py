@@ -0,0 +1,133 @@
+import json
+from unittest.mock import patch
+
+HASH = "0" * 32
+
+
+def store(name):
+    return f"/nix/store/{HASH}-{name}"
+
+
+BEFORE = {
+    store("system"): 10,
+    store("firefox-120.0"): 100,
+    store("bash-5.2"): 20,
+    store("bash-5.2-man"): 5,
+    store("removed-1.0"): 30,
+}
+AFTER = {
+    store("system"): 10,
+    store("firefox-121.0"): 110,
+    store("bash-5.2"): 20,
+    store("bash-5.2-man"): 5,
+    store("added-2.0"): 40,
+}
+
+
+class TestParsePackages:
+    def test_parse_packages(self):
+        from sd.utils.closure import parse_packages
+
+        result = parse_packages(
+            [store("python3-3.11.7"), store("foo-bar-1.0-man"), store("source")]
+        )
+        assert result == {"python3": {"3.11.7"}, "foo-bar": {"1.0"}, "source": {""}}
+
+
+class TestCompute:
+    def test_compute(self):
+        from sd.utils.closure import compute
+
+        result = compute(BEFORE, AFTER)
+        assert result.added == {"added": ["2.0"]}
+        assert result.removed == {"removed": ["1.0"]}
+        assert result.changed == {"firefox": (["120.0"], ["121.0"])}
+        assert (result.paths_before, result.paths_after) == (5, 5)
+        assert result.size_delta == 20
+
+
+class TestQueryClosure:
+    @patch("sd.utils.storedb.cmd")
+    def test_query_closure_list_format(self, mock_cmd):
+        from sd.utils.closure import query_closure
+
+        mock_cmd.getout.return_value = json.dumps(
+            [{"path": store("a-1.0"), "narSize": 5}]
+        )
+        assert query_closure(store("a-1.0")) == {store("a-1.0"): 5}
+
+    @patch("sd.utils.storedb.cmd")
+    def test_query_closure_dict_format(self, mock_cmd):
+        from sd.utils.closure import query_closure
+
+        mock_cmd.getout.return_value = json.dumps(
+            {store("a-1.0"): {"narSize": 5}, store("b"): None}
+        )
+        assert query_closure(store("a-1.0")) == {store("a-1.0"): 5}
+
+    @patch("sd.utils.closure.cmd")
+    def test_query_closures_skips_failures(self, mock_cmd):
+        from sd.utils.closure import query_closures
+        from sd.utils.cmd import Result
+
+        mock_cmd.run_many.return_value = [
+            Result([], 0, json.dumps({store("a"): {"narSize": 5}}).encode(), b""),
+            Result([], 1, b"", b"error"),
+        ]
+        assert query_closures([store("a"), store("b")]) == {
+            store("a"): {store("a"): 5},
+            store("b"): {},
+        }
+
+
+class TestDiff:
+    @patch("sd.utils.closure.query_closure")
+    def test_diff_is_cached_permanently(self, mock_query):
+        from sd.utils import closure
+
+        mock_query.side_effect = [BEFORE, AFTER]
+        first = closure.diff(store("system-1"), store("system-2"))
+        second = closure.diff(store("system-1"), store("system-2"))
+        assert first == second
+        assert mock_query.call_count == 2
+
+
+class TestSizes:
+    @patch("sd.utils.closure.query_closure")
+    def test_sizes(self, mock_query):
+        from sd.utils.closure import sizes
+
+        closures = {
+            "g1": {store("base"): 100, store("a"): 10},
+            "g2": {store("base"): 100, store("a"): 10, store("b"): 50},
+            "g3": {store("base"): 100, store("c"): 5},
+        }
+        mock_query.side_effect = lambda p: closures[p]
+        result = sizes(["g1", "g2", "g3"])
+        assert [(i.size, i.delta, i.unique) for i in result] == [
+            (110, None, 0),
+            (160, 50, 50),
+            (105, -55, 5),
+        ]
+        # 闭包按路径永久缓存
+        sizes(["g3", "g2", "g1"])
+        assert mock_query.call_count == 3
+
+    @patch("sd.utils.closure.query_closure")
+    def test_failed_query(self, mock_query):
+        from subprocess import SubprocessError
+
+        from sd.utils.closure import sizes
+
+        mock_query.side_effect = [{store("a"): 1}, SubprocessError, {store("a"): 1}]
+        result = sizes(["g1", "g2", "g3"])
+        assert [(i.size, i.delta) for i in result] == [(1, None), (0, None), (1, None)]
+
+    @patch("sd.utils.storedb.open_db", return_value=None)
+    @patch("sd.utils.cmd.getout", side_effect=FileNotFoundError("nix"))
+    def test_missing_nix(self, mock_getout, mock_db):
+        from sd.utils.closure import sizes
+
+        result = sizes([store("g1")])
+        assert [(i.size, i.delta) for i in result] == [(0, None)]
+        assert mock_getout.called
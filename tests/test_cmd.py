@@ -45,25 +45,195 @@ class TestRun:
         mock_run.assert_not_called()
 
 
+class TestRunMany:
+    def test_run_many_keeps_submission_order(self):
+        from sd.utils.cmd import run_many
+
+        results = run_many(
+            ["sleep 0.2; echo slow", "echo fast", ["printf", "list"]],
+            capture_output=True,
+        )
+        assert [i.stdout for i in results if i] == [b"slow\n", b"fast\n", b"list"]
+
+    def test_run_many_runs_concurrently(self):
+        import time
+
+        from sd.utils.cmd import run_many
+
+        start = time.perf_counter()
+        results = run_many([["sleep", "0.3"]] * 4, limit=4)
+        assert time.perf_counter() - start < 1.0
+        assert all(i and i.returncode == 0 for i in results)
+
+    def test_run_many_timeout(self):
+        from sd.utils.cmd import run_many
+
+        (result,) = run_many([["sleep", "5"]], timeout=0.1)
+        assert result is not None
+        assert result.timed_out
+        assert result.returncode != 0
+
+    def test_run_many_reports_failure(self):
+        from sd.utils.cmd import run_many
+
+        (result,) = run_many(["exit 3"])
+        assert result is not None
+        assert result.returncode == 3
+
+    @patch("sd.utils.cmd.strfmt")
+    def test_run_many_prefixes(self, mock_strfmt):
+        from sd.utils.cmd import run_many
+
+        results = run_many(
+            ["echo a1; echo a2 >&2", ["sh", "-c", "echo b1; exit 2"]],
+            prefixes=["a | ", "b | "],
+        )
+        lines = sorted(i[0][0] for i in mock_strfmt.echo.call_args_list)
+        assert lines == ["a | a1", "a | a2", "b | b1"]
+        assert [i.returncode for i in results if i] == [0, 2]
+
+    @patch("sd.utils.cmd.strfmt")
+    @patch("asyncio.create_subprocess_exec")
+    def test_run_many_dry_run(self, mock_exec, mock_strfmt):
+        from sd.utils.cmd import run_many
+
+        assert run_many([["echo", "a"], ["echo", "b"]], dry_run=True) == [None, None]
+        assert mock_strfmt.info.call_count == 2
+        mock_exec.assert_not_called()
+
+
+class TestStream:
+    def test_stream_yields_lines(self):
+        from sd.utils.cmd import stream
+
+        lines = stream(["printf", "a\\nb\\n"])
+        assert list(lines) == ["a", "b"]
+        assert lines.returncode == 0
+
+    def test_stream_is_incremental(self):
+        import time
+
+        from sd.utils.cmd import stream
+
+        start = time.perf_counter()
+        for line in stream("echo first; sleep 5; echo second"):
+            assert line == "first"
+            break
+        assert time.perf_counter() - start < 2.0
+
+    def test_stream_raises_on_failure(self):
+        from sd.utils.cmd import stream
+
+        lines = stream("echo partial; exit 2")
+        with pytest.raises(subprocess.SubprocessError):
+            for _ in lines:
+                pass
+        assert lines.returncode == 2
+
+    def test_stream_without_check(self):
+        from sd.utils.cmd import stream
+
+        lines = stream("echo partial; exit 2", check=False)
+        assert list(lines) == ["partial"]
+        assert lines.returncode == 2
+
+    @patch("sd.utils.cmd.strfmt")
+    def test_stream_tee(self, mock_strfmt):
+        from sd.utils.cmd import stream
+
+        assert list(stream(["echo", "hello"], tee=True)) == ["hello"]
+        mock_strfmt.echo.assert_called_once_with("hello")
+
+    @patch("subprocess.Popen")
+    def test_stream_dry_run(self, mock_popen):
+        from sd.utils.cmd import stream
+
+        lines = stream(["echo", "hello"], dry_run=True)
+        assert list(lines) == []
+        assert lines.returncode is None
+        mock_popen.assert_not_called()
+
+
+def _make_executable(directory, name):
+    p = directory / name
+    p.write_text("#!/bin/sh\n")
+    p.chmod(0o755)
+    return p
+
+
 class TestExists:
-    @patch("sd.utils.cmd.run")
-    def test_exists_returns_true_when_command_found(self, mock_run):
+    def test_exists_returns_true_when_command_found(self, tmp_path, monkeypatch):
         from sd.utils.cmd import exists
 
-        mock_run.return_value = subprocess.CompletedProcess(
-            args=["env", "type", "ls"], returncode=0, stdout=b""
-        )
+        _make_executable(tmp_path, "ls")
+        monkeypatch.setenv("PATH", str(tmp_path))
         assert exists("ls") is True
 
-    @patch("sd.utils.cmd.run")
-    def test_exists_returns_false_when_command_not_found(self, mock_run):
+    def test_exists_returns_false_when_command_not_found(self, tmp_path, monkeypatch):
         from sd.utils.cmd import exists
 
-        mock_run.return_value = subprocess.CompletedProcess(
-            args=["env", "type", "nonexistent"], returncode=1, stdout=b""
-        )
+        monkeypatch.setenv("PATH", str(tmp_path))
         assert exists("nonexistent") is False
 
+    @patch("subprocess.run")
+    def test_exists_does_not_spawn_process(self, mock_run, tmp_path, monkeypatch):
+        from sd.utils.cmd import exists
+
+        monkeypatch.setenv("PATH", str(tmp_path))
+        exists("ls")
+        mock_run.assert_not_called()
+
+
+class TestWhich:
+    def test_which_ignores_non_executable(self, tmp_path, monkeypatch):
+        from sd.utils.cmd import which
+
+        (tmp_path / "plain").write_text("")
+        monkeypatch.setenv("PATH", str(tmp_path))
+        assert which("plain") is None
+
+    def test_which_respects_path_order(self, tmp_path, monkeypatch):
+        from sd.utils.cmd import which
+
+        first, second = tmp_path / "a", tmp_path / "b"
+        first.mkdir()
+        second.mkdir()
+        _make_executable(second, "tool")
+        expected = _make_executable(first, "tool")
+        monkeypatch.setenv("PATH", f"{first}:{second}")
+        assert which("tool") == str(expected)
+
+    def test_which_invalidates_when_path_changes(self, tmp_path, monkeypatch):
+        from sd.utils.cmd import which
+
+        first, second = tmp_path / "a", tmp_path / "b"
+        first.mkdir()
+        second.mkdir()
+        expected = _make_executable(second, "tool")
+        monkeypatch.setenv("PATH", str(first))
+        assert which("tool") is None
+        monkeypatch.setenv("PATH", str(second))
+        assert which("tool") == str(expected)
+
+    def test_rehash_picks_up_new_files(self, tmp_path, monkeypatch):
+        from sd.utils.cmd import rehash, which
+
+        monkeypatch.setenv("PATH", str(tmp_path))
+        assert which("late") is None
+        expected = _make_executable(tmp_path, "late")
+        rehash()
+        assert which("late") == str(expected)
+
+    def test_which_all(self, tmp_path, monkeypatch):
+        from sd.utils.cmd import which_all
+
+        expected = _make_executable(tmp_path, "nix")
+        monkeypatch.setenv("PATH", str(tmp_path))
+        assert which_all(["nix", "missing"]) == {
+            "nix": str(expected),
+            "missing": None,
+        }
+
 
 class TestTest:
     @patch("sd.utils.cmd.run")
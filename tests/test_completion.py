@@ -0,0 +1,119 @@
+import os
+from unittest.mock import patch
+
+import typer
+
+
+def _make_app():
+    app = typer.Typer()
+
+    @app.command(help="builds the specified flake output")
+    def build(
+        host: str = typer.Argument("", help="the hostname to build"),
+        dry_run: bool = typer.Option(False, help="Test the result"),
+    ):
+        pass
+
+    @app.command(help="run garbage collection")
+    def gc(save: int = typer.Option(3, "--save", "-s", help="Save builds")):
+        pass
+
+    @app.command(help="secret", hidden=True)
+    def hidden():
+        pass
+
+    return app
+
+
+def _tree():
+    from sd.utils import completion
+
+    completion.save_table(_make_app())
+    return completion.load_table()
+
+
+class TestTable:
+    def test_save_and_load_table(self):
+        tree = _tree()
+        assert tree is not None
+        assert set(tree["commands"]) == {"build", "gc", "hidden"}
+
+    def test_table_invalidated_when_path_changes(self, tmp_path):
+        from sd.utils import completion
+
+        _tree()
+        completion.load_table.cache_clear()
+        with patch.dict(os.environ, {"PATH": str(tmp_path)}):
+            assert completion.load_table() is None
+
+
+class TestGetCompletions:
+    def test_subcommands(self):
+        from sd.utils.completion import get_completions
+
+        result = get_completions(_tree(), [], "")
+        assert [i[0] for i in result] == ["build", "gc"]
+
+    def test_options(self):
+        from sd.utils.completion import get_completions
+
+        result = get_completions(_tree(), ["gc"], "--s")
+        assert result == [("--save", "Save builds")]
+
+    def test_used_option_not_repeated(self):
+        from sd.utils.completion import get_completions
+
+        result = get_completions(_tree(), ["build", "--dry-run"], "--d")
+        assert result == []
+
+    def test_option_value_falls_back(self):
+        from sd.utils.completion import get_completions
+
+        assert get_completions(_tree(), ["gc", "--save"], "") is None
+
+    def test_argument_falls_back(self):
+        from sd.utils.completion import get_completions
+
+        assert get_completions(_tree(), ["build"], "") is None
+
+    def test_unknown_command_falls_back(self):
+        from sd.utils.completion import get_completions
+
+        assert get_completions(_tree(), ["missing"], "") is None
+
+
+class TestFastComplete:
+    def test_zsh_output(self, capsys):
+        from sd.utils import completion
+
+        _tree()
+        env = {"_SD_COMPLETE": "complete_zsh", "_TYPER_COMPLETE_ARGS": "sd g"}
+        with patch.dict(os.environ, env):
+            assert completion.fast_complete() == 0
+        assert capsys.readouterr().out == (
+            '_arguments \'*: :(("gc":"run garbage collection"))\'\n'
+        )
+
+    def test_bash_output(self, capsys):
+        from sd.utils import completion
+
+        _tree()
+        env = {"_SD_COMPLETE": "complete_bash", "COMP_WORDS": "sd ", "COMP_CWORD": "1"}
+        with patch.dict(os.environ, env):
+            assert completion.fast_complete() == 0
+        assert capsys.readouterr().out == "build\ngc\n"
+
+    def test_without_table_returns_none(self):
+        from sd.utils import completion
+
+        completion.load_table.cache_clear()
+        env = {"_SD_COMPLETE": "complete_zsh", "_TYPER_COMPLETE_ARGS": "sd "}
+        with patch.dict(os.environ, env):
+            assert completion.fast_complete() is None
+
+    def test_source_instruction_returns_none(self):
+        from sd.utils import completion
+
+        _tree()
+        with patch.dict(os.environ, {"_SD_COMPLETE": "source_zsh"}):
+            assert completion.fast_complete() is None
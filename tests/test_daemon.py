@@ -0,0 +1,97 @@
+import os
+import socket
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def runtime(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    monkeypatch.delenv("SD_NO_DAEMON", raising=False)
+    os.makedirs(tmp_path / "sd")
+    return tmp_path
+
+
+def _fake_daemon(reply: bytes):
+    from sd.utils.daemon import read_line, socket_path
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path())
+    listener.listen(1)
+    received = {}
+
+    def serve():
+        conn, _ = listener.accept()
+        data, fds, _, _ = socket.recv_fds(conn, 65536, 3)
+        received["request"] = read_line(conn, data)
+        received["fds"] = len(fds)
+        for i in fds:
+            os.close(i)
+        conn.sendall(reply)
+        conn.close()
+        listener.close()
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    return thread, received
+
+
+class TestShouldForward:
+    def test_without_socket(self, runtime):
+        from sd.utils.daemon import should_forward
+
+        assert should_forward(["bid", "get"]) is False
+
+    def test_only_allowed_commands(self, runtime):
+        from sd.utils.daemon import should_forward, socket_path
+
+        open(socket_path(), "w").close()
+        assert should_forward(["--trace", "sc", "status"]) is True
+        assert should_forward(["switch"]) is False
+
+    def test_disabled_by_env(self, runtime, monkeypatch):
+        from sd.utils.daemon import should_forward, socket_path
+
+        open(socket_path(), "w").close()
+        monkeypatch.setenv("SD_NO_DAEMON", "1")
+        assert should_forward(["sc", "status"]) is False
+
+
+class TestForward:
+    def test_returns_exit_code(self, runtime):
+        from sd.utils.daemon import forward
+
+        thread, received = _fake_daemon(b"exit 3\n")
+        assert forward(["sc", "status"]) == 3
+        thread.join()
+        assert received["fds"] == 3
+        assert b'"argv": ["sc", "status"]' in received["request"]
+
+    def test_fallback(self, runtime):
+        from sd.utils.daemon import forward
+
+        thread, _ = _fake_daemon(b"fallback\n")
+        assert forward(["env"]) is None
+        thread.join()
+
+    def test_stale_socket_falls_back(self, runtime):
+        from sd.utils.daemon import forward, socket_path
+
+        open(socket_path(), "w").close()
+        assert forward(["env"]) is None
+
+
+class TestSameState:
+    def test_path_env_mismatch(self, monkeypatch, tmp_path):
+        from sd.api.daemon import path_env, same_state
+        from sd.utils import completion, facts
+
+        stamp = completion.source_stamp()
+        fingerprint = facts.fingerprint()
+        env = path_env()
+        assert same_state(stamp, fingerprint, env)
+        monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path / "other"))
+        assert not same_state(stamp, fingerprint, env)
+        monkeypatch.delenv("NIX_STATE_DIR")
+        assert not same_state(stamp, fingerprint, path_env() | {"NIX_STATE_DIR": "/x"})
@@ -0,0 +1,50 @@
+import json
+from unittest.mock import MagicMock
+
+
+class TestFacts:
+    def test_get_computes_once_and_persists(self):
+        from sd.utils import facts
+
+        compute = MagicMock(return_value="value")
+        assert facts.get("key", compute) == "value"
+        facts.reset()
+        assert facts.get("key", compute) == "value"
+        compute.assert_called_once()
+
+    def test_fingerprint_change_invalidates(self, tmp_path, monkeypatch):
+        from sd.utils import facts
+
+        facts.get("key", lambda: "old")
+        facts.reset()
+        monkeypatch.setenv("PATH", str(tmp_path))
+        assert facts.get("key", lambda: "new") == "new"
+
+    def test_corrupt_cache_falls_back(self):
+        from sd.utils import facts
+
+        facts.get("key", lambda: "old")
+        with open(facts.facts_file(), mode="w") as f:
+            f.write("{not json")
+        facts.reset()
+        assert facts.get("key", lambda: "new") == "new"
+        with open(facts.facts_file()) as f:
+            assert json.load(f)["facts"] == {"key": "new"}
+
+    def test_refresh_ignores_cache(self):
+        from sd.utils import facts
+
+        facts.get("key", lambda: "old")
+        facts.refresh()
+        assert facts.get("key", lambda: "new") == "new"
+
+    def test_dotfiles_dir_change_invalidates(self, tmp_path, monkeypatch):
+        from sd.utils import facts
+
+        dotfiles = tmp_path / "dotfiles"
+        dotfiles.mkdir()
+        monkeypatch.setenv("DOTFILES", str(dotfiles))
+        facts.get("key", lambda: "old")
+        facts.reset()
+        (dotfiles / "flake.nix").write_text("")
+        assert facts.get("key", lambda: "new") == "new"
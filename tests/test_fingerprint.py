@@ -0,0 +1,50 @@
+import subprocess
+
+
+class TestCompute:
+    def test_blob_id_matches_git(self, repo):
+        from sd.utils.fingerprint import blob_id
+
+        expected = subprocess.run(
+            ["git", "hash-object", str(repo / "flake.nix")],
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+        assert blob_id(str(repo / "flake.nix")) == expected
+        assert blob_id(str(repo / "missing")) == ""
+
+    def test_changes(self, repo):
+        from sd.utils.fingerprint import compute
+
+        first = compute(str(repo), "a", [])
+        assert first is not None
+        assert compute(str(repo), "a", []) == first
+        assert compute(str(repo), "b", []) != first
+        assert compute(str(repo), "a", ["--impure"]) != first
+        # 未跟踪的文件不影响 flake
+        (repo / "untracked.nix").write_text("x")
+        assert compute(str(repo), "a", []) == first
+        (repo / "flake.nix").write_text("{ a = 1; }\n")
+        changed = compute(str(repo), "a", [])
+        assert changed != first
+        (repo / "flake.nix").write_text("{ }\n")
+        assert compute(str(repo), "a", []) == first
+
+    def test_not_git(self, tmp_path):
+        from sd.utils.fingerprint import compute
+
+        assert compute(str(tmp_path), "a", []) is None
+        assert compute("github:owner/repo", "a", []) is None
+
+
+class TestState:
+    def test_save_and_unchanged(self):
+        from sd.utils import fingerprint
+
+        assert not fingerprint.unchanged("a", "f1", "/nix/store/x")
+        fingerprint.save("a", "f1", "/nix/store/x")
+        fingerprint.save("b", "f2", "/nix/store/y")
+        assert fingerprint.unchanged("a", "f1", "/nix/store/x")
+        assert not fingerprint.unchanged("a", "f1", "/nix/store/z")
+        assert not fingerprint.unchanged("a", "f2", "/nix/store/x")
+        assert fingerprint.unchanged("b", "f2", "/nix/store/y")
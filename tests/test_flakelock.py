@@ -0,0 +1,146 @@
+import json
+import os
+
+import pytest
+
+LOCK = {
+    "nodes": {
+        "root": {
+            "inputs": {
+                "nixpkgs": "nixpkgs",
+                "home-manager": "home-manager",
+                "darwin": "darwin",
+            }
+        },
+        "nixpkgs": {
+            "locked": {
+                "type": "github",
+                "owner": "NixOS",
+                "repo": "nixpkgs",
+                "rev": "abc",
+                "narHash": "sha256-a",
+                "lastModified": 1700000000,
+            },
+            "original": {"type": "github", "owner": "NixOS", "repo": "nixpkgs"},
+        },
+        "home-manager": {
+            "inputs": {"nixpkgs": ["nixpkgs"]},
+            "locked": {"type": "github", "owner": "nix-community", "repo": "hm"},
+        },
+        "darwin": {
+            "inputs": {"nixpkgs": "nixpkgs_2", "utils": ["home-manager", "nixpkgs"]},
+            "locked": {"type": "github", "owner": "LnL7", "repo": "nix-darwin"},
+        },
+        "nixpkgs_2": {
+            "locked": {"type": "github", "owner": "NixOS", "repo": "nixpkgs"},
+        },
+        "orphan": {},
+    },
+    "root": "root",
+    "version": 7,
+}
+
+
+def write_lock(directory, data=LOCK):
+    p = directory / "flake.lock"
+    p.write_text(json.dumps(data))
+    return p
+
+
+class TestFlakeLock:
+    def test_root_inputs(self):
+        from sd.utils.flakelock import FlakeLock
+
+        assert FlakeLock(LOCK).root_inputs() == ["nixpkgs", "home-manager", "darwin"]
+
+    def test_follows_resolution(self):
+        from sd.utils.flakelock import FlakeLock
+
+        lock = FlakeLock(LOCK)
+        assert lock.inputs("home-manager") == {"nixpkgs": "nixpkgs"}
+        assert lock.inputs("darwin") == {"nixpkgs": "nixpkgs_2", "utils": "nixpkgs"}
+        assert lock.follows("home-manager", "nixpkgs") == ["nixpkgs"]
+        assert lock.follows("darwin", "nixpkgs") is None
+        assert lock.node("darwin/utils").key == "nixpkgs"
+
+    def test_locked_info(self):
+        from sd.utils.flakelock import FlakeLock
+
+        node = FlakeLock(LOCK).nodes["nixpkgs"]
+        assert node.rev == "abc"
+        assert node.nar_hash == "sha256-a"
+        assert node.last_modified is not None
+        assert node.source == "github:NixOS/nixpkgs"
+
+    def test_reverse_deps(self):
+        from sd.utils.flakelock import FlakeLock
+
+        lock = FlakeLock(LOCK)
+        assert sorted(lock.reverse_deps("nixpkgs")) == [
+            ("darwin", "utils"),
+            ("home-manager", "nixpkgs"),
+            ("root", "nixpkgs"),
+        ]
+
+    def test_walk_and_unreachable(self):
+        from sd.utils.flakelock import FlakeLock
+
+        lock = FlakeLock(LOCK)
+        assert [i for i, _ in lock.walk()] == [
+            ["nixpkgs"],
+            ["home-manager"],
+            ["darwin"],
+            ["darwin", "nixpkgs"],
+        ]
+        assert lock.unreachable() == ["orphan"]
+
+    def test_broken_follows(self):
+        from sd.utils.flakelock import FlakeLock, FlakeLockError
+
+        data = json.loads(json.dumps(LOCK))
+        data["nodes"]["home-manager"]["inputs"]["nixpkgs"] = ["missing"]
+        with pytest.raises(FlakeLockError):
+            FlakeLock(data).inputs("home-manager")
+
+    def test_follows_cycle(self):
+        from sd.utils.flakelock import FlakeLock, FlakeLockError
+
+        data = {"nodes": {"root": {"inputs": {"a": ["b"], "b": ["a"]}}}}
+        with pytest.raises(FlakeLockError):
+            FlakeLock(data).inputs()
+
+
+class TestLoad:
+    def test_load_caches_by_stat(self, tmp_path):
+        from sd.utils import flakelock
+
+        write_lock(tmp_path)
+        assert flakelock.load(tmp_path) is flakelock.load(tmp_path)
+
+    def test_load_reuses_when_only_mtime_changes(self, tmp_path):
+        from sd.utils import flakelock
+
+        p = write_lock(tmp_path)
+        lock = flakelock.load(tmp_path)
+        os.utime(p, ns=(1, 1))
+        assert flakelock.load(tmp_path) is lock
+
+    def test_load_reparses_on_change(self, tmp_path):
+        from sd.utils import flakelock
+
+        lock = flakelock.load(write_lock(tmp_path).parent)
+        data = json.loads(json.dumps(LOCK))
+        del data["nodes"]["root"]["inputs"]["darwin"]
+        write_lock(tmp_path, data)
+        new_lock = flakelock.load(tmp_path)
+        assert new_lock is not lock
+        assert new_lock.root_inputs() == ["nixpkgs", "home-manager"]
+
+    def test_load_missing_or_invalid(self, tmp_path):
+        from sd.utils import flakelock
+
+        with pytest.raises(flakelock.FlakeLockError):
+            flakelock.load(tmp_path)
+        (tmp_path / "flake.lock").write_text("{not json")
+        with pytest.raises(flakelock.FlakeLockError):
+            flakelock.load(tmp_path)
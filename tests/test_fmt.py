@@ -53,6 +53,35 @@ class TestMaxSize:
         assert max_size(["a"]) == 1
 
 
+class TestHumanSize:
+    def test_human_size(self):
+        from sd.utils.fmt import human_size
+
+        assert human_size(512) == "512 B"
+        assert human_size(1536) == "1.5 KiB"
+        assert human_size(3 * 1024**3) == "3.0 GiB"
+        assert human_size(2048 * 1024**4) == "2048.0 TiB"
+
+    def test_human_size_sign(self):
+        from sd.utils.fmt import human_size
+
+        assert human_size(1024**2, sign=True) == "+1.0 MiB"
+        assert human_size(-(1024**2), sign=True) == "-1.0 MiB"
+        assert human_size(0, sign=True) == "+0 B"
+
+    def test_parse_size(self):
+        import pytest
+
+        from sd.utils.fmt import parse_size
+
+        assert parse_size("512") == 512
+        assert parse_size("50G") == 50 * 1024**3
+        assert parse_size("1.5 TiB") == int(1.5 * 1024**4)
+        assert parse_size("20mb") == 20 * 1024**2
+        with pytest.raises(ValueError):
+            parse_size("lots")
+
+
 class TestStrFormatting:
     def test_str_len_with_wide_characters(self):
         from sd.utils.fmt import str_len
@@ -0,0 +1,191 @@
+import os
+from unittest.mock import patch
+
+
+def make_tree(tmp_path):
+    store = tmp_path / "store"
+    store.mkdir()
+    profiles = tmp_path / "profiles"
+    profiles.mkdir()
+    for i in [1, 2, 3, 4]:
+        (store / f"system-{i}").mkdir()
+        (profiles / f"system-{i}-link").symlink_to(store / f"system-{i}")
+    (profiles / "system").symlink_to("system-1-link")
+    (profiles / "gone-1-link").symlink_to(store / "missing")
+    project = tmp_path / "project"
+    project.mkdir()
+    for i in [1, 2, 3]:
+        (project / f"result-{i}-link").symlink_to(store / "system-1")
+    (project / "result").symlink_to(store / "system-2")
+    auto = tmp_path / "auto"
+    auto.mkdir()
+    (auto / "a").symlink_to(project / "result-1-link")
+    (auto / "b").symlink_to(project / "result-2-link")
+    (auto / "c").symlink_to(project / "result")
+    (auto / "d").symlink_to(tmp_path / "deleted-result")
+    (auto / "e").symlink_to(project / "result-3-link")
+    return auto, profiles
+
+
+class TestBuild:
+    def test_plan(self, tmp_path):
+        from sd.utils import gcplan
+        from sd.utils.retention import Policy
+
+        auto, profiles = make_tree(tmp_path)
+        plan = gcplan.build([str(auto)], [str(profiles)], Policy(keep_last=2))
+        deleted = {os.path.relpath(i.path, tmp_path): i.reason for i in plan.delete}
+        # 当前版本 system-1 始终保留
+        assert deleted == {
+            "auto/d": "dangling",
+            "auto/a": "old",
+            "profiles/gone-1-link": "dangling",
+            "profiles/system-2-link": "old",
+        }
+        assert plan.scanned == 11
+
+    def test_protected_store_path(self, tmp_path):
+        from sd.utils import gcplan
+        from sd.utils.retention import Policy
+
+        auto, profiles = make_tree(tmp_path)
+        plan = gcplan.build(
+            [],
+            [str(profiles)],
+            Policy(keep_last=1),
+            protected=[str(tmp_path / "store" / "system-2")],
+        )
+        deleted = sorted(os.path.basename(i.path) for i in plan.delete)
+        assert deleted == ["gone-1-link", "system-3-link"]
+
+    def test_missing_directory(self, tmp_path):
+        from sd.utils import gcplan
+        from sd.utils.retention import Policy
+
+        plan = gcplan.build([str(tmp_path / "none")], [], Policy(keep_last=1))
+        assert plan.delete == [] and plan.scanned == 0
+
+
+class TestBuildFree:
+    def test_oldest_roots_until_target(self, tmp_path):
+        from sd.utils import gcplan
+
+        auto, profiles = make_tree(tmp_path)
+        store = tmp_path / "store"
+        # system-3 比 system-2 更早创建, 应当先被删除
+        for i, mtime in [(2, 200), (3, 100), (4, 300)]:
+            os.utime(
+                profiles / f"system-{i}-link", (mtime, mtime), follow_symlinks=False
+            )
+        closures = {
+            str(store / f"system-{i}"): {f"system-{i}": 100 * i, "shared": 1000}
+            for i in [1, 2, 3, 4]
+        }
+
+        def query(paths):
+            return {p: closures.get(p, {}) for p in paths}
+
+        with patch("sd.utils.gcplan.closure.query_closures", side_effect=query):
+            plan = gcplan.build_free([], [str(profiles)], 250, min_keep=1)
+            freed = [(os.path.basename(i.path), i.size) for i in plan.delete]
+            assert freed == [("gone-1-link", 0), ("system-3-link", 300)]
+            assert plan.estimated == 300 and plan.target == 250
+
+            plan = gcplan.build_free([], [str(profiles)], 10**6, min_keep=1)
+            freed = [(os.path.basename(i.path), i.size) for i in plan.delete]
+            # system-4 为最新版本, system-1 为当前版本, 均保留; shared 仍被引用
+            assert freed == [
+                ("gone-1-link", 0),
+                ("system-3-link", 300),
+                ("system-2-link", 200),
+            ]
+            assert plan.delete[1].generation == 3
+
+    def test_auto_roots_without_version_are_candidates(self, tmp_path):
+        from sd.utils import gcplan
+
+        auto, profiles = make_tree(tmp_path)
+
+        def query(paths):
+            return {p: {p: 10} for p in paths}
+
+        with patch("sd.utils.gcplan.closure.query_closures", side_effect=query):
+            plan = gcplan.build_free([str(auto)], [], 10**6, min_keep=1)
+        deleted = sorted(os.path.basename(i.path) for i in plan.delete)
+        assert deleted == ["a", "b", "c", "d"]
+        # 只有 c 指向的 system-2 不再被保留的 root (e) 引用
+        assert plan.estimated == 10
+
+    def test_refuses_without_sizes(self, tmp_path):
+        import pytest
+
+        from sd.utils import gcplan
+
+        auto, profiles = make_tree(tmp_path)
+        # 闭包查询失败时不能把所有可删除的 root 都加入计划
+        with patch("sd.utils.gcplan.closure.query_closures", return_value={}):
+            with pytest.raises(gcplan.GcPlanError, match="unavailable"):
+                gcplan.build_free([str(auto)], [], 1, min_keep=1)
+
+        def shared(paths):
+            return {p: {"shared": 100} for p in paths}
+
+        with patch("sd.utils.gcplan.closure.query_closures", side_effect=shared):
+            with pytest.raises(gcplan.GcPlanError, match="free nothing"):
+                gcplan.build_free([], [str(profiles)], 1, min_keep=1)
+
+
+class TestDumpLoad:
+    def test_roundtrip(self, tmp_path):
+        from sd.utils import gcplan
+        from sd.utils.retention import Policy
+
+        auto, profiles = make_tree(tmp_path)
+        plan = gcplan.build([str(auto)], [str(profiles)], Policy(keep_last=1))
+        p = str(tmp_path / "out" / "plan.json")
+        gcplan.dump(plan, p)
+        assert gcplan.load(p) == plan
+
+    def test_invalid(self, tmp_path):
+        import pytest
+
+        from sd.utils import gcplan
+
+        p = tmp_path / "plan.json"
+        p.write_text('{"version": 0}')
+        with pytest.raises(ValueError):
+            gcplan.load(str(p))
+        p.write_text('{"version": 1, "delete": [{"bad": 1}]}')
+        with pytest.raises(ValueError):
+            gcplan.load(str(p))
+
+
+class TestApply:
+    def test_apply_skips_changed_links(self, tmp_path):
+        from sd.utils import gcplan
+        from sd.utils.retention import Policy
+
+        auto, profiles = make_tree(tmp_path)
+        plan = gcplan.build([str(auto)], [str(profiles)], Policy(keep_last=2))
+        os.remove(auto / "a")
+        os.remove(auto / "d")
+        (auto / "d").symlink_to(tmp_path / "elsewhere")
+        assert gcplan.apply(plan, dry_run=True) == (2, 2)
+        assert gcplan.apply(plan, batch_size=1) == (2, 2)
+        assert not os.path.lexists(profiles / "system-2-link")
+        assert os.path.lexists(auto / "d")
+
+    def test_permission_denied_uses_sudo_batches(self, tmp_path):
+        from sd.utils import gcplan
+        from sd.utils.retention import Policy
+
+        auto, profiles = make_tree(tmp_path)
+        plan = gcplan.build([str(auto)], [], Policy(keep_last=1))
+        with (
+            patch("os.unlink", side_effect=PermissionError),
+            patch("sd.utils.cmd.run") as mock_run,
+        ):
+            mock_run.return_value.returncode = 0
+            assert gcplan.apply(plan, batch_size=2) == (3, 0)
+        assert mock_run.call_count == 2
+        assert mock_run.call_args_list[0][0][0][:4] == ["sudo", "rm", "-f", "--"]
@@ -0,0 +1,68 @@
+import os
+from unittest.mock import patch
+
+
+def make_profiles(directory, versions, current):
+    for i in versions:
+        store = directory / f"store-{i}"
+        store.mkdir(exist_ok=True)
+        (directory / f"system-{i}-link").symlink_to(store)
+    (directory / "system").symlink_to(f"system-{current}-link")
+    (directory / "unrelated-1-link").symlink_to(directory / "store-1")
+
+
+class TestGenerationIndex:
+    def test_order_and_lookup(self, tmp_path):
+        from sd.utils.generations import GenerationIndex
+
+        make_profiles(tmp_path, [1, 2, 3, 12], current=3)
+        index = GenerationIndex(tmp_path, "system")
+        assert [i.version for i in index] == [12, 3, 2, 1]
+        assert index.nth(0).version == 12
+        assert index.nth(4) is None
+        assert index.current().version == 3
+        assert index.previous().version == 2
+        assert index.get(12).path == tmp_path / "store-12"
+
+    def test_refresh_only_when_directory_changes(self, tmp_path):
+        from sd.utils.generations import GenerationIndex
+
+        make_profiles(tmp_path, [1, 2], current=2)
+        index = GenerationIndex(tmp_path, "system")
+        first = index.get(1)
+        with patch("os.scandir") as mock_scandir:
+            assert len(index) == 2
+            mock_scandir.assert_not_called()
+        (tmp_path / "store-3").mkdir()
+        (tmp_path / "system-3-link").symlink_to(tmp_path / "store-3")
+        os.utime(tmp_path, ns=(1, 1))
+        assert [i.version for i in index] == [3, 2, 1]
+        # 已有的记录在重新扫描后保留
+        assert index.get(1) is first
+
+    def test_timestamps_are_lazy(self, tmp_path):
+        from sd.utils.generations import GenerationIndex
+
+        make_profiles(tmp_path, [1], current=1)
+        index = GenerationIndex(tmp_path, "system")
+        with (
+            patch("os.path.getctime") as mock_getctime,
+            patch("os.path.realpath") as mock_realpath,
+        ):
+            list(index)
+            mock_getctime.assert_not_called()
+            mock_realpath.assert_not_called()
+        assert index.get(1).created_at is not None
+
+    def test_missing_directory(self, tmp_path):
+        from sd.utils.generations import GenerationIndex
+
+        index = GenerationIndex(tmp_path / "missing", "system")
+        assert list(index) == []
+        assert index.current() is None
+        assert index.previous() is None
+
+    def test_records_use_slots(self):
+        from sd.utils.generations import Generation
+
+        assert not hasattr(Generation(1, link="/x"), "__dict__")
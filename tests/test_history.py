@@ -0,0 +1,79 @@
+import pytest
+import typer
+
+
+def make_runs(durations, command="switch", host="a", status=0):
+    from sd.utils.history import Run
+
+    return [
+        Run(command, host, started_at=float(n), duration=d, status=status)
+        for n, d in enumerate(durations)
+    ]
+
+
+class TestRecord:
+    def test_record_and_load(self, tmp_path):
+        from sd.utils import history
+
+        flake = tmp_path / "flake"
+        flake.mkdir()
+        (flake / "flake.lock").write_text("{}")
+        with history.record("switch", "a", str(flake)) as run:
+            assert history.current() is run
+            with history.phase("rebuild"):
+                pass
+            run.built, run.substituted = 3, 7
+        assert history.current() is None
+        with history.record("build", "b", enabled=False):
+            pass
+        runs = history.load()
+        assert len(runs) == 1
+        saved = runs[0]
+        assert (saved.command, saved.host, saved.status) == ("switch", "a", 0)
+        assert (saved.built, saved.substituted) == (3, 7)
+        assert list(saved.phases) == ["rebuild"]
+        assert len(saved.lock_hash) == 64
+        assert history.load(command="build") == []
+        assert history.load(host="a")[0].duration == saved.duration
+
+    def test_exit_status(self):
+        from sd.utils import history
+
+        with pytest.raises(typer.Exit):
+            with history.record("gc"):
+                raise typer.Exit(2)
+        with pytest.raises(RuntimeError):
+            with history.record("gc"):
+                raise RuntimeError
+        assert [i.status for i in history.load()] == [2, 1]
+
+    def test_phase_without_record(self):
+        from sd.utils import history
+
+        with history.phase("plan"):
+            pass
+        assert history.load() == []
+
+
+class TestSummarize:
+    def test_percentile(self):
+        from sd.utils.history import percentile
+
+        values = [5.0, 1.0, 4.0, 2.0, 3.0]
+        assert percentile(values, 50) == 3.0
+        assert percentile(values, 90) == 5.0
+        assert percentile(values, 0) == 1.0
+        assert percentile([], 50) == 0.0
+
+    def test_summarize(self):
+        from sd.utils.history import summarize
+
+        runs = make_runs([10.0] * 5 + [20.0] * 5)
+        runs += make_runs([99.0], status=1)
+        runs += make_runs([1.0, 2.0], command="build", host="b")
+        build, switch = summarize(runs)
+        assert (build.command, build.host, build.count) == ("build", "b", 2)
+        assert build.trend is None
+        assert (switch.count, switch.failed, switch.max) == (11, 1, 99.0)
+        assert switch.p50 == 20.0
+        assert switch.trend == 2.0
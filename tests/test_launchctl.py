@@ -6,8 +6,8 @@ class TestGetAllService:
     def test_get_all_service(self, mock_cmd):
         from sd.api.launchctl import get_all_service
 
-        mock_cmd.getout.return_value = (
-            "PID\tStatus\tLabel\n123\t0\torg.nixos.test-service"
+        mock_cmd.stream.return_value = iter(
+            ["PID\tStatus\tLabel", "123\t0\torg.nixos.test-service"]
         )
         result = get_all_service()
         assert "test-service" in result
@@ -63,6 +63,22 @@ class TestLaunchctlCommands:
         mock_cmd.run.return_value = MagicMock(stdout=b"123")
         restart("test", dry_run=True)
 
+    @patch("sd.api.launchctl._get_uid", return_value="501")
+    @patch("sd.api.launchctl.get_all_service", return_value=["a", "b"])
+    @patch("sd.api.launchctl.cmd")
+    def test_restart_all_service(self, mock_cmd, mock_get_all, mock_uid):
+        from sd.api.launchctl import restart
+
+        mock_cmd.run_many.return_value = [None, None]
+        restart("", all_service=True, dry_run=True)
+        mock_cmd.run_many.assert_called_once_with(
+            [
+                ["launchctl", "kickstart", "-k", "gui/501/org.nixos.a"],
+                ["launchctl", "kickstart", "-k", "gui/501/org.nixos.b"],
+            ],
+            dry_run=True,
+        )
+
     @patch("sd.api.launchctl.cmd")
     @patch("sd.api.launchctl.get_service")
     def test_start_service(self, mock_get_service, mock_cmd):
@@ -79,6 +95,28 @@ class TestLaunchctlCommands:
         mock_get_service.return_value = "org.nixos.test"
         stop("test", dry_run=True)
 
+    @patch("sd.api.launchctl.fmt")
+    @patch("sd.api.launchctl.cmd")
+    def test_status_parses_streamed_output(self, mock_cmd, mock_fmt):
+        from sd.api.launchctl import status
+
+        mock_cmd.stream.return_value = iter(
+            [
+                "{",
+                '\t"Label" = "org.nixos.test";',
+                '\t"LastExitStatus" = 0;',
+                '\t"PID" = 123;',
+                '\t"ProgramArguments" = (',
+                '\t\t"/bin/test";',
+                "\t);",
+                "};",
+            ]
+        )
+        status("org.nixos.test")
+        out = mock_fmt.term_fmt_by_dict.call_args[0][0]
+        assert out["PID"] == 123
+        assert out["ProgramArguments"] == ["/bin/test"]
+
 
 class TestPyValueFunctions:
     def test_py_value_true(self):
@@ -0,0 +1,93 @@
+import subprocess
+import sys
+
+import typer
+from typer.testing import CliRunner
+
+
+def _make_app():
+    from sd.utils.lazy import LazyCommand, lazy_group
+
+    commands = [
+        LazyCommand("env", "sd.api.env:app", help="save shell environment variable"),
+        LazyCommand(
+            "hide", "sd.api.env:app", help="hidden command", hidden=lambda: True
+        ),
+    ]
+    app = typer.Typer(cls=lazy_group(commands), no_args_is_help=True)
+
+    @app.callback()
+    def callback():
+        pass
+
+    @app.command(help="eager command")
+    def eager():
+        pass
+
+    return app
+
+
+class TestLazyCommand:
+    def test_stub_uses_registered_help(self):
+        from sd.utils.lazy import LazyCommand
+
+        stub = LazyCommand("env", "sd.api.env:app", help="save env").stub()
+        assert stub.name == "env"
+        assert stub.help == "save env"
+
+    def test_hidden_callable(self):
+        from sd.utils.lazy import LazyCommand
+
+        assert LazyCommand("x", "m:a", hidden=lambda: True).is_hidden() is True
+        assert LazyCommand("x", "m:a").is_hidden() is False
+
+    def test_load_subcommand_of_typer_app(self):
+        from sd.utils.lazy import LazyCommand
+
+        command = LazyCommand("keep", "sd.api.env:app", command="save").load()
+        assert command.name == "keep"
+        assert command.help == "save environment var on file!"
+
+
+class TestLazyGroup:
+    def test_help_lists_lazy_commands_in_order(self):
+        result = CliRunner().invoke(_make_app(), ["--help"])
+        assert result.exit_code == 0
+        assert "eager" in result.output
+        assert "save shell environment variable" in result.output
+        assert "hidden command" not in result.output
+        assert result.output.index("eager") < result.output.index("env")
+
+    def test_resolve_command_loads_real_command(self):
+        result = CliRunner().invoke(_make_app(), ["env", "--help"])
+        assert result.exit_code == 0
+        assert "save" in result.output
+
+    def test_main_does_not_import_api_modules(self):
+        code = (
+            "import sys, sd.app; "
+            "print(any(k.startswith('sd.api') for k in sys.modules))"
+        )
+        out = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True
+        )
+        assert out.stdout.strip() == "False"
+
+
+class TestNixCommands:
+    def test_matches_nix_app(self):
+        import click
+        import typer.main
+
+        from sd.api.nix import app
+        from sd.app import NIX_COMMANDS
+
+        group = typer.main.get_command(app)
+        assert isinstance(group, click.Group)
+        # completion 子命令组由 sd.app 自己提供
+        registered = {
+            name: command.help
+            for name, command in group.commands.items()
+            if not isinstance(command, click.Group)
+        }
+        assert NIX_COMMANDS == registered
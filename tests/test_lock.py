@@ -0,0 +1,110 @@
+import json
+from unittest.mock import patch
+
+LOCK = {
+    "nodes": {
+        "root": {
+            "inputs": {
+                "nixpkgs": "nixpkgs",
+                "nixpkgs-stable": "nixpkgs-stable",
+                "home-manager": "home-manager",
+                "darwin": "darwin",
+                "devshell": "devshell",
+            }
+        },
+        "nixpkgs": {
+            "original": {"type": "github", "owner": "NixOS", "repo": "nixpkgs"},
+        },
+        "nixpkgs-stable": {
+            "original": {
+                "type": "github",
+                "owner": "NixOS",
+                "repo": "nixpkgs",
+                "ref": "nixos-24.05",
+            },
+        },
+        "home-manager": {
+            "inputs": {"nixpkgs": ["nixpkgs"]},
+            "original": {"type": "github", "repo": "home-manager"},
+        },
+        "darwin": {
+            "inputs": {"nixpkgs": "nixpkgs_2"},
+            "original": {"type": "github", "repo": "nix-darwin"},
+        },
+        "nixpkgs_2": {
+            "original": {"type": "github", "repo": "nixpkgs", "ref": "nixos-24.05"},
+        },
+        "devshell": {
+            "inputs": {"nixpkgs": "nixpkgs_3", "flake-utils": "flake-utils"},
+            "original": {"type": "github", "repo": "devshell"},
+        },
+        "flake-utils": {
+            "inputs": {"nixpkgs": "nixpkgs_4"},
+            "original": {"type": "github", "repo": "flake-utils"},
+        },
+        "nixpkgs_3": {"original": {"type": "indirect", "id": "nixpkgs"}},
+        "nixpkgs_4": {"original": {"type": "github", "repo": "nixpkgs"}},
+    },
+    "root": "root",
+    "version": 7,
+}
+
+
+class TestAuditLock:
+    def test_ranks_by_duplicate_count(self):
+        from sd.api.lock import audit_lock
+        from sd.utils.flakelock import FlakeLock
+
+        result = audit_lock(FlakeLock(LOCK))
+        assert [(i.root_input, i.nodes) for i in result] == [
+            ("devshell", ["nixpkgs_3", "nixpkgs_4"]),
+            ("darwin", ["nixpkgs_2"]),
+        ]
+
+    def test_follows_lines(self):
+        from sd.api.lock import audit_lock
+        from sd.utils.flakelock import FlakeLock
+
+        devshell, darwin = audit_lock(FlakeLock(LOCK))
+        assert darwin.follows == [
+            'inputs.darwin.inputs.nixpkgs.follows = "nixpkgs-stable";'
+        ]
+        assert devshell.follows == [
+            'inputs.devshell.inputs.nixpkgs.follows = "nixpkgs";',
+            'inputs.devshell.inputs.flake-utils.inputs.nixpkgs.follows = "nixpkgs";',
+        ]
+
+    def test_clean_lock(self):
+        from sd.api.lock import audit_lock
+        from sd.utils.flakelock import FlakeLock
+
+        data = json.loads(json.dumps(LOCK))
+        data["nodes"]["darwin"]["inputs"]["nixpkgs"] = ["nixpkgs-stable"]
+        data["nodes"]["devshell"]["inputs"]["nixpkgs"] = ["nixpkgs"]
+        data["nodes"]["flake-utils"]["inputs"]["nixpkgs"] = ["nixpkgs"]
+        assert audit_lock(FlakeLock(data)) == []
+
+
+class TestAuditCommand:
+    @patch("sd.api.lock.fmt")
+    def test_audit_prints_follows(self, mock_fmt, tmp_path):
+        from sd.api.lock import audit
+
+        (tmp_path / "flake.lock").write_text(json.dumps(LOCK))
+        audit(str(tmp_path))
+        mock_fmt.warn.assert_called_once_with(
+            "3 duplicate instances will be evaluated separately"
+        )
+        lines = [i.args[0] for i in mock_fmt.echo.call_args_list]
+        assert '  inputs.darwin.inputs.nixpkgs.follows = "nixpkgs-stable";' in lines
+
+    @patch("sd.api.lock.fmt")
+    def test_audit_missing_lock(self, mock_fmt, tmp_path):
+        import pytest
+        import typer
+
+        from sd.api.lock import audit
+
+        with pytest.raises(typer.Exit):
+            audit(str(tmp_path))
+        mock_fmt.error.assert_called_once()
@@ -49,6 +49,32 @@ class TestGetAppBundleIdByPath:
         result = get_app_bundleid_by_path("/Applications/Test.app")
         assert result == "com.test.app"
 
+    @patch("sd.api.macbid.cmd")
+    def test_get_app_bundleid_by_path_uses_known_bundleid(self, mock_cmd):
+        from sd.api.macbid import get_app_bundleid_by_path
+
+        result = get_app_bundleid_by_path("/Applications/Test.app", "com.test.app")
+        assert result == "com.test.app"
+        mock_cmd.getout.assert_not_called()
+        mock_cmd.run.assert_not_called()
+
+
+class TestDb:
+    @patch("sd.api.macbid.term_fmt_by_dict")
+    @patch("sd.api.macbid.get_app_list_by_list")
+    @patch("sd.api.macbid.cmd")
+    def test_db_resolves_bundleids_concurrently(self, mock_cmd, mock_list, mock_fmt):
+        from sd.api.macbid import db
+
+        mock_list.return_value = {"A.app": "/Applications/A.app"}
+        mock_cmd.run_many.return_value = [
+            MagicMock(returncode=0, stdout=b"com.example.a\n")
+        ]
+        db()
+        mock_cmd.run_many.assert_called_once()
+        mock_cmd.getout.assert_not_called()
+        mock_fmt.assert_called_once_with({"A.app": "com.example.a"})
+
 
 class TestAppPath:
     def test_app_path_list(self):
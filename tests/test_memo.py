@@ -0,0 +1,108 @@
+import os
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+
+def _flush_and_reload():
+    from sd.utils import memo
+
+    memo.flush()
+    memo.reset()
+
+
+class TestMemo:
+    def test_get_after_set_and_persist(self):
+        from sd.utils.memo import Memo
+
+        Memo().set(["nix", "--version"], "nix (Nix) 2.18.0")
+        _flush_and_reload()
+        assert Memo().get(["nix", "--version"]) == "nix (Nix) 2.18.0"
+        assert Memo().get(["nix", "--help"]) is None
+
+    def test_file_change_invalidates(self, tmp_path):
+        from sd.utils.memo import Memo
+
+        f = tmp_path / "nix"
+        f.write_text("old")
+        Memo(files=(str(f),)).set(["nix", "--version"], "old")
+        assert Memo(files=(str(f),)).get(["nix", "--version"]) == "old"
+        f.unlink()
+        f.write_text("new")
+        os.utime(f, ns=(1, 1))
+        assert Memo(files=(str(f),)).get(["nix", "--version"]) is None
+
+    def test_ttl_expires(self):
+        from sd.utils.memo import Memo
+
+        with patch("time.time", return_value=1000.0):
+            Memo(ttl=10).set(["git", "ls-remote"], "v1")
+        with patch("time.time", return_value=1005.0):
+            assert Memo(ttl=10).get(["git", "ls-remote"]) == "v1"
+        with patch("time.time", return_value=1011.0):
+            assert Memo(ttl=10).get(["git", "ls-remote"]) is None
+
+    def test_lru_cap(self, monkeypatch):
+        from sd.utils import memo
+        from sd.utils.memo import Memo
+
+        monkeypatch.setattr(memo, "MAX_ENTRIES", 2)
+        for i, t in enumerate([1.0, 2.0, 3.0]):
+            with patch("time.time", return_value=t):
+                Memo().set(["cmd", str(i)], str(i))
+        with patch("time.time", return_value=4.0):
+            Memo().get(["cmd", "0"])
+        _flush_and_reload()
+        assert Memo().get(["cmd", "0"]) == "0"
+        assert Memo().get(["cmd", "1"]) is None
+        assert Memo().get(["cmd", "2"]) == "2"
+
+    def test_corrupt_file_falls_back(self):
+        from sd.utils import memo
+        from sd.utils.memo import Memo
+
+        os.makedirs(os.path.dirname(memo.memo_file()), exist_ok=True)
+        with open(memo.memo_file(), mode="w") as f:
+            f.write("{not json")
+        assert Memo().get(["cmd"]) is None
+        Memo().set(["cmd"], "value")
+        _flush_and_reload()
+        assert Memo().get(["cmd"]) == "value"
+
+    def test_refresh_ignores_cache(self):
+        from sd.utils import memo
+        from sd.utils.memo import Memo
+
+        Memo().set(["cmd"], "value")
+        memo.flush()
+        memo.refresh()
+        assert Memo().get(["cmd"]) is None
+
+
+class TestGetoutCache:
+    @patch("subprocess.getstatusoutput")
+    def test_getout_uses_cache(self, mock_status):
+        from sd.utils import cmd, trace
+        from sd.utils.memo import Memo
+
+        mock_status.return_value = (0, "com.example.app")
+        trace.enable()
+        try:
+            assert cmd.getout("osascript", cache=Memo()) == "com.example.app"
+            assert cmd.getout("osascript", cache=Memo()) == "com.example.app"
+            assert trace.counters == {"memo miss": 1, "memo hit": 1}
+        finally:
+            trace.disable()
+        mock_status.assert_called_once()
+
+    @patch("subprocess.getstatusoutput")
+    def test_getout_does_not_cache_failures(self, mock_status):
+        from sd.utils import cmd
+        from sd.utils.memo import Memo
+
+        mock_status.return_value = (1, "error")
+        for _ in range(2):
+            with pytest.raises(subprocess.SubprocessError):
+                cmd.getout("osascript", cache=Memo())
+        assert mock_status.call_count == 2
@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from pathlib import Path
 from unittest.mock import patch
@@ -35,27 +36,62 @@ class TestGetFlake:
 
 
 class TestFlakeInputs:
-    @patch("sd.api.nix.path")
     @patch("sd.api.nix.cmd")
-    def test_get_flake_inputs_by_lock(self, mock_cmd, mock_path):
+    def test_get_flake_inputs_by_lock(self, mock_cmd, tmp_path):
         from sd.api.nix import get_flake_inputs_by_lock
 
-        mock_path.json_read.return_value = {
-            "nodes": {
-                "root": {
-                    "inputs": {
-                        "nixpkgs": {},
-                        "home-manager": {},
-                        "darwin": {},
+        (tmp_path / "flake.lock").write_text(
+            json.dumps(
+                {
+                    "nodes": {
+                        "root": {
+                            "inputs": {
+                                "nixpkgs": "nixpkgs",
+                                "home-manager": "home-manager",
+                                "darwin": "darwin",
+                            }
+                        }
                     }
                 }
-            }
-        }
-        result = get_flake_inputs_by_lock("/test/path")
+            )
+        )
+        result = get_flake_inputs_by_lock(tmp_path)
         assert "nixpkgs" in result
         assert "home-manager" in result
         assert "darwin" in result
 
+    @patch("sd.api.nix.path")
+    @patch("sd.api.nix.cmd")
+    def test_get_flake_inputs_by_nix(self, mock_cmd, mock_path):
+        from sd.api.nix import get_flake_inputs_by_nix
+
+        mock_path.is_file.return_value = True
+        mock_cmd.stream.return_value = iter(
+            ["warning: Git tree is dirty", '{"nixpkgs": {}, "darwin": {}}']
+        )
+        assert get_flake_inputs_by_nix("/test/path") == ["nixpkgs", "darwin"]
+
+
+class TestArchivePaths:
+    def test_get_archive_paths(self):
+        from sd.api.nix import get_archive_paths
+
+        archive = {
+            "path": "/nix/store/a-source",
+            "inputs": {
+                "nixpkgs": {"path": "/nix/store/b-source", "inputs": {}},
+                "darwin": {
+                    "path": "/nix/store/c-source",
+                    "inputs": {"nixpkgs": {"path": "/nix/store/d-source"}},
+                },
+            },
+        }
+        assert get_archive_paths(archive) == [
+            "/nix/store/a-source",
+            "/nix/store/b-source",
+            "/nix/store/c-source",
+        ]
+
 
 class TestFlakePlatform:
     @patch("sd.api.nix.cmd")
@@ -197,23 +233,38 @@ class TestNixVersion:
 
 
 class TestFlakeInputsEdgeCases:
-    @patch("sd.api.nix.path")
-    def test_get_flake_inputs_by_lock_empty_data(self, mock_path):
+    def test_get_flake_inputs_by_lock_empty_data(self, tmp_path):
         from sd.api.nix import get_flake_inputs_by_lock
 
-        mock_path.json_read.return_value = None
         with patch("sd.api.nix.typer"):
             with pytest.raises(Exception):
-                get_flake_inputs_by_lock("/test/path")
+                get_flake_inputs_by_lock(tmp_path)
 
-    @patch("sd.api.nix.path")
-    def test_get_flake_inputs_by_lock_missing_nodes(self, mock_path):
+    def test_get_flake_inputs_by_lock_missing_nodes(self, tmp_path):
         from sd.api.nix import get_flake_inputs_by_lock
 
-        mock_path.json_read.return_value = {}
+        (tmp_path / "flake.lock").write_text("{}")
         with patch("sd.api.nix.typer"):
             with pytest.raises(Exception):
-                get_flake_inputs_by_lock("/test/path")
+                get_flake_inputs_by_lock(tmp_path)
+
+    def test_is_updatable_input(self):
+        from sd.api.nix import is_updatable_input
+        from sd.utils.flakelock import FlakeLock
+
+        lock = FlakeLock(
+            {
+                "nodes": {
+                    "root": {"inputs": {"darwin": "darwin", "hm": "hm"}},
+                    "darwin": {"inputs": {"nixpkgs": "nixpkgs"}},
+                    "hm": {"inputs": {"nixpkgs": ["darwin", "nixpkgs"]}},
+                    "nixpkgs": {},
+                }
+            }
+        )
+        assert is_updatable_input(lock, "darwin/nixpkgs") is True
+        assert is_updatable_input(lock, "hm/nixpkgs") is False
+        assert is_updatable_input(lock, "darwin/missing") is False
 
 
 class TestFlakePlatformMore:
@@ -280,14 +331,393 @@ class TestChangeWorkdir:
 
 
 class TestGetGenerations:
-    @patch("sd.api.nix.get_re_compile")
     @patch("sd.api.nix.get_hm_profiles_root")
-    @patch("sd.api.nix.NIX_PROFILES")
-    def test_get_generations_home_manager(
-        self, mock_nix_profiles, mock_hm_profiles, mock_re_compile
-    ):
+    def test_get_generations_home_manager(self, mock_hm_profiles, tmp_path):
         from sd.api.nix import get_generations
 
-        mock_hm_profiles.return_value.iterdir.return_value = []
+        mock_hm_profiles.return_value = tmp_path
         result = get_generations(use_home=True)
         assert result == []
+
+    def test_get_generations_and_current(self, tmp_path):
+        from sd.api.nix import get_current_generation, get_generations
+
+        for i in [1, 2, 10]:
+            (tmp_path / f"store-{i}").mkdir()
+            (tmp_path / f"system-{i}-link").symlink_to(tmp_path / f"store-{i}")
+        (tmp_path / "system").symlink_to("system-2-link")
+        with patch("sd.api.nix.NIX_PROFILES", tmp_path):
+            assert [i.version for i in get_generations(False)] == [10, 2, 1]
+            current = get_current_generation(False)
+            assert current is not None
+            assert current.version == 2
+            assert current.path == tmp_path / "store-2"
+
+
+class TestNixDiff:
+    @patch("sd.api.nix.closure")
+    @patch("sd.api.nix.fmt")
+    def test_nix_diff_uses_closure_engine(self, mock_fmt, mock_closure, tmp_path):
+        from sd.api.nix import nix_diff
+        from sd.utils.closure import ClosureDiff
+
+        for i in [1, 2]:
+            (tmp_path / f"store-{i}").mkdir()
+            (tmp_path / f"system-{i}-link").symlink_to(tmp_path / f"store-{i}")
+        mock_closure.diff.return_value = ClosureDiff(
+            added={"foo": ["1.0"]}, size_before=1024, size_after=2048
+        )
+        with patch("sd.api.nix.NIX_PROFILES", tmp_path):
+            nix_diff(use_home=False, dry_run=False)
+        mock_closure.diff.assert_called_once_with(
+            str(tmp_path / "store-1"), str(tmp_path / "store-2")
+        )
+        mock_fmt.echo.assert_called_once_with("  [A] foo: 1.0")
+
+    @patch("sd.api.nix.closure.diff", side_effect=FileNotFoundError("nix"))
+    @patch("sd.api.nix.fmt")
+    def test_nix_diff_warns_without_nix(self, mock_fmt, mock_diff, tmp_path):
+        from sd.api.nix import nix_diff
+
+        for i in [1, 2]:
+            (tmp_path / f"store-{i}").mkdir()
+            (tmp_path / f"system-{i}-link").symlink_to(tmp_path / f"store-{i}")
+        with patch("sd.api.nix.NIX_PROFILES", tmp_path):
+            nix_diff(use_home=False, dry_run=False)
+        mock_fmt.warn.assert_called_once()
+        mock_fmt.echo.assert_not_called()
+
+
+class TestGcPlan:
+    def test_dry_run_writes_plan_and_apply_plan_deletes(self, tmp_path):
+        from typer.testing import CliRunner
+
+        from sd.api.nix import app
+
+        profiles = tmp_path / "profiles"
+        profiles.mkdir()
+        store = tmp_path / "store"
+        for i in [1, 2, 3]:
+            (store / f"system-{i}").mkdir(parents=True)
+            (profiles / f"system-{i}-link").symlink_to(store / f"system-{i}")
+        (profiles / "system").symlink_to("system-3-link")
+        plan_file = tmp_path / "plan.json"
+        with (
+            patch("sd.api.nix.NIX_PROFILES", profiles),
+            patch("sd.api.nix.NIX_USER_PROFILES", tmp_path / "none"),
+            patch("sd.api.nix.cmd.run") as mock_run,
+        ):
+            runner = CliRunner()
+            result = runner.invoke(
+                app, ["gc", "--save", "1", "--dry-run", "--plan", str(plan_file)]
+            )
+            assert result.exit_code == 0, result.output
+            assert (profiles / "system-1-link").is_symlink()
+            result = runner.invoke(app, ["gc", "--apply-plan", str(plan_file)])
+            assert result.exit_code == 0, result.output
+        assert sorted(i.name for i in profiles.iterdir()) == ["system", "system-3-link"]
+        assert mock_run.call_count == 2
+
+
+class TestListGenerations:
+    @patch("sd.api.nix.closure.query_closure")
+    def test_sizes(self, mock_query, tmp_path):
+        from typer.testing import CliRunner
+
+        from sd.api.nix import app
+
+        for i in [1, 2]:
+            (tmp_path / f"store-{i}").mkdir()
+            (tmp_path / f"system-{i}-link").symlink_to(tmp_path / f"store-{i}")
+        (tmp_path / "system").symlink_to("system-2-link")
+        mock_query.side_effect = lambda p: {p: 1024**2, "shared": 1024**3}
+        with (
+            patch("sd.api.nix.NIX_PROFILES", tmp_path),
+            patch("sd.api.nix.NIX_USER_PROFILES", tmp_path / "none"),
+        ):
+            result = CliRunner().invoke(app, ["generations", "--sizes"])
+        assert result.exit_code == 0, result.output
+        lines = result.output.splitlines()
+        assert "system generations" in lines[0]
+        assert lines[1].split()[0] == "2" and lines[1].endswith("(current)")
+        assert "+0 B" in lines[1] and "1.0 MiB" in lines[1]
+        assert lines[2].split()[0] == "1"
+
+
+class TestBuildHosts:
+    @patch("sd.api.nix.fmt.error")
+    @patch("sd.api.nix.fmt.success")
+    @patch("sd.api.nix.cmd")
+    def test_all_hosts(self, mock_cmd, mock_success, mock_error):
+        from typer.testing import CliRunner
+
+        from sd.api.nix import app
+        from sd.utils.cmd import Result
+
+        mock_cmd.getout.return_value = '["a", "bb"]'
+        mock_cmd.run_many.return_value = [
+            Result([], 0, duration=1.5),
+            Result([], 1, duration=2.0),
+        ]
+        with patch("sd.api.nix.get_flake", return_value="/flake"):
+            result = CliRunner().invoke(
+                app, ["build", "--all", "--nixos", "-j", "3", "--no-debug"]
+            )
+        assert result.exit_code == 1
+        assert "nixosConfigurations" in mock_cmd.getout.call_args[0][0][3]
+        cmds = mock_cmd.run_many.call_args[0][0]
+        assert cmds[0] == [
+            "nix",
+            "build",
+            '/flake#nixosConfigurations."a".config.system.build.toplevel',
+            "--out-link",
+            "result-a",
+            "--impure",
+        ]
+        kwargs = mock_cmd.run_many.call_args[1]
+        assert kwargs["limit"] == 3
+        assert kwargs["prefixes"] == ["a  | ", "bb | "]
+        mock_success.assert_called_once()
+        mock_error.assert_called_once()
+
+    @patch("sd.api.nix.nixlog")
+    @patch("sd.api.nix.fmt.warn")
+    @patch("sd.api.nix.cmd")
+    def test_progress_ignored_for_multiple_hosts(
+        self, mock_cmd, mock_warn, mock_nixlog
+    ):
+        from typer.testing import CliRunner
+
+        from sd.api.nix import app
+        from sd.utils.cmd import Result
+
+        mock_cmd.run_many.return_value = [Result([], 0), Result([], 0)]
+        with patch("sd.api.nix.get_flake", return_value="/flake"):
+            result = CliRunner().invoke(
+                app, ["build", "a", "b", "--nixos", "--progress"]
+            )
+        assert result.exit_code == 0, result.output
+        mock_warn.assert_called_once_with(
+            "--progress is ignored when building multiple hosts"
+        )
+        mock_cmd.run_many.assert_called_once()
+        mock_nixlog.run.assert_not_called()
+
+    @patch("sd.api.nix.cmd")
+    def test_single_host_uses_rebuild(self, mock_cmd):
+        from typer.testing import CliRunner
+
+        from sd.api.nix import app
+
+        with (
+            patch("sd.api.nix.get_flake", return_value="/flake"),
+            patch("sd.api.nix.nix_diff"),
+        ):
+            result = CliRunner().invoke(app, ["build", "host", "--home", "--no-debug"])
+        assert result.exit_code == 0, result.output
+        mock_cmd.run_many.assert_not_called()
+        assert mock_cmd.run.call_args[0][0][:3] == ["home-manager", "build", "--flake"]
+
+    @patch("sd.api.nix.nixlog")
+    def test_progress_uses_internal_json(self, mock_nixlog):
+        from typer.testing import CliRunner
+
+        from sd.api.nix import app
+
+        mock_nixlog.run.return_value = 0
+        with (
+            patch("sd.api.nix.get_flake", return_value="/flake"),
+            patch("sd.api.nix.nix_diff") as mock_diff,
+        ):
+            result = CliRunner().invoke(app, ["build", "host", "--home", "--progress"])
+        assert result.exit_code == 0, result.output
+        cmd_list = mock_nixlog.run.call_args[0][0]
+        assert "-L" not in cmd_list
+        assert cmd_list[-3:] == ["--log-format", "internal-json", "-v"]
+        mock_diff.assert_called_once()
+
+
+class TestStats:
+    def test_switch_is_recorded(self):
+        from typer.testing import CliRunner
+
+        from sd.api.nix import app
+        from sd.utils import history
+
+        with (
+            patch("sd.api.nix.get_flake", return_value="/flake"),
+            patch("sd.api.nix.cmd.run") as mock_run,
+        ):
+            mock_run.return_value.returncode = 1
+            runner = CliRunner()
+            result = runner.invoke(app, ["switch", "host", "--home"])
+            assert result.exit_code == 0, result.output
+            runner.invoke(app, ["switch", "host", "--home", "--dry-run"])
+        runs = history.load()
+        assert len(runs) == 1
+        assert (runs[0].command, runs[0].host, runs[0].status) == ("switch", "host", 1)
+        assert "rebuild" in runs[0].phases
+
+        result = runner.invoke(app, ["stats", "--limit", "1"])
+        assert result.exit_code == 0, result.output
+        assert "switch host" in result.output
+        assert "failed (1)" in result.output
+
+    def test_no_history(self):
+        from typer.testing import CliRunner
+
+        from sd.api.nix import app
+
+        result = CliRunner().invoke(app, ["stats", "--command", "gc"])
+        assert result.exit_code == 0
+        assert "No history" in result.output
+
+
+class TestSwitchFingerprint:
+    def test_skips_unchanged_switch(self, tmp_path):
+        from typer.testing import CliRunner
+
+        from sd.api.nix import app
+        from sd.utils.generations import Generation
+
+        generation = Generation(1, path=tmp_path / "system-1")
+        with (
+            patch("sd.api.nix.get_flake", return_value="/flake"),
+            patch("sd.api.nix.fingerprint.compute", return_value="f1"),
+            patch("sd.api.nix.get_current_generation", return_value=generation),
+            patch("sd.api.nix.nix_diff"),
+            patch("sd.api.nix.cmd.run") as mock_run,
+        ):
+            mock_run.return_value.returncode = 0
+            runner = CliRunner()
+            result = runner.invoke(app, ["switch", "host", "--home"])
+            assert result.exit_code == 0, result.output
+            assert mock_run.call_count == 1
+            result = runner.invoke(app, ["switch", "host", "--home"])
+            assert "unchanged" in result.output
+            assert mock_run.call_count == 1
+            runner.invoke(app, ["switch", "host", "--home", "--force"])
+            assert mock_run.call_count == 2
+
+
+class TestSwitchArtifact:
+    def test_activates_known_build(self, tmp_path):
+        from typer.testing import CliRunner
+
+        from sd.api.nix import app
+        from sd.utils import artifacts
+        from sd.utils.generations import Generation
+
+        toplevel = tmp_path / "toplevel"
+        toplevel.mkdir()
+        artifacts.save("key", str(toplevel))
+        with (
+            patch("sd.api.nix.get_flake", return_value="/flake"),
+            patch("sd.api.nix.artifacts.key", return_value="key"),
+            patch("sd.api.nix.fingerprint.compute", return_value=None),
+            patch(
+                "sd.api.nix.get_current_generation",
+                return_value=Generation(1, path=toplevel),
+            ),
+            patch("sd.api.nix.nix_diff"),
+            patch("sd.api.nix.cmd.run") as mock_run,
+        ):
+            mock_run.return_value.returncode = 0
+            result = CliRunner().invoke(app, ["switch", "host", "--nixos"])
+            assert result.exit_code == 0, result.output
+            cmds = [i[0][0] for i in mock_run.call_args_list]
+            assert cmds[0][:3] == ["sudo", "nix-env", "-p"]
+            assert cmds[0][-2:] == ["--set", str(toplevel)]
+            assert cmds[1] == [
+                "sudo",
+                f"{toplevel}/bin/switch-to-configuration",
+                "switch",
+            ]
+
+            mock_run.reset_mock()
+            result = CliRunner().invoke(app, ["switch", "host", "--nixos", "--force"])
+            assert result.exit_code == 0, result.output
+            assert "nixos-rebuild" in mock_run.call_args[0][0]
+
+
+class TestRollback:
+    @pytest.fixture
+    def profiles(self, tmp_path):
+        profiles = tmp_path / "profiles"
+        profiles.mkdir()
+        for i in [1, 2, 3]:
+            (tmp_path / f"system-{i}").mkdir()
+            (profiles / f"system-{i}-link").symlink_to(tmp_path / f"system-{i}")
+        (profiles / "system").symlink_to("system-3-link")
+        with patch("sd.api.nix.NIX_PROFILES", profiles):
+            yield tmp_path
+
+    @pytest.mark.parametrize("args,version", [([], 2), (["2"], 1), (["--to", "1"], 1)])
+    def test_rollback(self, profiles, args, version):
+        from typer.testing import CliRunner
+
+        from sd.api.nix import app
+
+        with (
+            patch("sd.api.nix.nix_diff") as mock_diff,
+            patch("sd.api.nix.cmd.run") as mock_run,
+        ):
+            mock_run.return_value.returncode = 0
+            result = CliRunner().invoke(app, ["rollback", "--nixos"] + args)
+        assert result.exit_code == 0, result.output
+        cmds = [i[0][0] for i in mock_run.call_args_list]
+        assert cmds[0][-2:] == ["--switch-generation", str(version)]
+        assert cmds[1] == [
+            "sudo",
+            f"{profiles}/system-{version}/bin/switch-to-configuration",
+            "switch",
+        ]
+        assert mock_diff.call_args[1]["old_generation"].version == 3
+
+    def test_missing_generation(self, profiles):
+        from typer.testing import CliRunner
+
+        from sd.api.nix import app
+
+        with patch("sd.api.nix.cmd.run") as mock_run:
+            result = CliRunner().invoke(app, ["rollback", "--nixos", "3"])
+            assert result.exit_code == 1
+            assert "available: 3 2 1" in result.output
+            result = CliRunner().invoke(app, ["rollback", "--nixos", "--to", "3"])
+            assert result.exit_code == 0
+        mock_run.assert_not_called()
+
+
+class TestBuildArtifact:
+    def test_only_saves_result_written_by_build(self, tmp_path, monkeypatch):
+        from typer.testing import CliRunner
+
+        from sd.api.nix import app
+        from sd.utils import artifacts
+
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "old").mkdir()
+        (tmp_path / "new").mkdir()
+        (tmp_path / "result").symlink_to(tmp_path / "old")
+
+        def fake_build(*args, **kwargs):
+            (tmp_path / "result").unlink()
+            (tmp_path / "result").symlink_to(tmp_path / "new")
+            return True
+
+        with (
+            patch("sd.api.nix.get_flake", return_value="/flake"),
+            patch("sd.api.nix.artifacts.key", return_value="key"),
+            patch("sd.api.nix.nix_diff"),
+            patch("sd.api.nix.rebuild", return_value=True) as mock_rebuild,
+        ):
+            runner = CliRunner()
+            result = runner.invoke(app, ["build", "host", "--home", "--dry-run"])
+            assert result.exit_code == 0, result.output
+            assert artifacts.lookup("key") is None
+            # 构建成功但没有重新创建 result
+            runner.invoke(app, ["build", "host", "--home"])
+            assert artifacts.lookup("key") is None
+            mock_rebuild.side_effect = fake_build
+            runner.invoke(app, ["build", "host", "--home"])
+        assert artifacts.lookup("key") == str(tmp_path / "new")
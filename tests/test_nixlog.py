@@ -0,0 +1,73 @@
+import json
+from unittest.mock import patch
+
+DRV = f"/nix/store/{'a' * 32}-hello-2.12.drv"
+
+
+def nix(**event):
+    return "@nix " + json.dumps(event)
+
+
+EVENTS = [
+    nix(action="start", id=1, type=104, level=0, text=""),
+    nix(action="start", id=2, type=103, level=0, text=""),
+    nix(action="start", id=3, type=105, level=3, text="building hello", fields=[DRV]),
+    nix(action="result", id=3, type=104, fields=["buildPhase"]),
+    nix(action="result", id=3, type=101, fields=["make: Entering directory"]),
+    nix(action="result", id=1, type=105, fields=[1, 4, 1, 0]),
+    nix(action="start", id=4, type=101, level=4, text="downloading"),
+    nix(action="result", id=4, type=105, fields=[2048, 4096, 0, 0]),
+    nix(action="result", id=2, type=105, fields=[3, 10, 1, 0]),
+    nix(action="msg", level=1, msg="warning: Git tree is dirty"),
+]
+
+
+class TestProgress:
+    def test_feed(self):
+        from sd.utils.nixlog import Progress
+
+        progress = Progress()
+        messages = [progress.feed(i) for i in EVENTS]
+        assert (progress.builds.done, progress.builds.expected) == (1, 4)
+        assert (progress.copies.done, progress.copies.expected) == (3, 10)
+        assert progress.bytes_fetched == 2048
+        assert progress.running == {3: ["hello-2.12", "buildPhase"]}
+        texts = [i.text for i in messages if i]
+        assert "hello-2.12> make: Entering directory" in texts
+        assert messages[-1].level == 1
+        line = progress.render(200)
+        assert line == (
+            "[builds 1/4] [downloads 3/10, 2.0 KiB] hello-2.12 (buildPhase)"
+        )
+        progress.feed(nix(action="stop", id=3))
+        assert progress.running == {}
+        assert len(progress.render(20)) == 20
+
+    def test_non_json_lines(self):
+        from sd.utils.nixlog import Progress
+
+        progress = Progress()
+        assert progress.feed("activating...").level is None
+        assert progress.feed("@nix {broken").text == "@nix {broken"
+
+
+class TestRun:
+    @patch("sd.utils.nixlog.fmt.echo")
+    def test_run_writes_log(self, mock_echo, tmp_path):
+        from sd.utils import nixlog
+
+        script = tmp_path / "events"
+        script.write_text("\n".join(EVENTS + ["activating the configuration"]))
+        log_path = str(tmp_path / "logs" / "build.log")
+        returncode = nixlog.run(["sh", "-c", f"cat {script} >&2; exit 3"], log_path)
+        assert returncode == 3
+        log = open(log_path).read()
+        assert "hello-2.12> make: Entering directory" in log
+        shown = [i[0][0] for i in mock_echo.call_args_list]
+        assert shown == ["warning: Git tree is dirty", "activating the configuration"]
+
+    def test_dry_run(self, tmp_path):
+        from sd.utils import nixlog
+
+        assert nixlog.run(["false"], str(tmp_path / "x.log"), dry_run=True) is None
+        assert not (tmp_path / "x.log").exists()
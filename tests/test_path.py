@@ -67,6 +67,20 @@ class TestPathUtils:
         result = abspath(".")
         assert Path(result).is_absolute()
 
+    def test_stat_key(self, tmp_path):
+        import os
+
+        from sd.utils.path import stat_key
+
+        p = tmp_path / "a"
+        p.write_text("x")
+        first = stat_key(p)
+        assert first is not None and stat_key(str(p)) == first
+        os.utime(p, ns=(0, 0))
+        assert stat_key(p) != first
+        assert stat_key(tmp_path / "missing") is None
+        assert stat_key(None) is None
+
 
 class TestJsonUtils:
     def test_json_write_creates_file(self, tmp_path):
@@ -98,6 +112,30 @@ class TestJsonUtils:
         result = json_read("/nonexistent/file.json")
         assert result is None
 
+    def test_write_atomic_and_load(self, tmp_path):
+        from sd.utils.path import json_load, json_load_versioned, json_write_atomic
+
+        p = tmp_path / "a" / "b.json"
+        json_write_atomic(p, {"version": 2, "x": 1})
+        assert json_load(p) == {"version": 2, "x": 1}
+        assert json_load_versioned(p, 2) == {"version": 2, "x": 1}
+        assert json_load_versioned(p, 1) is None
+        assert [i.name for i in p.parent.iterdir()] == ["b.json"]
+        p.write_text("{broken")
+        assert json_load(p) is None
+        assert json_load(tmp_path / "missing.json") is None
+
+    def test_write_atomic_keeps_old_file_on_error(self, tmp_path):
+        import pytest
+
+        from sd.utils.path import json_load, json_write_atomic
+
+        p = tmp_path / "b.json"
+        json_write_atomic(p, {"x": 1})
+        with pytest.raises(TypeError):
+            json_write_atomic(p, {"x": object()})
+        assert json_load(p) == {"x": 1}
+
 
 class TestLinkUtils:
     def test_readlink_resolves_symlink(self, tmp_path):
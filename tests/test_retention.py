@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+
+
+def make_generations(created):
+    from sd.utils.generations import Generation
+
+    return [
+        Generation(i + 1, path=Path(f"/nix/store/g{i + 1}"), created_at=c)
+        for i, c in enumerate(created)
+    ]
+
+
+class TestSelect:
+    def test_keep_last_only(self):
+        from sd.utils.retention import Policy, select
+
+        generations = make_generations([datetime(2024, 1, i) for i in range(1, 6)])
+        assert select(generations, Policy(keep_last=2)) == {4, 5}
+
+    def test_keep_last_does_not_read_created_at(self):
+        from sd.utils.generations import Generation
+        from sd.utils.retention import Policy, select
+
+        generations = [Generation(i, link=f"/missing/system-{i}-link") for i in [1, 2]]
+        assert select(generations, Policy(keep_last=1)) == {2}
+
+    def test_daily_and_weekly_buckets(self):
+        from sd.utils.retention import Policy, select
+
+        now = datetime(2024, 3, 15, 12)  # 星期五
+        created = [
+            now - timedelta(days=60),  # 1: 一月
+            now - timedelta(days=20),  # 2: 三周前
+            now - timedelta(days=9),  # 3: 上上周
+            now - timedelta(days=8),  # 4: 上上周, 比 3 新
+            now - timedelta(days=1, hours=2),  # 5: 昨天
+            now - timedelta(days=1),  # 6: 昨天, 比 5 新
+            now - timedelta(hours=1),  # 7: 今天
+        ]
+        generations = make_generations(created)
+        policy = Policy(keep_last=1, daily=3, weekly=3)
+        assert select(generations, policy, now=now) == {4, 6, 7}
+        policy = Policy(keep_last=1, daily=3, weekly=4, monthly=3)
+        assert select(generations, policy, now=now) == {1, 2, 4, 6, 7}
+
+    def test_protected(self):
+        from sd.utils.retention import Policy, select
+
+        generations = make_generations([datetime(2024, 1, i) for i in range(1, 4)])
+        assert select(generations, Policy(), protected=["/nix/store/g1"]) == {1, 3}
+
+    def test_describe(self):
+        from sd.utils.retention import Policy
+
+        assert Policy(3, daily=7, weekly=8).describe() == (
+            "last 3, 1/day for 7 days, 1/week for 8 weeks"
+        )
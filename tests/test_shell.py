@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def worker_enabled(monkeypatch):
+    from sd.utils import shell
+
+    monkeypatch.setenv(shell.ENABLE_VAR, "1")
+    yield shell
+    shell.shutdown()
+
+
+class TestShellWorker:
+    def test_separates_stdout_stderr_and_status(self, worker_enabled):
+        result = worker_enabled.run("printf out; printf err >&2; exit 3")
+        assert result.stdout == b"out"
+        assert result.stderr == b"err"
+        assert result.returncode == 3
+
+    def test_preserves_trailing_newlines(self, worker_enabled):
+        assert worker_enabled.run("echo a; echo").stdout == b"a\n\n"
+
+    def test_reuses_one_shell(self, worker_enabled):
+        from sd.utils import trace
+
+        trace.enable()
+        try:
+            for i in range(20):
+                result = worker_enabled.run(f"echo {i}")
+                assert result.stdout == f"{i}\n".encode()
+            assert trace.counters["shell worker spawn"] == 1
+        finally:
+            trace.disable()
+
+    def test_commands_do_not_leak_state(self, worker_enabled, tmp_path):
+        worker_enabled.run(f"cd {tmp_path}; FOO=1")
+        assert worker_enabled.run("echo ${FOO:-unset}").stdout == b"unset\n"
+        assert worker_enabled.run("pwd").stdout.decode().strip() == os.getcwd()
+
+    def test_follows_python_cwd(self, worker_enabled, tmp_path, monkeypatch):
+        worker_enabled.run("true")
+        monkeypatch.chdir(tmp_path)
+        assert worker_enabled.run("pwd").stdout.decode().strip() == str(tmp_path)
+
+    def test_syntax_error_does_not_kill_worker(self, worker_enabled):
+        result = worker_enabled.run("echo 'unterminated")
+        assert result.returncode != 0
+        assert worker_enabled.run("echo ok").stdout == b"ok\n"
+
+    def test_disabled_by_default_and_skips_sudo(self, worker_enabled, monkeypatch):
+        assert worker_enabled.accepts("nix eval --raw .#x")
+        assert not worker_enabled.accepts("sudo rm -rf /tmp/x")
+        assert not worker_enabled.accepts("true && sudo mkdir /x")
+        assert worker_enabled.accepts("echo pseudo")
+        monkeypatch.delenv(worker_enabled.ENABLE_VAR)
+        assert not worker_enabled.accepts("true")
+
+    def test_env_change_restarts_worker(self, worker_enabled, monkeypatch):
+        worker_enabled.run("true")
+        monkeypatch.setenv("SD_TEST_VAR", "changed")
+        assert worker_enabled.run("echo $SD_TEST_VAR").stdout == b"changed\n"
+
+
+class TestGetoutWithWorker:
+    def test_getout_merges_stderr_like_getstatusoutput(self, worker_enabled):
+        import subprocess
+
+        from sd.utils.cmd import getout
+
+        assert getout("echo out; echo err >&2") == "out\nerr"
+        with pytest.raises(subprocess.SubprocessError, match="boom"):
+            getout("echo boom >&2; false")
+
+    def test_sh(self, worker_enabled):
+        from sd.utils.cmd import sh
+
+        result = sh("echo hi | grep -q hi")
+        assert result.returncode == 0
@@ -0,0 +1,188 @@
+import json
+import sqlite3
+from unittest.mock import patch
+
+import pytest
+
+SCHEMA = """
+create table ValidPaths (
+    id integer primary key autoincrement not null,
+    path text unique not null,
+    hash text not null,
+    registrationTime integer not null,
+    deriver text,
+    narSize integer,
+    ultimate integer,
+    sigs text,
+    ca text
+);
+create table Refs (
+    referrer integer not null,
+    reference integer not null,
+    primary key (referrer, reference)
+);
+"""
+PATHS = {
+    "system": (100, 1700000000, ["home", "bash"]),
+    "home": (50, 1700000100, ["bash"]),
+    "bash": (20, 1600000000, ["glibc"]),
+    "glibc": (30, 1500000000, ["glibc"]),
+    "other": (7, 1400000000, []),
+}
+
+
+def store(name):
+    return f"/nix/store/{'0' * 32}-{name}"
+
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    "与 nix 的 schema 相同的 store 数据库"
+    p = tmp_path / "nix" / "db" / "db.sqlite"
+    p.parent.mkdir(parents=True)
+    conn = sqlite3.connect(p)
+    conn.executescript(SCHEMA)
+    ids = {}
+    for name, (size, registered, _) in PATHS.items():
+        cursor = conn.execute(
+            "insert into ValidPaths (path, hash, registrationTime, narSize)"
+            " values (?, ?, ?, ?)",
+            (store(name), f"sha256:{name}", registered, size),
+        )
+        ids[name] = cursor.lastrowid
+    for name, (_, _, refs) in PATHS.items():
+        for ref in refs:
+            conn.execute("insert into Refs values (?, ?)", (ids[name], ids[ref]))
+    conn.commit()
+    conn.close()
+    monkeypatch.setenv("NIX_STATE_DIR", str(tmp_path / "nix"))
+    return str(p)
+
+
+class TestStoreDB:
+    def test_path_info(self, db_file):
+        from sd.utils.storedb import StoreDB
+
+        db = StoreDB(db_file)
+        infos = db.path_info([store("system"), store("other"), store("missing")])
+        assert sorted(infos) == [store("other"), store("system")]
+        system = infos[store("system")]
+        assert system.nar_size == 100 and system.nar_hash == "sha256:system"
+        assert system.references == sorted([store("home"), store("bash")])
+        assert infos[store("other")].references == []
+        assert db.references(store("glibc")) == [store("glibc")]
+
+    def test_closure(self, db_file):
+        from sd.utils.storedb import StoreDB
+
+        db = StoreDB(db_file)
+        result = db.closure([store("home")])
+        assert result == {store("home"): 50, store("bash"): 20, store("glibc"): 30}
+        both = db.closure([store("system"), store("other")])
+        assert sum(both.values()) == 207
+
+    def test_batches_and_lru(self, db_file):
+        from sd.utils import storedb
+
+        db = storedb.StoreDB(db_file)
+        names = [store(i) for i in PATHS]
+        with patch("sd.utils.storedb.BATCH_SIZE", 2):
+            assert len(db.path_info(names)) == 5
+            assert len(db.closure(names)) == 5
+        with patch.object(db, "_query") as mock_query:
+            assert len(db.path_info(names)) == 5
+            assert len(db.closure(names)) == 5
+            mock_query.assert_not_called()
+
+    def test_invalid_file(self, tmp_path):
+        from sd.utils.storedb import StoreDB, StoreDBError
+
+        p = tmp_path / "db.sqlite"
+        p.write_text("not a database")
+        with pytest.raises(StoreDBError):
+            StoreDB(str(p))
+
+
+class TestQuery:
+    def test_uses_db(self, db_file):
+        from sd.utils import storedb
+
+        with patch("sd.utils.storedb.cmd") as mock_cmd:
+            assert storedb.closure_size([store("system")]) == 200
+            assert storedb.query_references(store("home")) == [store("bash")]
+            mock_cmd.getout.assert_not_called()
+        registered = storedb.registration_time(store("home"))
+        assert registered is not None and registered.timestamp() == 1700000100
+
+    @patch("sd.utils.storedb.cmd")
+    def test_fallback_to_cli(self, mock_cmd):
+        from sd.utils import storedb
+
+        mock_cmd.getout.return_value = json.dumps(
+            {
+                store("a"): {
+                    "narSize": 5,
+                    "narHash": "sha256:a",
+                    "references": [store("b")],
+                },
+                store("b"): {"narSize": 3},
+                store("c"): None,
+            }
+        )
+        assert storedb.query_closure([store("a")]) == {store("a"): 5, store("b"): 3}
+        assert "--recursive" in mock_cmd.getout.call_args[0][0]
+        assert storedb.query_references(store("a")) == [store("b")]
+        assert storedb.registration_time(store("a")) is None
+
+    @patch("sd.utils.storedb.cmd")
+    def test_fallback_list_format(self, mock_cmd):
+        from sd.utils import storedb
+
+        mock_cmd.getout.return_value = json.dumps(
+            [
+                {"path": store("a"), "narSize": 5, "registrationTime": 10},
+                {"path": store("c"), "valid": False},
+            ]
+        )
+        infos = storedb.query_path_info([store("a"), store("c")])
+        assert list(infos) == [store("a")]
+        assert infos[store("a")].registration_time == 10
+
+
+class TestValidity:
+    def test_reads_paths_only_in_wal(self, db_file):
+        from sd.utils.storedb import StoreDB
+
+        writer = sqlite3.connect(db_file)
+        writer.execute("pragma journal_mode=wal")
+        writer.execute("pragma wal_autocheckpoint=0")
+        writer.execute(
+            "insert into ValidPaths (path, hash, registrationTime, narSize)"
+            " values (?, 'sha256:new', 1, 9)",
+            (store("new"),),
+        )
+        writer.commit()
+        try:
+            assert StoreDB(db_file).closure([store("new")]) == {store("new"): 9}
+        finally:
+            writer.close()
+
+    @patch("sd.utils.storedb.cmd")
+    def test_unregistered_root_falls_back(self, mock_cmd, db_file):
+        from sd.utils import storedb
+
+        mock_cmd.getout.return_value = json.dumps({store("new"): {"narSize": 9}})
+        assert storedb.query_closure([store("new")]) == {store("new"): 9}
+        mock_cmd.getout.return_value = json.dumps({store("gone"): None})
+        with pytest.raises(ValueError):
+            storedb.query_closure([store("gone")])
+
+    @patch("sd.utils.storedb.cmd")
+    def test_empty_closure_not_cached(self, mock_cmd):
+        from sd.utils import closure
+
+        mock_cmd.getout.return_value = json.dumps({store("gone"): None})
+        with pytest.raises(ValueError):
+            closure.cached_closure(store("gone"))
+        mock_cmd.getout.return_value = json.dumps({store("gone"): {"narSize": 1}})
+        assert closure.cached_closure(store("gone")) == {store("gone"): 1}
@@ -0,0 +1,85 @@
+import json
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+
+@pytest.fixture
+def tracing():
+    from sd.utils import trace
+
+    trace.enable()
+    yield trace
+    trace.disable()
+
+
+class TestTrace:
+    def test_disabled_by_default_records_nothing(self):
+        from sd.utils import trace
+
+        with trace.span("phase"):
+            trace.record_process("true", trace.now(), 0)
+        assert trace.records == []
+
+    @patch("subprocess.run")
+    def test_run_records_process(self, mock_run, tracing):
+        from sd.utils.cmd import run
+
+        mock_run.return_value = subprocess.CompletedProcess(
+            args=["echo", "hi"], returncode=0, stdout=b"hi\n", stderr=b""
+        )
+        run(["echo", "hi"], capture_output=True)
+        record = tracing.records[0]
+        assert record.kind == "process"
+        assert record.name == "echo hi"
+        assert record.returncode == 0
+        assert record.stdout_bytes == 3
+        assert record.stderr_bytes == 0
+
+    @patch("subprocess.getstatusoutput")
+    def test_getout_string_records_process(self, mock_status, tracing):
+        from sd.utils.cmd import getout
+
+        mock_status.return_value = (0, "out")
+        getout("echo out")
+        assert tracing.records[0].name == "echo out"
+        assert tracing.records[0].stdout_bytes == 3
+
+    def test_span_nesting_and_summary_order(self, tracing):
+        with tracing.span("outer"):
+            with tracing.span("inner"):
+                pass
+        assert [i.depth for i in tracing.records] == [0, 1]
+        lines = tracing.summary()
+        assert "outer" in lines[0]
+
+    def test_chrome_trace_file(self, tmp_path, tracing):
+        trace_file = tmp_path / "trace.json"
+        tracing.enable(str(trace_file))
+        with tracing.span("phase"):
+            pass
+        tracing.report()
+        events = json.loads(trace_file.read_text())["traceEvents"]
+        assert events[0]["name"] == "phase"
+        assert events[0]["ph"] == "X"
+
+    def test_counters_reported(self, tmp_path, tracing, capsys):
+        trace_file = tmp_path / "trace.json"
+        tracing.enable(str(trace_file))
+        tracing.count("memo hit")
+        tracing.count("memo hit")
+        tracing.report()
+        assert "memo hit=2" in capsys.readouterr().err
+        events = json.loads(trace_file.read_text())["traceEvents"]
+        assert events[0]["ph"] == "C"
+        assert events[0]["args"] == {"count": 2}
+
+    def test_from_argv_stops_at_subcommand(self):
+        from sd.utils import trace
+
+        trace.from_argv(["build", "--trace"])
+        assert trace.is_enabled() is False
+        trace.from_argv(["--trace-file=/tmp/x.json", "build"])
+        assert trace.is_enabled() is True
+        trace.disable()